@@ -0,0 +1,176 @@
+"""
+Benchmark del logging sobre el event loop: cuánto lo frena escribir logs.
+
+Simula mensajes concurrentes que loguean lo mismo que el camino real (líneas
+de PASO, el texto, la respuesta y la transcripción) contra un destino lento
+(cada write tarda --sink-latency-ms, como un pipe lleno o el driver de logs de
+Docker). Una tarea aparte duerme 1 ms en loop y mide cuánto tarda de más en
+despertarse: ese retraso es el tiempo que el loop estuvo bloqueado.
+
+Compara el handler síncrono anterior (StreamHandler + f-strings) con el actual
+(QueueHandler/QueueListener + formato lazy + muestreo), y mide aparte el costo
+de una línea con el nivel deshabilitado.
+
+Uso:
+    python -m benchmarks.bench_logging [--messages 2000] [--concurrency 50] [--sink-latency-ms 0.2]
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from typing import List
+from src.utils.logger import SAMPLED, TEXT_FORMAT, DATE_FORMAT, create_handler
+from src.utils.stats import percentile
+
+TICK = 0.001
+
+
+class SlowSink:
+    """Stream de texto en el que cada write bloquea un tiempo fijo."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.writes = 0
+
+    def write(self, data: str):
+        self.writes += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def flush(self):
+        pass
+
+
+def make_payloads(count: int, seed: int = 11) -> List[str]:
+    rng = random.Random(seed)
+    words = ["hola", "necesito", "el", "informe", "de", "ventas", "del", "trimestre", "por", "región"]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(5, 600))) for _ in range(count)]
+
+
+async def message_f_strings(logger: logging.Logger, text: str, answer: str):
+    """Las líneas de un mensaje como se logueaban antes (f-strings, sin muestreo)."""
+    logger.info("PASO 1 - get_updates")
+    logger.info("PASO 2 - process_update")
+    logger.info(f"Procesando mensaje de texto de Usuario {len(text)}")
+    logger.info(f"Texto: {text}")
+    await asyncio.sleep(0)
+    logger.info(f"Enviando query al sistema: {text}...")
+    await asyncio.sleep(0)
+    logger.info(f"Query procesada exitosamente. Answer: {answer}")
+    logger.info("PASO 4 - Enviar mensaje al chat")
+    logger.debug(f"Estado de la cola: {{'queued': {len(answer)}, 'workers': 4}}")
+
+
+async def message_lazy(logger: logging.Logger, text: str, answer: str):
+    """Las mismas líneas con formato lazy y la de polling muestreada."""
+    logger.info("PASO 1 - get_updates", extra=SAMPLED)
+    logger.info("PASO 2 - process_update")
+    logger.info("Procesando mensaje de texto de Usuario %d", len(text))
+    logger.info("Texto: %s", text)
+    await asyncio.sleep(0)
+    logger.info("Enviando query al sistema: %s", text)
+    await asyncio.sleep(0)
+    logger.info("Query procesada exitosamente. Answer: %s", answer)
+    logger.info("PASO 4 - Enviar mensaje al chat")
+    logger.debug("Estado de la cola: %s", {"queued": len(answer), "workers": 4})
+
+
+async def run(logger: logging.Logger, handle_message, payloads: List[str], messages: int, concurrency: int):
+    lags: List[float] = []
+    done = asyncio.Event()
+
+    async def monitor():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(TICK)
+            lags.append(max(0.0, time.perf_counter() - started - TICK))
+
+    async def worker(index: int):
+        for i in range(index, messages, concurrency):
+            await handle_message(logger, payloads[i % len(payloads)], payloads[(i * 7) % len(payloads)])
+            await asyncio.sleep(0.001)
+
+    monitor_task = asyncio.create_task(monitor())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await monitor_task
+    return elapsed, lags
+
+
+def measure(label: str, use_queue: bool, handle_message, args, payloads: List[str]):
+    sink = SlowSink(args.sink_latency_ms / 1000)
+    handler, listener = create_handler(
+        sink, use_queue=use_queue, log_format=args.format,
+        max_length=args.max_length if use_queue else 0,
+        sample_every=args.sample_every,
+    )
+    if not use_queue:
+        # Handler anterior: formato de texto sin truncar
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT))
+    logger = logging.getLogger(f"bench.{label}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+
+    elapsed, lags = asyncio.run(run(logger, handle_message, payloads, args.messages, args.concurrency))
+    flush_started = time.perf_counter()
+    if listener is not None:
+        listener.stop()
+    flush = time.perf_counter() - flush_started
+    logger.removeHandler(handler)
+
+    stalled = sum(lag for lag in lags if lag > TICK)
+    print(
+        f"  {label:<34} {elapsed:6.2f}s | retraso del loop p50 {percentile(lags, 50) * 1000:6.2f} ms, "
+        f"p99 {percentile(lags, 99) * 1000:7.2f} ms, max {max(lags, default=0) * 1000:7.2f} ms | "
+        f"bloqueado {stalled:5.2f}s | writes {sink.writes}"
+        + (f" | vaciado de la cola {flush:.2f}s" if listener is not None else "")
+    )
+
+
+def measure_disabled(payloads: List[str], iterations: int = 200_000):
+    """Costo por llamada de una línea DEBUG con el logger en INFO."""
+    logger = logging.getLogger("bench.disabled")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    text = payloads[0]
+    stats = {"queued": 3, "workers": 4, "texto": text}
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        logger.debug(f"Estado de la cola: {stats}")
+    eager = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        logger.debug("Estado de la cola: %s", stats)
+    lazy = time.perf_counter() - started
+    print(f"  nivel deshabilitado: f-string {eager / iterations * 1e9:6.0f} ns/línea | lazy {lazy / iterations * 1e9:6.0f} ns/línea")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000, help="Mensajes simulados")
+    parser.add_argument("--concurrency", type=int, default=50, help="Mensajes en proceso a la vez")
+    parser.add_argument("--sink-latency-ms", type=float, default=0.2, help="Bloqueo de cada write en el destino")
+    parser.add_argument("--format", choices=["text", "json"], default="json", help="Formato del handler con cola")
+    parser.add_argument("--max-length", type=int, default=2000, help="Truncado de mensajes del handler con cola")
+    parser.add_argument("--sample-every", type=int, default=100, help="Muestreo de líneas repetitivas del handler con cola")
+    args = parser.parse_args()
+
+    payloads = make_payloads(500)
+    print(
+        f"{args.messages} mensajes, {args.concurrency} concurrentes, "
+        f"destino con {args.sink_latency_ms} ms por write"
+    )
+    measure("síncrono + f-strings (anterior)", False, message_f_strings, args, payloads)
+    measure("síncrono + lazy + muestreo", False, message_lazy, args, payloads)
+    measure("cola + lazy + muestreo (actual)", True, message_lazy, args, payloads)
+    measure_disabled(payloads)
+
+
+if __name__ == "__main__":
+    main()
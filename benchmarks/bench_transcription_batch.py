@@ -0,0 +1,107 @@
+"""
+Benchmark del micro-batching de transcripciones contra un servidor stub local.
+
+El stub simula un modelo con `--slots` requests en paralelo, un costo fijo por
+request (`--overhead`, warm-up/colas del modelo) y un costo por audio
+(`--per-audio`). Se transcriben `--audios` audios concurrentes con y sin batch.
+
+Uso:
+    python -m benchmarks.bench_transcription_batch [--audios 200] [--overhead 0.05] [--per-audio 0.01]
+"""
+import argparse
+import asyncio
+import os
+import time
+from aiohttp import web
+from src.config.settings import settings
+from src.utils.audio_stream import AudioStream
+from src.utils.http_client import HttpClient
+
+PORT = 18765
+
+
+def make_stub(slots: int, overhead: float, per_audio: float, batch_supported: bool) -> web.Application:
+    model = asyncio.Semaphore(slots)
+
+    async def read_audios(request: web.Request) -> list:
+        reader = await request.multipart()
+        sizes = []
+        async for part in reader:
+            sizes.append(len(await part.read()))
+        return sizes
+
+    async def transcribe(request: web.Request) -> web.Response:
+        sizes = await read_audios(request)
+        async with model:
+            await asyncio.sleep(overhead + per_audio)
+        return web.json_response({"transcription": f"audio de {sizes[0]} bytes"})
+
+    async def transcribe_batch(request: web.Request) -> web.Response:
+        sizes = await read_audios(request)
+        if not batch_supported:
+            return web.Response(status=404)
+        async with model:
+            await asyncio.sleep(overhead + per_audio * len(sizes))
+        return web.json_response({"results": [{"transcription": f"audio de {size} bytes"} for size in sizes]})
+
+    app = web.Application(client_max_size=100 * 1024 * 1024)
+    app.router.add_post("/transcribe", transcribe)
+    app.router.add_post("/transcribe/batch", transcribe_batch)
+    return app
+
+
+async def transcribe_all(audios: int, audio_size: int, batch: bool) -> float:
+    # Los servicios leen la configuración al construirse
+    from src.services.transcription_service import TranscriptionService
+    settings.TRANSCRIPTION_BATCH_ENABLED = batch
+    client = HttpClient()
+    service = TranscriptionService(client)
+    payload = os.urandom(audio_size)
+
+    async def one(i: int) -> str:
+        async def chunks():
+            yield payload
+        return await service.transcribe_audio(AudioStream(f"{i}.ogg", chunks=chunks(), size=audio_size))
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(audios)))
+    elapsed = time.perf_counter() - started
+    assert all(r == f"audio de {audio_size} bytes" for r in results)
+    print(f"  batch={'si' if batch else 'no'}: {elapsed:.2f}s, {audios / elapsed:.1f} audios/s, stats={service.stats()}")
+    await client.close()
+    return elapsed
+
+
+async def run(args):
+    settings.TRANSCRIPTION_API_URL = f"http://127.0.0.1:{PORT}/transcribe"
+    settings.TRANSCRIPTION_BATCH_URL = ""
+    settings.TRANSCRIPTION_MAX_CONCURRENCY = args.concurrency
+    # Todo el burst espera lugar: se mide throughput, no el shedding del limitador
+    settings.ADAPTIVE_QUEUE_TIMEOUT = 3600
+    settings.TRANSCRIPTION_TIMEOUT = 3600
+
+    for batch_supported in (True, False):
+        runner = web.AppRunner(make_stub(args.slots, args.overhead, args.per_audio, batch_supported))
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", PORT).start()
+        label = "soporta batch" if batch_supported else "sin endpoint batch (fallback)"
+        print(f"Stub {label}: {args.audios} audios de {args.size} bytes")
+        single = await transcribe_all(args.audios, args.size, batch=False)
+        batched = await transcribe_all(args.audios, args.size, batch=True)
+        print(f"  speedup: {single / batched:.2f}x")
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audios", type=int, default=200)
+    parser.add_argument("--size", type=int, default=32 * 1024, help="Bytes por audio")
+    parser.add_argument("--slots", type=int, default=2, help="Requests que el modelo atiende en paralelo")
+    parser.add_argument("--overhead", type=float, default=0.05, help="Segundos fijos por request")
+    parser.add_argument("--per-audio", type=float, default=0.01, help="Segundos por audio")
+    parser.add_argument("--concurrency", type=int, default=8, help="TRANSCRIPTION_MAX_CONCURRENCY")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Benchmark del parseo de updates de Telegram: costo por update y allocations.
+
+Compara el camino anterior (json estándar + modelos Pydantic validados, con el
+nombre completo armado en cada update) contra el actual (fast_json + dataclasses
+con __slots__). Decodifica respuestas de getUpdates de 100 updates y construye
+el mensaje de cada uno, como hace el ingest.
+
+El corpus es sintético (mezcla de textos, voces y audios) o uno grabado: un
+update JSON por línea, p. ej. exportado del journal de updates.
+
+Uso:
+    python -m benchmarks.bench_update_parsing [--updates 100000] [--corpus updates.jsonl]
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from typing import Callable, List, Optional
+from pydantic import BaseModel
+from src.schemas import TelegramAudioMessage, TelegramTextMessage
+from src.utils import fast_json
+
+BATCH_SIZE = 100  # Updates por respuesta de getUpdates
+
+
+# --- Camino anterior: modelos Pydantic validados ---
+
+class LegacyUser(BaseModel):
+    user_id: int
+    username: Optional[str] = None
+    user_first_name: str
+    user_last_name: Optional[str] = None
+    user_full_name: str
+    user_language_code: Optional[str] = None
+    is_bot: bool = False
+
+    @classmethod
+    def from_telegram_data(cls, from_data: dict) -> 'LegacyUser':
+        full_name = from_data.get("first_name", "")
+        if from_data.get("last_name"):
+            full_name += f" {from_data.get('last_name')}"
+        return cls(
+            user_id=from_data["id"],
+            username=from_data.get("username"),
+            user_first_name=from_data.get("first_name", "Unknown"),
+            user_last_name=from_data.get("last_name"),
+            user_full_name=full_name,
+            user_language_code=from_data.get("language_code"),
+            is_bot=from_data.get("is_bot", False)
+        )
+
+
+class LegacyChat(BaseModel):
+    chat_id: int
+    chat_type: str
+    chat_title: Optional[str] = None
+
+
+class LegacyMessage(BaseModel):
+    update_id: int
+    message_id: int
+    date: int
+    user: LegacyUser
+    chat: LegacyChat
+
+
+class LegacyTextMessage(LegacyMessage):
+    text: str
+
+
+class LegacyAudioMessage(LegacyMessage):
+    file_id: str
+    file_unique_id: Optional[str] = None
+    duration: Optional[int] = None
+
+
+def legacy_parse(update: dict):
+    message = update.get("message", {})
+    common = dict(
+        update_id=update["update_id"],
+        message_id=message["message_id"],
+        date=message.get("date"),
+        user=LegacyUser.from_telegram_data(message.get("from", {})),
+        chat=LegacyChat(
+            chat_id=message["chat"]["id"],
+            chat_type=message["chat"].get("type", "unknown"),
+            chat_title=message["chat"].get("title")
+        )
+    )
+    if "voice" in message or "audio" in message:
+        audio = message.get("voice") or message.get("audio")
+        return LegacyAudioMessage(
+            file_id=audio["file_id"], file_unique_id=audio.get("file_unique_id"), duration=audio.get("duration"), **common
+        )
+    return LegacyTextMessage(text=message["text"], **common)
+
+
+# --- Camino actual ---
+
+def fast_parse(update: dict):
+    message = update.get("message", {})
+    if "voice" in message or "audio" in message:
+        return TelegramAudioMessage.from_telegram_update(update)
+    return TelegramTextMessage.from_telegram_update(update)
+
+
+def make_corpus(count: int, seed: int = 7) -> List[dict]:
+    """Updates sintéticos con la forma real de la Bot API (campos que el bot ignora incluidos)."""
+    rng = random.Random(seed)
+    corpus = []
+    for update_id in range(1, count + 1):
+        user_id = rng.randint(10_000, 9_999_999)
+        chat_id = -rng.randint(1_000, 99_999) if rng.random() < 0.7 else user_id
+        message = {
+            "message_id": update_id,
+            "date": 1_700_000_000 + update_id,
+            "from": {
+                "id": user_id,
+                "is_bot": False,
+                "first_name": f"Usuario{user_id % 1000}",
+                "language_code": "es",
+            },
+            "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private"},
+        }
+        if rng.random() < 0.5:
+            message["from"]["last_name"] = "Pérez"
+        if rng.random() < 0.6:
+            message["from"]["username"] = f"user_{user_id}"
+        if chat_id < 0:
+            message["chat"]["title"] = f"Grupo {-chat_id}"
+
+        kind = rng.random()
+        if kind < 0.6:
+            message["text"] = " ".join(rng.choice(["hola", "¿cómo", "va?", "necesito", "el", "informe", "de", "ventas"]) for _ in range(rng.randint(2, 30)))
+        elif kind < 0.9:
+            message["voice"] = {
+                "file_id": f"AwACAgEAAxkBAAI{update_id:010d}",
+                "file_unique_id": f"AgAD{update_id:08d}",
+                "duration": rng.randint(1, 300),
+                "mime_type": "audio/ogg",
+                "file_size": rng.randint(5_000, 2_000_000),
+            }
+        else:
+            message["audio"] = {
+                "file_id": f"CQACAgEAAxkBAAI{update_id:010d}",
+                "file_unique_id": f"AgAE{update_id:08d}",
+                "duration": rng.randint(30, 1800),
+                "title": "nota",
+                "mime_type": "audio/mpeg",
+                "file_size": rng.randint(100_000, 20_000_000),
+            }
+        corpus.append({"update_id": update_id, "message": message})
+    return corpus
+
+
+def load_corpus(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    return [u for u in updates if "text" in u.get("message", {}) or "voice" in u.get("message", {}) or "audio" in u.get("message", {})]
+
+
+def measure(label: str, payloads: List[bytes], loads: Callable, parse: Callable, updates: int) -> float:
+    # Costo por update (sin tracemalloc, que agrega overhead)
+    started = time.perf_counter()
+    for payload in payloads:
+        for update in loads(payload)["result"]:
+            parse(update)
+    elapsed = time.perf_counter() - started
+
+    # Allocations de un batch: bloques y bytes pedidos mientras se parsea
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    messages = [parse(update) for update in loads(payloads[0])["result"]]
+    snapshot_after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = snapshot_after.compare_to(snapshot_before, "filename")
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    retained = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    per_batch = len(messages)
+
+    print(
+        f"  {label:<28} {elapsed / updates * 1e6:7.2f} us/update | "
+        f"{blocks / per_batch:6.1f} bloques y {retained / per_batch:6.0f} bytes retenidos por mensaje | "
+        f"pico {peak / 1024:.0f} KiB por batch de {per_batch}"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=100_000, help="Tamaño del corpus sintético")
+    parser.add_argument("--corpus", help="Archivo con un update JSON por línea (reemplaza al sintético)")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else make_corpus(args.updates)
+    payloads = [
+        json.dumps({"ok": True, "result": corpus[i:i + BATCH_SIZE]}).encode()
+        for i in range(0, len(corpus), BATCH_SIZE)
+    ]
+    print(f"Corpus: {len(corpus)} updates en {len(payloads)} respuestas de getUpdates (JSON: {fast_json.backend()})")
+
+    before = measure("json + Pydantic (anterior)", payloads, json.loads, legacy_parse, len(corpus))
+    measure("fast_json + Pydantic", payloads, fast_json.loads, legacy_parse, len(corpus))
+    measure("json + slots", payloads, json.loads, fast_parse, len(corpus))
+    after = measure("fast_json + slots (actual)", payloads, fast_json.loads, fast_parse, len(corpus))
+    print(f"  speedup: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark del repositorio de usuarios: costo de lookup de whitelist con 100k usuarios.
+
+Uso:
+    python -m benchmarks.bench_user_repository [--users 100000] [--lookups 200000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from src.repositories.user_repository import UserRepository
+
+
+def make_updates(start: int, count: int, chats: int = 500) -> list:
+    """Genera updates de texto sintéticos para `count` usuarios distintos."""
+    return [
+        {
+            "update_id": user_id,
+            "message": {
+                "message_id": user_id,
+                "from": {"id": user_id, "first_name": f"user{user_id}", "username": f"u{user_id}"},
+                "chat": {"id": -(user_id % chats) - 1, "type": "group", "title": "bench"},
+                "text": "hola",
+            },
+        }
+        for user_id in range(start, start + count)
+    ]
+
+
+async def run(users: int, lookups: int, batch_size: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = UserRepository(os.path.join(tmp, "users.db"))
+
+        started = time.perf_counter()
+        for start in range(1, users + 1, batch_size):
+            await repo.record_updates(make_updates(start, min(batch_size, users + 1 - start)))
+        elapsed = time.perf_counter() - started
+        print(f"Upsert de {users} usuarios en batches de {batch_size}: {elapsed:.2f}s "
+              f"({elapsed / users * 1e6:.1f} us/usuario)")
+
+        for user_id in random.sample(range(1, users + 1), users // 100):
+            repo.set_user_allowed(user_id)
+
+        ids = [random.randint(1, users) for _ in range(lookups)]
+
+        # Lookup directo por clave primaria (camino de disco, sin cache)
+        started = time.perf_counter()
+        for user_id in ids[:lookups // 10]:
+            repo._lookup_allowed("users", "user_id", user_id)
+        elapsed = time.perf_counter() - started
+        print(f"Lookup SQLite por PK: {elapsed / (lookups // 10) * 1e6:.2f} us/lookup")
+
+        # Chequeo de whitelist con la cache caliente (camino de cada mensaje)
+        for user_id in set(ids):
+            await repo.is_allowed(user_id, -1)
+        started = time.perf_counter()
+        for user_id in ids:
+            await repo.is_allowed(user_id, -1)
+        elapsed = time.perf_counter() - started
+        print(f"is_allowed con cache caliente: {elapsed / lookups * 1e6:.2f} us/lookup")
+
+        print(f"Stats: {repo.stats()}")
+        repo.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.lookups, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Servidores locales que reemplazan a las dependencias externas del bot en los
+benchmarks: la Bot API de Telegram (getUpdates, getFile, descarga de archivos,
+sendMessage y el resto de los métodos), la API de transcripción y la de queries.
+
+Cada servicio tiene una distribución de latencia, una tasa de errores y tamaños
+de payload configurables. El generador de carga encola updates con inject() y
+FakeServices registra cuándo llega la respuesta a cada mensaje (por chat y
+reply_to_message_id).
+"""
+import asyncio
+import math
+import os
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from aiohttp import web
+
+# Prefijos de las respuestas de error del bot (error_handler y límite de duración)
+ERROR_PREFIXES = ("❌", "🚧", "⏱️", "⚠️")
+
+
+class Distribution:
+    """
+    Distribución de valores a partir de un texto:
+
+        fixed:50            siempre 50
+        uniform:20:80       uniforme entre 20 y 80
+        lognormal:300:0.5   lognormal con mediana 300 y sigma 0.5 (cola larga)
+        exp:100             exponencial con media 100
+    """
+
+    def __init__(self, spec: str, rng: Optional[random.Random] = None):
+        self.spec = spec
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        self.rng = rng or random.Random()
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2, "exp": 1}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"Distribución inválida: {spec} (usar fixed:X, uniform:A:B, lognormal:MEDIANA:SIGMA o exp:MEDIA)")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(*self.params)
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return self.rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        return self.rng.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0.0
+
+    def __repr__(self) -> str:
+        return self.spec
+
+
+@dataclass
+class ServiceProfile:
+    """Comportamiento de un servicio falso: latencia (ms) y fracción de requests que fallan."""
+    latency: Distribution
+    error_rate: float = 0.0
+    slots: int = 0  # Requests atendidos en paralelo (0 = sin límite), p. ej. la capacidad del modelo
+
+    def __post_init__(self):
+        self._semaphore = asyncio.Semaphore(self.slots) if self.slots else None
+
+    async def serve(self, rng: random.Random) -> bool:
+        """Simula la latencia del servicio. Retorna False si este request debe fallar."""
+        if self._semaphore is not None:
+            async with self._semaphore:
+                await asyncio.sleep(self.latency.sample() / 1000)
+        else:
+            await asyncio.sleep(self.latency.sample() / 1000)
+        return rng.random() >= self.error_rate
+
+
+@dataclass
+class Reply:
+    """Un mensaje que el bot envió en respuesta a un update."""
+    at: float
+    error: bool
+
+
+@dataclass
+class Injected:
+    """Un update encolado por el generador de carga."""
+    at: float
+    kind: str  # "text" o "audio"
+    replies: List[Reply] = field(default_factory=list)
+
+
+class FakeServices:
+    """Telegram, transcripción y queries en un solo servidor aiohttp local."""
+
+    def __init__(
+        self,
+        token: str,
+        telegram: ServiceProfile,
+        transcription: ServiceProfile,
+        query: ServiceProfile,
+        audio_size: Distribution,
+        answer_length: Distribution,
+        seed: int = 1,
+    ):
+        self.token = token
+        self.telegram = telegram
+        self.transcription = transcription
+        self.query = query
+        self.audio_size = audio_size
+        self.answer_length = answer_length
+        self.rng = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.injected_errors: Counter = Counter()
+        self.messages: Dict[Tuple[int, int], Injected] = {}
+        self.unmatched_replies = 0
+        self._updates: List[dict] = []
+        self._next_update_id = 1
+        self._new_updates = asyncio.Condition()
+        self._files: Dict[str, int] = {}  # file_path -> tamaño
+        self._blob = os.urandom(1024 * 1024)
+        self._runner: Optional[web.AppRunner] = None
+        self.first_poll = asyncio.Event()
+
+    # --- Generador de carga ---
+
+    async def inject(self, chat_id: int, message_id: int, kind: str, text: str = "", duration: int = 5):
+        """Encola un update de texto o de audio para el próximo getUpdates."""
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "from": {"id": abs(chat_id), "is_bot": False, "first_name": f"Usuario{abs(chat_id)}"},
+            "chat": {"id": chat_id, "type": "group", "title": f"Grupo {abs(chat_id)}"},
+        }
+        if kind == "audio":
+            file_id = f"file-{chat_id}-{message_id}"
+            self._files[f"voice/{file_id}.ogg"] = max(1, int(self.audio_size.sample() * 1024))
+            message["voice"] = {"file_id": file_id, "file_unique_id": file_id, "duration": duration, "mime_type": "audio/ogg"}
+        else:
+            message["text"] = text
+
+        self.messages[(chat_id, message_id)] = Injected(time.perf_counter(), kind)
+        async with self._new_updates:
+            self._updates.append({"update_id": self._next_update_id, "message": message})
+            self._next_update_id += 1
+            self._new_updates.notify_all()
+
+    @property
+    def answered(self) -> int:
+        return sum(1 for m in self.messages.values() if m.replies)
+
+    # --- Telegram ---
+
+    async def _telegram_latency(self, method: str) -> bool:
+        self.calls[method] += 1
+        ok = await self.telegram.serve(self.rng)
+        if not ok:
+            self.injected_errors[method] += 1
+        return ok
+
+    @staticmethod
+    def _flood_wait() -> web.Response:
+        return web.json_response(
+            {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1", "parameters": {"retry_after": 1}},
+            status=429,
+        )
+
+    async def _get_updates(self, request: web.Request) -> web.Response:
+        self.calls["getUpdates"] += 1
+        self.first_poll.set()
+        offset = int(request.query.get("offset", 0))
+        limit = int(request.query.get("limit", 100))
+        timeout = float(request.query.get("timeout", 0))
+
+        # Los updates confirmados (update_id < offset) ya no se devuelven
+        if offset:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            async with self._new_updates:
+                try:
+                    await asyncio.wait_for(self._new_updates.wait_for(lambda: bool(self._updates)), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        return web.json_response({"ok": True, "result": self._updates[:limit]})
+
+    async def _get_file(self, request: web.Request) -> web.Response:
+        if not await self._telegram_latency("getFile"):
+            return self._flood_wait()
+        file_path = f"voice/{request.query['file_id']}.ogg"
+        return web.json_response({"ok": True, "result": {"file_id": request.query["file_id"], "file_path": file_path, "file_size": self._files.get(file_path, 0)}})
+
+    async def _download(self, request: web.Request) -> web.StreamResponse:
+        self.calls["download"] += 1
+        size = self._files.get(request.match_info["path"])
+        if size is None:
+            return web.Response(status=404)
+        response = web.StreamResponse(headers={"Content-Type": "audio/ogg", "Content-Length": str(size)})
+        await response.prepare(request)
+        remaining = size
+        while remaining:
+            chunk = self._blob[:min(remaining, len(self._blob))]
+            await response.write(chunk)
+            remaining -= len(chunk)
+        await response.write_eof()
+        return response
+
+    async def _send_message(self, request: web.Request) -> web.Response:
+        if not await self._telegram_latency("sendMessage"):
+            return self._flood_wait()
+        data = await request.json()
+        self._record_reply(data)
+        return web.json_response({"ok": True, "result": {"message_id": self.rng.randint(1, 2 ** 31), "date": int(time.time())}})
+
+    async def _other_method(self, request: web.Request) -> web.Response:
+        # editMessageText, deleteMessage, deleteWebhook, setWebhook...
+        method = request.match_info["method"]
+        if not await self._telegram_latency(method):
+            return self._flood_wait()
+        return web.json_response({"ok": True, "result": True})
+
+    def _record_reply(self, data: dict):
+        reply_to = data.get("reply_to_message_id")
+        injected = self.messages.get((int(data.get("chat_id", 0)), reply_to)) if reply_to else None
+        if injected is None:
+            self.unmatched_replies += 1
+            return
+        injected.replies.append(Reply(time.perf_counter(), str(data.get("text", "")).startswith(ERROR_PREFIXES)))
+
+    # --- Transcripción y queries ---
+
+    async def _transcribe(self, request: web.Request) -> web.Response:
+        self.calls["transcribe"] += 1
+        sizes = [len(await part.read()) async for part in await request.multipart()]
+        if not await self.transcription.serve(self.rng):
+            self.injected_errors["transcribe"] += 1
+            return web.json_response({"error": "fallo simulado"}, status=500)
+        if request.path.endswith("/batch"):
+            return web.json_response({"results": [{"transcription": f"audio de {size} bytes"} for size in sizes]})
+        return web.json_response({"transcription": f"audio de {sizes[0] if sizes else 0} bytes"})
+
+    async def _query(self, request: web.Request) -> web.Response:
+        self.calls["query"] += 1
+        await request.read()
+        if not await self.query.serve(self.rng):
+            self.injected_errors["query"] += 1
+            return web.json_response({"success": False, "error": "fallo simulado"}, status=500)
+        answer = ("respuesta " * 400)[:max(1, int(self.answer_length.sample()))]
+        return web.json_response({"success": True, "answer": answer})
+
+    # --- Servidor ---
+
+    async def start(self, host: str, port: int):
+        app = web.Application(client_max_size=200 * 1024 * 1024)
+        bot = f"/bot{self.token}"
+        app.router.add_get(f"{bot}/getUpdates", self._get_updates)
+        app.router.add_get(f"{bot}/getFile", self._get_file)
+        app.router.add_post(f"{bot}/sendMessage", self._send_message)
+        app.router.add_route("*", f"{bot}/{{method}}", self._other_method)
+        app.router.add_get(f"/file{bot}/{{path:.+}}", self._download)
+        app.router.add_post("/transcribe", self._transcribe)
+        app.router.add_post("/transcribe/batch", self._transcribe)
+        app.router.add_post("/query", self._query)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
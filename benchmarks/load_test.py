@@ -0,0 +1,352 @@
+"""
+Prueba de carga del bot completo contra servicios falsos locales.
+
+Levanta en este proceso los reemplazos de Telegram, transcripción y queries
+(benchmarks/fake_services.py) y corre el bot real (`main.py`) en un subproceso
+apuntado a ellos. Durante --duration segundos encola mensajes a --rate
+mensajes/s (llegadas de Poisson, repartidas entre --chats chats, con
+--audio-ratio de audios) y después espera las respuestas pendientes.
+
+Reporta throughput, latencia de punta a punta (desde que el update está
+disponible en getUpdates hasta que llega el sendMessage que le responde)
+p50/p95/p99, CPU y memoria del bot (incluye los workers del modo sharded), y
+escribe todo en un JSON. Con --baseline compara contra un resultado anterior y
+sale con código 1 si alguna métrica empeoró más que --tolerance.
+
+Uso:
+    python -m benchmarks.load_test [--rate 10] [--duration 30] [--audio-ratio 0.3] [--output load_test.json]
+    python -m benchmarks.load_test --transcription-latency lognormal:800:0.6 --query-error-rate 0.05
+    python -m benchmarks.load_test --baseline load_test_main.json --env SHARD_PROCESSES=2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+from benchmarks.fake_services import Distribution, FakeServices, ServiceProfile
+from src.utils.stats import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+TOKEN = "loadtest"
+RSS_SAMPLE_INTERVAL = 0.5
+
+# Métricas comparadas con --baseline: nombre -> True si más alto es mejor
+REGRESSION_METRICS = {
+    "throughput_per_s": True,
+    "latency_ms.all.p50": False,
+    "latency_ms.all.p95": False,
+    "latency_ms.all.p99": False,
+    "cpu_seconds_per_message": False,
+    "peak_rss_mb": False,
+}
+
+
+def bot_env(args, port: int, workdir: str) -> Dict[str, str]:
+    """Entorno del bot: todas las URLs apuntan a los servicios falsos y el estado va a un directorio temporal."""
+    base = f"http://127.0.0.1:{port}"
+    env = dict(os.environ)
+    env.update(
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        TELEGRAM_CHAT_ID="-1",
+        TELEGRAM_API_BASE_URL=base,
+        TRANSCRIPTION_API_URL=f"{base}/transcribe",
+        TRANSCRIPTION_BATCH_URL=f"{base}/transcribe/batch",
+        QUERY_SYSTEM_URL=f"{base}/query",
+        INGEST_MODE="polling",
+        POLLING_MODE="long",
+        LONG_POLLING_TIMEOUT="5",
+        UPDATE_STORE_DB=os.path.join(workdir, "updates.db"),
+        USER_REPOSITORY_DB=os.path.join(workdir, "users.db"),
+        TRANSCRIPTION_CACHE_DB="",
+        USER_WHITELIST_ENABLED="false",
+        # La latencia se mide hasta la respuesta completa, no hasta el placeholder
+        PROGRESSIVE_REPLIES_ENABLED="false",
+        METRICS_ENABLED="false",
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=str(ROOT),
+    )
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    """RSS (bytes) de un proceso y sus hijos, leído de /proc. None si no hay /proc (no Linux)."""
+    total = 0
+    pending = [pid]
+    try:
+        while pending:
+            current = pending.pop()
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+    except FileNotFoundError:
+        return total or None
+    return total
+
+
+async def sample_rss(pid: int, samples: List[int], stop: asyncio.Event):
+    while not stop.is_set():
+        rss = process_tree_rss(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), RSS_SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def generate_load(services: FakeServices, args, rng: random.Random) -> int:
+    """Encola mensajes con llegadas de Poisson a args.rate por segundo. Retorna cuántos encoló."""
+    words = ["hola", "necesito", "el", "informe", "de", "ventas", "del", "trimestre", "por", "región"]
+    text_length = Distribution(args.text_words, rng)
+    message_ids: Dict[int, int] = {}
+    sent = 0
+    started = time.perf_counter()
+    next_at = started
+    while next_at - started < args.duration:
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        chat_id = -rng.randint(1, args.chats)
+        message_ids[chat_id] = message_ids.get(chat_id, 0) + 1
+        if rng.random() < args.audio_ratio:
+            await services.inject(chat_id, message_ids[chat_id], "audio", duration=args.audio_duration)
+        else:
+            text = " ".join(rng.choice(words) for _ in range(max(1, int(text_length.sample()))))
+            await services.inject(chat_id, message_ids[chat_id], "text", text=text)
+        sent += 1
+        next_at += rng.expovariate(args.rate)
+    return sent
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50) * 1000, 1),
+        "p95": round(percentile(values, 95) * 1000, 1),
+        "p99": round(percentile(values, 99) * 1000, 1),
+        "max": round(max(values) * 1000, 1),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    services = FakeServices(
+        TOKEN,
+        telegram=ServiceProfile(Distribution(args.telegram_latency, rng), args.telegram_error_rate),
+        transcription=ServiceProfile(Distribution(args.transcription_latency, rng), args.transcription_error_rate, args.transcription_slots),
+        query=ServiceProfile(Distribution(args.query_latency, rng), args.query_error_rate),
+        audio_size=Distribution(args.audio_kb, rng),
+        answer_length=Distribution(args.answer_chars, rng),
+        seed=args.seed,
+    )
+    await services.start("127.0.0.1", args.port)
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    bot_log = open(args.bot_log or os.path.join(workdir, "bot.log"), "w")
+    cpu_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    own_cpu_before = time.process_time()
+    # cwd temporal: temp_audio/ y data/ no quedan en el repo
+    bot = await asyncio.create_subprocess_exec(
+        sys.executable, str(ROOT / "main.py"), *(["--shards", str(args.shards)] if args.shards else []),
+        cwd=workdir, env=bot_env(args, args.port, workdir), stdout=bot_log, stderr=subprocess.STDOUT,
+    )
+    rss_samples: List[int] = []
+    stop_sampling = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(bot.pid, rss_samples, stop_sampling))
+
+    try:
+        await asyncio.wait_for(services.first_poll.wait(), args.startup_timeout)
+    except asyncio.TimeoutError:
+        bot.kill()
+        raise SystemExit(f"El bot no hizo getUpdates en {args.startup_timeout}s (log: {bot_log.name})")
+
+    print(f"Bot iniciado (pid {bot.pid}). Carga: {args.rate} msg/s durante {args.duration}s, {args.chats} chats, {args.audio_ratio:.0%} audios")
+    load_started = time.perf_counter()
+    injected = await generate_load(services, args, rng)
+    load_elapsed = time.perf_counter() - load_started
+
+    drain_deadline = time.perf_counter() + args.drain_timeout
+    while services.answered < injected and time.perf_counter() < drain_deadline:
+        await asyncio.sleep(0.1)
+
+    bot.send_signal(signal.SIGINT)
+    try:
+        await asyncio.wait_for(bot.wait(), 60)
+    except asyncio.TimeoutError:
+        bot.kill()
+        await bot.wait()
+    stop_sampling.set()
+    await sampler
+    bot_log.close()
+    cpu_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    own_cpu = time.process_time() - own_cpu_before
+    await services.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    # Latencia hasta la primera respuesta de cada mensaje
+    # "ok": solo las respuestas sin error (lo que el bot atendió, sin rechazos ni fallas)
+    latencies: Dict[str, List[float]] = {"all": [], "text": [], "audio": [], "ok": []}
+    error_replies = 0
+    last_reply = load_started
+    for message in services.messages.values():
+        if not message.replies:
+            continue
+        first = message.replies[0]
+        error_replies += first.error
+        latencies["all"].append(first.at - message.at)
+        latencies[message.kind].append(first.at - message.at)
+        if not first.error:
+            latencies["ok"].append(first.at - message.at)
+        last_reply = max(last_reply, first.at)
+
+    answered = services.answered
+    bot_cpu = (cpu_after.ru_utime - cpu_before.ru_utime) + (cpu_after.ru_stime - cpu_before.ru_stime)
+    wall = max(last_reply - load_started, load_elapsed)
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "bot_log")},
+        "injected": injected,
+        "answered": answered,
+        "unanswered": injected - answered,
+        "error_replies": error_replies,
+        "duplicate_replies": sum(max(0, len(m.replies) - 1) for m in services.messages.values()),
+        "unmatched_replies": services.unmatched_replies,
+        "offered_rate_per_s": round(injected / load_elapsed, 2),
+        "throughput_per_s": round(answered / wall, 2) if wall else 0.0,
+        "latency_ms": {kind: latency_summary(values) for kind, values in latencies.items()},
+        "cpu_seconds": round(bot_cpu, 3),
+        "cpu_percent": round(bot_cpu / wall * 100, 1) if wall else 0.0,
+        "cpu_seconds_per_message": round(bot_cpu / answered, 5) if answered else None,
+        "peak_rss_mb": round(max(rss_samples) / 2 ** 20, 1) if rss_samples else None,
+        "harness_cpu_seconds": round(own_cpu, 3),
+        "calls": dict(services.calls),
+        "injected_errors": dict(services.injected_errors),
+        "bot_exit_code": bot.returncode,
+    }
+
+
+def lookup(results: dict, path: str):
+    value = results
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Métricas que empeoraron más que `tolerance` (fracción) respecto del baseline."""
+    regressions = []
+    for path, higher_is_better in REGRESSION_METRICS.items():
+        current, previous = lookup(results, path), lookup(baseline, path)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        worse = -change if higher_is_better else change
+        marker = "  << REGRESIÓN" if worse > tolerance else ""
+        print(f"  {path:<28} {previous:>10} -> {current:>10} ({change:+.1%}){marker}")
+        if marker:
+            regressions.append(path)
+    return regressions
+
+
+def print_results(results: dict):
+    print(
+        f"Mensajes: {results['injected']} encolados, {results['answered']} respondidos "
+        f"({results['error_replies']} con error, {results['unanswered']} sin respuesta, "
+        f"{results['duplicate_replies']} respuestas duplicadas)"
+    )
+    print(f"Throughput: {results['throughput_per_s']} msg/s (ofrecido {results['offered_rate_per_s']} msg/s)")
+    for kind, summary in results["latency_ms"].items():
+        if summary["count"]:
+            print(f"  latencia {kind:<5} p50 {summary['p50']:8.1f} ms | p95 {summary['p95']:8.1f} ms | p99 {summary['p99']:8.1f} ms | max {summary['max']:8.1f} ms")
+    print(
+        f"CPU del bot: {results['cpu_seconds']}s ({results['cpu_percent']}% de un núcleo, "
+        f"{results['cpu_seconds_per_message']} s/mensaje) | RSS pico: {results['peak_rss_mb']} MB | "
+        f"CPU del harness: {results['harness_cpu_seconds']}s"
+    )
+    print(f"Llamadas a los servicios falsos: {results['calls']} | errores inyectados: {results['injected_errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    load = parser.add_argument_group("carga")
+    load.add_argument("--rate", type=float, default=10, help="Mensajes por segundo (llegadas de Poisson)")
+    load.add_argument("--duration", type=float, default=30, help="Segundos de carga")
+    load.add_argument("--chats", type=int, default=50, help="Chats distintos entre los que se reparten los mensajes")
+    load.add_argument("--audio-ratio", type=float, default=0.3, help="Fracción de mensajes de audio")
+    load.add_argument("--audio-duration", type=int, default=5, help="Duración (s) declarada de cada audio")
+    load.add_argument("--text-words", default="uniform:3:40", help="Palabras por mensaje de texto")
+    load.add_argument("--seed", type=int, default=1)
+
+    fakes = parser.add_argument_group("servicios falsos (latencias en ms: fixed:X, uniform:A:B, lognormal:MEDIANA:SIGMA, exp:MEDIA)")
+    fakes.add_argument("--telegram-latency", default="lognormal:30:0.2")
+    fakes.add_argument("--telegram-error-rate", type=float, default=0.0, help="Fracción de envíos que responden 429")
+    fakes.add_argument("--transcription-latency", default="lognormal:600:0.2")
+    fakes.add_argument("--transcription-error-rate", type=float, default=0.0, help="Fracción de transcripciones que responden 500")
+    fakes.add_argument("--transcription-slots", type=int, default=0, help="Transcripciones en paralelo del modelo (0 = sin límite)")
+    fakes.add_argument("--query-latency", default="lognormal:250:0.2")
+    fakes.add_argument("--query-error-rate", type=float, default=0.0, help="Fracción de queries que responden 500")
+    fakes.add_argument("--audio-kb", default="lognormal:60:0.8", help="Tamaño de los audios en KiB")
+    fakes.add_argument("--answer-chars", default="uniform:50:800", help="Largo de las respuestas del sistema de queries")
+
+    bot = parser.add_argument_group("bot")
+    bot.add_argument("--shards", type=int, help="Procesos worker del modo sharded")
+    bot.add_argument("--env", action="append", default=[], metavar="CLAVE=VALOR", help="Variable de entorno extra para el bot (repetible)")
+    bot.add_argument("--port", type=int, default=18900, help="Puerto de los servicios falsos")
+    bot.add_argument("--startup-timeout", type=float, default=30)
+    bot.add_argument("--drain-timeout", type=float, default=60, help="Espera máxima por las respuestas pendientes al terminar la carga")
+    bot.add_argument("--bot-log", help="Archivo para la salida del bot (default: directorio temporal)")
+
+    out = parser.add_argument_group("resultados")
+    out.add_argument("--output", default="load_test.json", help="Archivo JSON de resultados")
+    out.add_argument("--baseline", help="Resultado anterior contra el que comparar")
+    out.add_argument("--tolerance", type=float, default=0.10, help="Empeoramiento tolerado antes de marcar una regresión")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Resultados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Comparación con {args.baseline} ({baseline.get('git_revision')}):")
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
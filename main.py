@@ -1,5 +1,7 @@
+import argparse
 import asyncio
 from src.bot import TelegramAudioBot
+from src.config.settings import settings
 from src.utils.logger import setup_logger
 
 
@@ -7,8 +9,25 @@ logger = setup_logger(__name__)
 
 def main():
     """Función principal"""
+    parser = argparse.ArgumentParser(description="Microservicio de Telegram Bot")
+    parser.add_argument(
+        "--ingest",
+        choices=["polling", "webhook"],
+        help="Modo de ingest de updates (default: INGEST_MODE del .env)"
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        help="Procesos worker del modo sharded (default: SHARD_PROCESSES del .env)"
+    )
+    args = parser.parse_args()
+    if args.ingest:
+        settings.INGEST_MODE = args.ingest
+    if args.shards:
+        settings.SHARD_PROCESSES = args.shards
+
     bot = TelegramAudioBot()
     asyncio.run(bot.start())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
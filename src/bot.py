@@ -1,32 +1,107 @@
+import asyncio
+import signal
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple, Union
 from src.config.settings import settings
 from src.services.telegram_service import TelegramService
-from src.services.transcription_service import TranscriptionService
+from src.services.transcription_service import TranscriptionService, stitch_transcripts
 from src.services.query_service import QueryService
-from src.schemas import TelegramTextMessage, TelegramAudioMessage
-from src.utils.logger import setup_logger
+from src.services.progressive_reply import ProgressiveReply
+from src.services.transcription_cache import TranscriptionCache
+from src.services.audio_preprocessor import AudioPreprocessor, segment_starts
+from src.services.user_service import UserService
+from src.services.webhook_server import WebhookServer
+from src.services.metrics_server import MetricsServer
+from src.repositories.user_repository import UserRepository
+from src.repositories.update_store import UpdateStore
+from src.schemas import TelegramBaseMessage, TelegramTextMessage, TelegramAudioMessage
+from src.utils.logger import setup_logger, shutdown_logging
 from src.utils.error_handler import handle_telegram_errors
+from src.utils.admission import AdmissionController
+from src.utils.debounce import SessionDebouncer
+from src.utils.dispatcher import ChatDispatcher
+from src.utils.shard_router import ShardRouter
+from src.utils.http_client import http_client
+from src.utils.audio_stream import AudioStream
+from src.utils.stats import LatencyWindow
+from src.utils.metrics import registry as metrics_registry
 
 logger = setup_logger(__name__)
 
+BUSY_REPLY = "🚧 Hay demasiados mensajes en este momento y este no se procesó, probá de nuevo en unos minutos"
+
 class TelegramAudioBot:
     """Application service que orquesta los servicios de Telegram, transcripción y queries."""
 
     def __init__(self):
-        self.telegram_service = TelegramService()
-        self.transcription_service = TranscriptionService()
-        self.query_service = QueryService()
+        # Todos los servicios comparten la misma sesión HTTP (y su pool de conexiones)
+        self.http_client = http_client
+        self.telegram_service = TelegramService(self.http_client)
+        self.transcription_service = TranscriptionService(self.http_client)
+        self.query_service = QueryService(self.http_client)
+        self.user_service = UserService(self.http_client)
+        self.user_repository = UserRepository()
+        self.update_store: Optional[UpdateStore] = UpdateStore() if settings.UPDATE_STORE_ENABLED else None
+        self.transcription_cache = TranscriptionCache()
+        self.audio_preprocessor = AudioPreprocessor()
+        self.dispatcher: Optional[Union[ChatDispatcher, ShardRouter]] = None
+        self.admission: Optional[AdmissionController] = None
+        # Mensajes seguidos de un chat que se responden con una sola query
+        self.debouncer: Optional[SessionDebouncer] = SessionDebouncer(
+            self._flush_session,
+            settings.DEBOUNCE_WINDOW,
+            settings.DEBOUNCE_MAX_WAIT,
+            settings.DEBOUNCE_MAX_MESSAGES
+        ) if settings.DEBOUNCE_ENABLED else None
+        # update_id -> (update, inicio) de los updates que esperan en un grupo del debouncer
+        self._debounced: Dict[int, Optional[Tuple[dict, float]]] = {}
+        self._shard_outbox = None  # (shard, cola) en un proceso worker del modo sharded
+        self.metrics_server: Optional[MetricsServer] = None
+        # Respuestas progresivas: tiempo hasta que el usuario ve algo y hasta la respuesta completa
+        self._reply_latency = {"first_visible": LatencyWindow(), "complete": LatencyWindow()}
+        # Los usuarios y chats vistos (datos personales) solo se guardan si hay whitelist
+        self._on_batch = self.user_repository.record_updates if settings.USER_WHITELIST_ENABLED else None
+        self._update_handler = self.telegram_service.make_update_handler(
+            self.process_audio_message,
+            self.process_text_message,
+            authorizer=self.is_authorized if settings.USER_WHITELIST_ENABLED else None
+        )
 
+    async def is_authorized(self, message: TelegramBaseMessage) -> bool:
+        """
+        Whitelist de usuarios. Con USER_WHITELIST_SOURCE=local el usuario o el chat
+        tienen que estar habilitados en el repositorio local; con "remote", el usuario
+        tiene que existir en el sistema de usuarios. En ambos casos la respuesta sale
+        de una cache en memoria, sin I/O una vez caliente.
+        """
+        if settings.USER_WHITELIST_SOURCE == "remote":
+            return await self.user_service.get_user_info_from_message(message.user.user_id) is not None
+        return await self.user_repository.is_allowed(message.user.user_id, message.chat.chat_id)
 
     @handle_telegram_errors()
     async def process_text_message(self, text_message: TelegramTextMessage):
         """Procesa un mensaje de texto y lo envía al sistema de queries."""
         user_display = text_message.user.get_display_name()
-        logger.info(f"Procesando mensaje de texto de {user_display}")
-        logger.info(f"Texto: {text_message.text}")
+        logger.info("Procesando mensaje de texto de %s", user_display)
+        logger.info("Texto: %s", text_message.text)
 
         # Usar el chat_id (ID del grupo) como session_id para mantener contexto por grupo
         session_id = f"telegram-group-{text_message.chat.chat_id}"
         logger.info("PASO 3 - process_text_message")
+        if self.debouncer:
+            # Se responde junto con los mensajes que lleguen seguidos (ver _answer_batch)
+            self._debounced[text_message.update_id] = None
+            self.debouncer.add(session_id, (text_message, None))
+            return
+
+        if settings.PROGRESSIVE_REPLIES_ENABLED:
+            reply = ProgressiveReply(self.telegram_service, text_message.chat.chat_id, text_message.message_id)
+            async with self._progressive(reply, "⏳ Procesando..."):
+                result = await self.query_service.send_query(text_message.text, session_id, on_partial=reply.update)
+                await reply.finish(result.get('answer', 'No se obtuvo respuesta'))
+            return
+
         # Paso 1: Enviar query con la session_id del chat
         result = await self.query_service.send_query(text_message.text, session_id)
         
@@ -36,7 +111,8 @@ class TelegramAudioBot:
         # Paso 3: Enviar la respuesta al chat
         await self.telegram_service.send_message(
             f"{answer}",
-            reply_to_message_id=text_message.message_id
+            reply_to_message_id=text_message.message_id,
+            chat_id=text_message.chat.chat_id
         )
 
 
@@ -44,13 +120,33 @@ class TelegramAudioBot:
     async def process_audio_message(self, audio_message: TelegramAudioMessage):
         """Descarga el audio, transcribe y envía la query al sistema."""
         user_display = audio_message.user.get_display_name()
-        logger.info(f"Procesando mensaje de audio de {user_display}")
+        logger.info("Procesando mensaje de audio de %s", user_display)
 
-        # Paso 1: Descargar el audio
-        audio_file_path = await self.telegram_service.download_audio(audio_message.file_id)
+        # Límite de duración: se decide con el dato de Telegram, antes de descargar nada
+        max_duration = settings.AUDIO_MAX_DURATION
+        truncates = settings.AUDIO_MAX_DURATION_POLICY == "truncate" and self.audio_preprocessor.enabled
+        if max_duration and (audio_message.duration or 0) > max_duration and not truncates:
+            logger.info("Audio rechazado por duración: %ss (máximo %ss)", audio_message.duration, max_duration)
+            await self.telegram_service.send_message(
+                f"⚠️ El audio dura {audio_message.duration}s y el máximo es {max_duration}s",
+                reply_to_message_id=audio_message.message_id,
+                chat_id=audio_message.chat.chat_id
+            )
+            return None, None
+
+        if self.debouncer:
+            # La transcripción se agrupa con los mensajes que lleguen seguidos (ver _answer_batch)
+            transcription, audio_file_path = await self._transcribe(audio_message)
+            self._debounced[audio_message.update_id] = None
+            self.debouncer.add(f"telegram-group-{audio_message.chat.chat_id}", (audio_message, transcription))
+            return None, audio_file_path
+
+        if settings.PROGRESSIVE_REPLIES_ENABLED:
+            return await self._process_audio_progressively(audio_message)
+
+        # Paso 1 y 2: Descargar el audio y transcribirlo (o reutilizar la transcripción cacheada)
         logger.info("PASO 3 - process_audio_message")
-        # Paso 2: Transcribir el audio
-        transcription = await self.transcription_service.transcribe_audio(audio_file_path)
+        transcription, audio_file_path = await self._transcribe(audio_message)
 
         # Paso 3: Enviar query al sistema
         session_id = f"telegram-group-{audio_message.chat.chat_id}"
@@ -60,12 +156,374 @@ class TelegramAudioBot:
 
         await self.telegram_service.send_message(
             f"🎤 Audio: {transcription}\n\n💬 Respuesta: {answer}",
-            reply_to_message_id=audio_message.message_id
+            reply_to_message_id=audio_message.message_id,
+            chat_id=audio_message.chat.chat_id
         )
 
-        # Retornar el path del audio para que el decorador haga cleanup
+        # Retornar el path del audio (solo existe si se descargó a disco) para que el decorador haga cleanup
         return None, audio_file_path
 
+    async def _process_audio_progressively(self, audio_message: TelegramAudioMessage):
+        """
+        Como process_audio_message, pero el usuario ve el avance en un solo mensaje:
+        primero "Transcribiendo...", después la transcripción y por último la respuesta.
+        """
+        reply = ProgressiveReply(self.telegram_service, audio_message.chat.chat_id, audio_message.message_id)
+        async with self._progressive(reply, "🎤 Transcribiendo..."):
+            transcription, audio_file_path = await self._transcribe(audio_message)
+            header = f"🎤 Audio: {transcription}\n\n💬 Respuesta: "
+            await reply.update(f"{header}⏳ Consultando...")
+
+            session_id = f"telegram-group-{audio_message.chat.chat_id}"
+
+            async def on_partial(partial: str):
+                await reply.update(f"{header}{partial}")
+
+            result = await self.query_service.send_query(transcription, session_id, on_partial=on_partial)
+            await reply.finish(f"{header}{result.get('answer', 'No se obtuvo respuesta')}")
+
+        return None, audio_file_path
+
+    async def _flush_session(self, session_id: str, batch: list):
+        """
+        Responde un grupo de mensajes seguidos de una sesión (lo llama el debouncer) y
+        recién entonces completa sus updates: hasta acá siguen pendientes en el
+        checkpoint, así un reinicio los vuelve a procesar.
+        """
+        try:
+            await self._answer_batch(batch[-1][0], session_id, batch)
+        finally:
+            for message, _ in batch:
+                entry = self._debounced.pop(message.update_id, None)
+                if entry is not None:
+                    update, started = entry
+                    self._complete_update(update, time.monotonic() - started)
+
+    @handle_telegram_errors()
+    async def _answer_batch(self, last_message: TelegramBaseMessage, session_id: str, batch: list):
+        """
+        Envía una sola query con los mensajes del grupo unidos en orden de llegada (de
+        los audios, su transcripción) y responde al último. batch: [(mensaje, transcripción o None)].
+        """
+        question = "\n".join(message.text if transcription is None else transcription for message, transcription in batch)
+        audios = "\n".join(f"🎤 Audio: {transcription}" for _, transcription in batch if transcription is not None)
+        header = f"{audios}\n\n💬 Respuesta: " if audios else ""
+        if len(batch) > 1:
+            logger.info("%d mensajes seguidos de %s se responden con una sola query", len(batch), session_id)
+
+        if settings.PROGRESSIVE_REPLIES_ENABLED:
+            reply = ProgressiveReply(self.telegram_service, last_message.chat.chat_id, last_message.message_id)
+            async with self._progressive(reply, f"{header}⏳ Consultando..." if header else "⏳ Procesando..."):
+                async def on_partial(partial: str):
+                    await reply.update(f"{header}{partial}")
+
+                result = await self.query_service.send_query(question, session_id, on_partial=on_partial)
+                await reply.finish(f"{header}{result.get('answer', 'No se obtuvo respuesta')}")
+            return
+
+        result = await self.query_service.send_query(question, session_id)
+        await self.telegram_service.send_message(
+            f"{header}{result.get('answer', 'No se obtuvo respuesta')}",
+            reply_to_message_id=last_message.message_id,
+            chat_id=last_message.chat.chat_id
+        )
+
+    @asynccontextmanager
+    async def _progressive(self, reply: ProgressiveReply, placeholder: str):
+        """
+        Envía el mensaje provisorio y registra las latencias al terminar. Ante un error
+        lo borra, así el usuario solo ve la respuesta de error del decorador.
+        """
+        await reply.start(placeholder)
+        try:
+            yield reply
+        except BaseException:
+            await reply.abort()
+            raise
+        if reply.first_visible is not None:
+            self._reply_latency["first_visible"].add(reply.first_visible)
+        if reply.complete is not None:
+            self._reply_latency["complete"].add(reply.complete)
+
+    async def _transcribe(self, audio_message: TelegramAudioMessage):
+        """
+        Obtiene la transcripción de un audio. Retorna (transcripción, path_temporal).
+
+        Si el file_unique_id ya fue transcripto no se descarga nada. Si no, el audio
+        se sube en streaming a la API a medida que llega de Telegram; cuando quedó
+        en disco se consulta antes la cache por hash de contenido.
+        """
+        file_unique_id = audio_message.file_unique_id
+        cached = await self.transcription_cache.get(file_unique_id=file_unique_id)
+        if cached is not None:
+            logger.info("Transcripción en cache para %s", file_unique_id)
+            return cached, None
+
+        long_audio = self.audio_preprocessor.can_segment and (audio_message.duration or 0) > settings.AUDIO_SEGMENT_THRESHOLD
+        if self.audio_preprocessor.enabled or long_audio:
+            return await self._transcribe_on_disk(audio_message), None
+
+        async with self.telegram_service.open_audio(audio_message.file_id) as audio:
+            # Para audios en disco el hash se calcula antes de subir (fallback de cache)
+            content_hash = await audio.content_hash()
+            transcription = await self.transcription_cache.get(content_hash=content_hash)
+
+            if transcription is None:
+                transcription = await self.transcription_service.transcribe_audio(audio)
+                content_hash = await audio.content_hash()
+
+        await self.transcription_cache.set(
+            transcription,
+            file_unique_id=file_unique_id,
+            content_hash=content_hash
+        )
+        return transcription, audio.path
+
+
+    async def _transcribe_on_disk(self, audio_message: TelegramAudioMessage) -> str:
+        """
+        Camino con ffmpeg: descarga a disco, consulta la cache por hash del audio
+        original, preprocesa (silencios, duración, mono) si está habilitado y sube el
+        resultado; los audios largos se transcriben por segmentos en paralelo.
+        """
+        audio_file_path = await self.telegram_service.download_audio(audio_message.file_id)
+        processed = None
+        try:
+            content_hash = await AudioStream.from_path(audio_file_path).content_hash()
+            transcription = await self.transcription_cache.get(content_hash=content_hash)
+
+            if transcription is None:
+                if self.audio_preprocessor.enabled:
+                    processed = await self.audio_preprocessor.process(audio_file_path)
+                upload_path = processed.path if processed else audio_file_path
+                duration = processed.duration_out if processed and processed.duration_out else audio_message.duration
+
+                if self.audio_preprocessor.can_segment and (duration or 0) > settings.AUDIO_SEGMENT_THRESHOLD:
+                    transcription = await self._transcribe_segments(upload_path, duration)
+                else:
+                    transcription = await self.transcription_service.transcribe_audio(upload_path)
+        finally:
+            self.telegram_service.cleanup_audio_file(audio_file_path)
+            if processed:
+                self.telegram_service.cleanup_audio_file(processed.path)
+
+        await self.transcription_cache.set(
+            transcription,
+            file_unique_id=audio_message.file_unique_id,
+            content_hash=content_hash
+        )
+        return transcription
+
+    async def _transcribe_segments(self, path: str, duration: float) -> str:
+        """
+        Corta un audio largo en segmentos solapados, los transcribe en paralelo
+        (hasta TRANSCRIPTION_SEGMENT_PARALLELISM a la vez) y une los textos en orden.
+        """
+        length = settings.AUDIO_SEGMENT_SECONDS
+        starts = segment_starts(duration, length, settings.AUDIO_SEGMENT_OVERLAP)
+        logger.info("Audio largo (%.0fs): se transcribe en %d segmentos", duration, len(starts))
+        semaphore = asyncio.Semaphore(settings.TRANSCRIPTION_SEGMENT_PARALLELISM)
+
+        async def transcribe_segment(index: int, start: float) -> str:
+            async with semaphore:
+                segment_path = await self.audio_preprocessor.cut(path, start, length, index)
+                try:
+                    return await self.transcription_service.transcribe_audio(segment_path)
+                finally:
+                    self.telegram_service.cleanup_audio_file(segment_path)
+
+        tasks = [asyncio.ensure_future(transcribe_segment(i, start)) for i, start in enumerate(starts)]
+        try:
+            parts = await asyncio.gather(*tasks)
+        except BaseException:
+            # Si un segmento falla no tiene sentido seguir con el resto
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return stitch_transcripts(parts)
+
+    async def _handle_update(self, update: dict):
+        """
+        Procesa un update del dispatcher y lo marca como procesado en el checkpoint.
+        Con control de admisión, los updates que esperaron demasiado se descartan acá.
+        Un update que quedó en un grupo del debouncer se completa recién cuando se
+        responde el grupo (_flush_session).
+        """
+        update_id = update["update_id"]
+        started = time.monotonic()
+        seconds = None
+        done = False
+        try:
+            reason = self.admission.check_deadline(update) if self.admission else None
+            if reason:
+                self.admission.count_deadline_shed(update, reason)
+                self._reply_busy(update)
+            else:
+                await self._update_handler(update)
+                seconds = time.monotonic() - started
+            done = True
+        finally:
+            if update_id in self._debounced:
+                self._debounced[update_id] = (update, started)
+            elif done:
+                self._complete_update(update, seconds)
+            elif self.admission:
+                # Se canceló (apagado, timeout): queda pendiente en el checkpoint pero libera su lugar en el tope
+                self.admission.release(update_id)
+
+    def _complete_update(self, update: dict, seconds: Optional[float]):
+        """
+        Libera el lugar del update en el control de admisión (registrando cuánto tardó,
+        si se procesó) y lo marca como procesado en el checkpoint.
+        """
+        if self.admission:
+            if seconds is not None:
+                self.admission.record_processed(update, seconds)
+            self.admission.release(update["update_id"])
+        if self.update_store:
+            self.update_store.mark_processed(update["update_id"])
+        if self._shard_outbox:
+            # Modo sharded: el checkpoint vive en el proceso de ingest, se le confirma el update
+            shard, outbox = self._shard_outbox
+            outbox.put((shard, update["update_id"]))
+
+    def _create_dispatcher(self):
+        """
+        Dispatcher local (pools de workers por lane) o, con SHARD_PROCESSES > 1 en el
+        proceso de ingest, el router que reparte los updates entre procesos worker.
+        """
+        if settings.SHARD_PROCESSES > 1 and self._shard_outbox is None:
+            return ShardRouter(
+                run_shard_worker,
+                settings.SHARD_PROCESSES,
+                max_in_flight=settings.SHARD_MAX_IN_FLIGHT,
+                on_processed=self._on_shard_processed,
+                restart_backoff_max=settings.SHARD_RESTART_BACKOFF_MAX
+            )
+
+        # Pools de workers por lane; los textos tienen prioridad sobre los audios
+        return ChatDispatcher(
+            self._handle_update,
+            lanes={
+                "text": (settings.TEXT_WORKERS, settings.TEXT_QUEUE_MAXSIZE),
+                "audio": (settings.AUDIO_WORKERS, settings.AUDIO_QUEUE_MAXSIZE),
+            },
+            lane_of=self.telegram_service.update_lane,
+            priority=["text", "audio"]
+        )
+
+    def _on_shard_processed(self, update_id: int):
+        """Un worker confirmó un update (modo sharded, en el proceso de ingest)."""
+        if self.update_store:
+            self.update_store.mark_processed(update_id)
+        if self.admission:
+            self.admission.release(update_id)
+
+    def _create_admission(self) -> Optional[AdmissionController]:
+        """Control de admisión delante del dispatcher (None si está deshabilitado)."""
+        if not settings.ADMISSION_ENABLED:
+            return None
+        return AdmissionController(self.dispatcher, self.telegram_service.update_lane, self._shed_on_ingest)
+
+    async def _shed_on_ingest(self, update: dict, reason: str):
+        """Update rechazado en el ingest: no se encola y cuenta como procesado en el checkpoint."""
+        if self.update_store:
+            self.update_store.mark_processed(update["update_id"])
+        self._reply_busy(update)
+
+    def _reply_busy(self, update: dict):
+        """Avisa al chat que su mensaje se descartó (como mucho un aviso por chat cada tanto)."""
+        message = update.get("message", {})
+        chat_id = message.get("chat", {}).get("id")
+        if chat_id is None or not self.admission.should_notify(chat_id):
+            return
+        # Sin esperar la entrega: no frena al ingest ni al worker
+        self.telegram_service.delivery.enqueue(chat_id, BUSY_REPLY, message.get("message_id"))
+
+    async def _start_metrics(self, port: int):
+        """Registra los stats() de los servicios como métricas y levanta el endpoint."""
+        metrics_registry.add_collector("dispatcher", self.dispatcher.stats)
+        metrics_registry.add_collector("delivery", self.telegram_service.delivery.stats)
+        metrics_registry.add_collector("http_pool", self.http_client.stats)
+        if self.admission:
+            metrics_registry.add_collector("admission", self.admission.stats)
+        if self.update_store:
+            metrics_registry.add_collector("update_store", self.update_store.stats)
+        if not isinstance(self.dispatcher, ShardRouter):
+            metrics_registry.add_collector("transcription", self.transcription_service.stats)
+            metrics_registry.add_collector("transcription_cache", self.transcription_cache.stats)
+            metrics_registry.add_collector("query_backend", self.query_service.backend.stats)
+            metrics_registry.add_collector("query_cache", self.query_service.cache_stats)
+            if self.debouncer:
+                metrics_registry.add_collector("debounce", self.debouncer.stats)
+            if self.audio_preprocessor.enabled or self.audio_preprocessor.can_segment:
+                metrics_registry.add_collector("audio_preprocessor", self.audio_preprocessor.stats)
+            if settings.USER_WHITELIST_ENABLED:
+                metrics_registry.add_collector("user_cache", self.user_service.stats)
+
+        if settings.METRICS_ENABLED:
+            self.metrics_server = MetricsServer(port)
+            await self.metrics_server.start()
+
+    async def run_shard(self, shard: int, inbox, outbox):
+        """
+        Proceso worker del modo sharded: procesa los updates que el ingest le envía
+        por inbox (hasta recibir None) y confirma cada uno por outbox.
+        """
+        self._shard_outbox = (shard, outbox)
+        self.dispatcher = self._create_dispatcher()
+        self.dispatcher.start()
+        # Las reglas del ingest ya se aplicaron en el proceso de ingest: acá solo las de antigüedad
+        self.admission = self._create_admission()
+        await self._start_metrics(settings.METRICS_PORT + 1 + shard)
+        logger.info(f"Worker del shard {shard}: {settings.TEXT_WORKERS} workers de texto, {settings.AUDIO_WORKERS} de audio")
+
+        loop = asyncio.get_running_loop()
+        try:
+            while (update := await loop.run_in_executor(None, inbox.get)) is not None:
+                await self.dispatcher.submit(self.telegram_service.chat_key(update), update)
+        finally:
+            await self._shutdown()
+
+    async def _resume_from_checkpoint(self):
+        """Retoma desde el último offset guardado y reencola los updates que quedaron en vuelo."""
+        self.update_store.start()
+        self.telegram_service.last_update_id = self.update_store.get_offset()
+
+        pending = await asyncio.to_thread(self.update_store.get_pending)
+        # Ya se admitieron antes del reinicio: van directo al dispatcher (la antigüedad se revisa al procesarlos)
+        for update in pending:
+            await self.dispatcher.submit(self.telegram_service.chat_key(update), update)
+
+        logger.info(
+            f"Checkpoint: offset {self.telegram_service.last_update_id}, "
+            f"{len(pending)} updates pendientes reencolados"
+        )
+
+    async def _serve_webhook(self):
+        """Ingest por webhook: registra la URL en Telegram (opcional) y atiende las requests."""
+        webhook_server = WebhookServer(
+            self.admission or self.dispatcher,
+            self.telegram_service.chat_key,
+            on_batch=self._on_batch,
+            update_store=self.update_store
+        )
+        if settings.WEBHOOK_URL:
+            await self.telegram_service.set_webhook(settings.WEBHOOK_URL, settings.WEBHOOK_SECRET_TOKEN or None)
+            logger.info(f"Webhook registrado en Telegram: {settings.WEBHOOK_URL}")
+
+        await webhook_server.serve()
+
+    async def _drop_webhook(self):
+        """
+        Elimina un webhook que haya quedado registrado (p. ej. al volver de INGEST_MODE=webhook):
+        mientras exista, Telegram responde 409 a getUpdates.
+        """
+        try:
+            await self.telegram_service.delete_webhook()
+        except Exception as e:
+            logger.warning(f"No se pudo eliminar el webhook registrado: {e}")
 
     async def start(self):
         """Inicia el microservicio"""
@@ -78,18 +536,45 @@ class TelegramAudioBot:
             settings.validate()
             logger.info("Configuracion validada correctamente")
 
+            # Whitelist: quedan habilitados exactamente los ids de la configuración
+            revoked = self.user_repository.sync_allowed(settings.WHITELIST_USER_IDS, settings.WHITELIST_CHAT_IDS)
+            if any(revoked.values()):
+                logger.info(f"Whitelist sincronizada con la configuración: {revoked['users']} usuarios y {revoked['chats']} chats deshabilitados")
+
             # Información del bot
             logger.info(f"Chat ID: {settings.TELEGRAM_CHAT_ID}")
-            logger.info(f"Intervalo de polling: {settings.POLLING_INTERVAL} segundos")
+            if settings.INGEST_MODE == "webhook":
+                logger.info(f"Ingest por webhook en el puerto {settings.WEBHOOK_PORT}")
+            elif settings.POLLING_MODE == "long":
+                logger.info(f"Long polling: timeout de {settings.LONG_POLLING_TIMEOUT} segundos")
+            else:
+                logger.info(f"Intervalo de polling: {settings.POLLING_INTERVAL} segundos")
             logger.info(f"API de transcripcion: {settings.TRANSCRIPTION_API_URL}")
             logger.info(f"Sistema de queries: {settings.QUERY_SYSTEM_URL}")
 
-            # Iniciar polling
+            self.dispatcher = self._create_dispatcher()
+            self.dispatcher.start()
+            if isinstance(self.dispatcher, ShardRouter):
+                logger.info(f"Modo sharded: {settings.SHARD_PROCESSES} procesos worker")
+            else:
+                logger.info(f"Workers de texto: {settings.TEXT_WORKERS} | Workers de audio: {settings.AUDIO_WORKERS}")
+            self.admission = self._create_admission()
+
+            if self.update_store:
+                await self._resume_from_checkpoint()
+            await self._start_metrics(settings.METRICS_PORT)
+
+            # Iniciar el ingest (polling o webhook): solo encola en el dispatcher (pasando por el control de admisión)
             logger.info("\nBot iniciado. Esperando mensajes de audio y texto...\n")
-            await self.telegram_service.start_polling(
-                self.process_audio_message,
-                self.process_text_message
-            )
+            if settings.INGEST_MODE == "webhook":
+                await self._serve_webhook()
+            else:
+                await self._drop_webhook()
+                await self.telegram_service.start_polling(
+                    self.admission or self.dispatcher,
+                    on_batch=self._on_batch,
+                    update_store=self.update_store
+                )
 
         except ValueError as e:
             logger.error(f"Error de configuracion: {e}")
@@ -99,9 +584,72 @@ class TelegramAudioBot:
         except Exception as e:
             logger.error(f"Error fatal: {e}")
         finally:
-            # Cerrar todas las sesiones de aiohttp
-            logger.info("Cerrando conexiones...")
-            await self.telegram_service.close()
-            await self.transcription_service.close()
-            await self.query_service.close()
-            logger.info("Conexiones cerradas correctamente")
+            await self._shutdown()
+
+    async def _shutdown(self):
+        """Drena el trabajo pendiente, registra las estadísticas y cierra las conexiones."""
+        # Drenar la cola antes de cerrar las conexiones que usan los workers
+        if self.dispatcher:
+            logger.info("Drenando cola de trabajo...")
+            await self.dispatcher.stop(drain_timeout=settings.SHUTDOWN_DRAIN_TIMEOUT)
+            logger.info(f"Estadisticas de la cola: {self.dispatcher.stats()}")
+        # Los mensajes agrupados se responden ya, sin esperar su ventana
+        if self.debouncer and not isinstance(self.dispatcher, ShardRouter):
+            await self.debouncer.close(drain_timeout=settings.SHUTDOWN_DRAIN_TIMEOUT)
+            logger.info(f"Estadisticas de mensajes agrupados: {self.debouncer.stats()}")
+        # Enviar las respuestas que quedaron en la cola de salida
+        await self.telegram_service.delivery.close(drain_timeout=settings.SHUTDOWN_DRAIN_TIMEOUT)
+        logger.info(f"Estadisticas de envio de mensajes: {self.telegram_service.delivery.stats()}")
+        if self.update_store:
+            await self.update_store.close()
+            logger.info(f"Checkpoint de updates: offset {self.telegram_service.last_update_id}")
+        if isinstance(self.dispatcher, ShardRouter):
+            # Proceso de ingest: cada worker registra las estadísticas de su procesamiento
+            await self._close_connections()
+            return
+        if settings.PROGRESSIVE_REPLIES_ENABLED:
+            latency = {name: window.summary() for name, window in self._reply_latency.items()}
+            logger.info(f"Latencia de respuestas progresivas: {latency}")
+        logger.info(f"Estadisticas de la cache de transcripciones: {self.transcription_cache.stats()}")
+        logger.info(f"Estadisticas de la cache de queries: {self.query_service.cache_stats()}")
+        logger.info(f"Estadisticas del backend de transcripcion: {self.transcription_service.stats()}")
+        logger.info(f"Estadisticas del backend de queries: {self.query_service.backend.stats()}")
+        if self.audio_preprocessor.enabled or self.audio_preprocessor.can_segment:
+            logger.info(f"Estadisticas del preprocesamiento de audio: {self.audio_preprocessor.stats()}")
+        if settings.USER_WHITELIST_ENABLED:
+            logger.info(f"Estadisticas de la cache de usuarios: {self.user_service.stats()}")
+        logger.info(f"Estadisticas del repositorio de usuarios: {self.user_repository.stats()}")
+
+        await self._close_connections()
+
+    async def _close_connections(self):
+        """Cierra el endpoint de métricas, la sesión HTTP compartida y las bases locales."""
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        logger.info(f"Estadisticas del pool HTTP: {self.http_client.stats()}")
+        logger.info("Cerrando conexiones...")
+        # Los batches en curso usan la sesión HTTP: se esperan antes de cerrarla
+        await self.transcription_service.close(drain_timeout=settings.SHUTDOWN_DRAIN_TIMEOUT)
+        await self.user_service.close(drain_timeout=settings.SHUTDOWN_DRAIN_TIMEOUT)
+        await self.http_client.close()
+        self.transcription_cache.close()
+        self.audio_preprocessor.close()
+        self.user_repository.close()
+        logger.info("Conexiones cerradas correctamente")
+
+
+def run_shard_worker(shard: int, shards: int, inbox, outbox):
+    """Punto de entrada de un proceso worker del modo sharded (lo lanza ShardRouter)."""
+    # El proceso de ingest coordina el apagado: Ctrl+C no interrumpe el drenado del worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # El checkpoint de updates vive en el ingest; el límite global de envíos de Telegram se reparte
+    settings.UPDATE_STORE_ENABLED = False
+    settings.OUTBOUND_GLOBAL_RATE /= shards
+    settings.OUTBOUND_GLOBAL_BURST = max(1.0, settings.OUTBOUND_GLOBAL_BURST / shards)
+
+    bot = TelegramAudioBot()
+    try:
+        asyncio.run(bot.run_shard(shard, inbox, outbox))
+    finally:
+        # multiprocessing termina el worker con os._exit: atexit no corre y la cola de logs se perdería
+        shutdown_logging()
@@ -19,11 +19,198 @@ class Settings:
     QUERY_SYSTEM_URL: str = os.getenv('QUERY_SYSTEM_URL')  # type: ignore
     #QUERY_SYSTEM_API_KEY = os.getenv('QUERY_SYSTEM_API_KEY')
 
+    USER_SYSTEM_URL: str = os.getenv('USER_SYSTEM_URL', '')  # type: ignore
+    #USER_SYSTEM_API_KEY = os.getenv('USER_SYSTEM_API_KEY')
+
+    TELEGRAM_API_BASE_URL: str = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org')  # type: ignore
+
+    # Validar con Pydantic cada update parseado (más lento; para depurar updates inesperados)
+    TELEGRAM_VALIDATE_UPDATES: bool = os.getenv('TELEGRAM_VALIDATE_UPDATES', 'false').lower() == 'true'
+
+    # Ingest de updates: "polling" (getUpdates) o "webhook" (servidor aiohttp)
+    INGEST_MODE: str = os.getenv('INGEST_MODE', 'polling')  # type: ignore
+
+    # Webhook
+    WEBHOOK_URL: str = os.getenv('WEBHOOK_URL', '')  # type: ignore  # URL pública; vacío = no registrar en Telegram
+    WEBHOOK_HOST: str = os.getenv('WEBHOOK_HOST', '0.0.0.0')  # type: ignore
+    WEBHOOK_PORT: int = int(os.getenv('WEBHOOK_PORT', 8080))
+    WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/telegram/webhook')  # type: ignore
+    WEBHOOK_SECRET_TOKEN: str = os.getenv('WEBHOOK_SECRET_TOKEN', '')  # type: ignore
+    WEBHOOK_MAX_CONNECTIONS: int = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+    WEBHOOK_QUEUE_MAXSIZE: int = int(os.getenv('WEBHOOK_QUEUE_MAXSIZE', 1000))
+
     # Configuración del polling
+    # POLLING_MODE: "long" (getUpdates con timeout del lado del servidor) o "short" (timeout=0 + sleep)
+    POLLING_MODE: str = os.getenv('POLLING_MODE', 'long')  # type: ignore
     POLLING_INTERVAL: float = float(os.getenv('POLLING_INTERVAL', 2.5))
+    LONG_POLLING_TIMEOUT: int = int(os.getenv('LONG_POLLING_TIMEOUT', 25))
+    LONG_POLLING_CLIENT_MARGIN: float = float(os.getenv('LONG_POLLING_CLIENT_MARGIN', 5))
+    POLLING_BACKOFF_BASE: float = float(os.getenv('POLLING_BACKOFF_BASE', 1))
+    POLLING_BACKOFF_MAX: float = float(os.getenv('POLLING_BACKOFF_MAX', 30))
+
+    # Procesamiento concurrente: colas acotadas + pools de workers por lane (texto tiene prioridad)
+    TEXT_WORKERS: int = int(os.getenv('TEXT_WORKERS', 8))
+    TEXT_QUEUE_MAXSIZE: int = int(os.getenv('TEXT_QUEUE_MAXSIZE', 200))
+    AUDIO_WORKERS: int = int(os.getenv('AUDIO_WORKERS', 4))
+    AUDIO_QUEUE_MAXSIZE: int = int(os.getenv('AUDIO_QUEUE_MAXSIZE', 200))
+    SHUTDOWN_DRAIN_TIMEOUT: float = float(os.getenv('SHUTDOWN_DRAIN_TIMEOUT', 30))
+
+    # Modo sharded: un proceso de ingest reparte los updates por hash del chat_id entre
+    # SHARD_PROCESSES procesos worker (1 = todo en un solo proceso)
+    SHARD_PROCESSES: int = int(os.getenv('SHARD_PROCESSES', 1))
+    SHARD_MAX_IN_FLIGHT: int = int(os.getenv('SHARD_MAX_IN_FLIGHT', 500))
+    SHARD_RESTART_BACKOFF_MAX: float = float(os.getenv('SHARD_RESTART_BACKOFF_MAX', 30))
+
+    # Audio: streaming de Telegram a la API de transcripción; a disco solo por encima del umbral (0 = nunca)
+    AUDIO_STREAM_CHUNK_SIZE: int = int(os.getenv('AUDIO_STREAM_CHUNK_SIZE', 64 * 1024))
+    AUDIO_SPILL_THRESHOLD: int = int(os.getenv('AUDIO_SPILL_THRESHOLD', 20 * 1024 * 1024))
+
+    # Límite de duración de audios (segundos, 0 = sin límite): "reject" responde sin transcribir, "truncate" recorta
+    AUDIO_MAX_DURATION: int = int(os.getenv('AUDIO_MAX_DURATION', 0))
+    AUDIO_MAX_DURATION_POLICY: str = os.getenv('AUDIO_MAX_DURATION_POLICY', 'reject').lower()
+
+    # Preprocesamiento con ffmpeg antes de transcribir (recorte de silencios y recodificación)
+    AUDIO_PREPROCESS_ENABLED: bool = os.getenv('AUDIO_PREPROCESS_ENABLED', 'false').lower() == 'true'
+    AUDIO_PREPROCESS_WORKERS: int = int(os.getenv('AUDIO_PREPROCESS_WORKERS', 2))
+    AUDIO_PREPROCESS_TIMEOUT: float = float(os.getenv('AUDIO_PREPROCESS_TIMEOUT', 60))
+    AUDIO_TRIM_SILENCE: bool = os.getenv('AUDIO_TRIM_SILENCE', 'true').lower() == 'true'
+    AUDIO_SILENCE_THRESHOLD_DB: float = float(os.getenv('AUDIO_SILENCE_THRESHOLD_DB', -45))
+    AUDIO_SILENCE_MIN: float = float(os.getenv('AUDIO_SILENCE_MIN', 0.3))
+    AUDIO_MONO: bool = os.getenv('AUDIO_MONO', 'true').lower() == 'true'
+    AUDIO_RESAMPLE_RATE: int = int(os.getenv('AUDIO_RESAMPLE_RATE', 16000))  # 0 = mantener
+    AUDIO_OUTPUT_CODEC: str = os.getenv('AUDIO_OUTPUT_CODEC', 'libopus')
+    AUDIO_OUTPUT_BITRATE: str = os.getenv('AUDIO_OUTPUT_BITRATE', '24k')
+    FFMPEG_PATH: str = os.getenv('FFMPEG_PATH', 'ffmpeg')
+    FFPROBE_PATH: str = os.getenv('FFPROBE_PATH', 'ffprobe')
+
+    # Audios largos: se cortan en segmentos solapados que se transcriben en paralelo (requiere ffmpeg)
+    AUDIO_SEGMENT_ENABLED: bool = os.getenv('AUDIO_SEGMENT_ENABLED', 'true').lower() == 'true'
+    AUDIO_SEGMENT_THRESHOLD: float = float(os.getenv('AUDIO_SEGMENT_THRESHOLD', 120))
+    AUDIO_SEGMENT_SECONDS: float = float(os.getenv('AUDIO_SEGMENT_SECONDS', 60))
+    AUDIO_SEGMENT_OVERLAP: float = float(os.getenv('AUDIO_SEGMENT_OVERLAP', 2))
+    TRANSCRIPTION_SEGMENT_PARALLELISM: int = int(os.getenv('TRANSCRIPTION_SEGMENT_PARALLELISM', 4))
+
+    # Cache de transcripciones (por file_unique_id / sha256 del audio)
+    TRANSCRIPTION_CACHE_ENABLED: bool = os.getenv('TRANSCRIPTION_CACHE_ENABLED', 'true').lower() == 'true'
+    TRANSCRIPTION_CACHE_SIZE: int = int(os.getenv('TRANSCRIPTION_CACHE_SIZE', 1000))
+    TRANSCRIPTION_CACHE_TTL: float = float(os.getenv('TRANSCRIPTION_CACHE_TTL', 24 * 3600))
+    TRANSCRIPTION_CACHE_DB: str = os.getenv('TRANSCRIPTION_CACHE_DB', '')  # type: ignore  # vacío = sin tier SQLite
+    TRANSCRIPTION_CACHE_DB_TTL: float = float(os.getenv('TRANSCRIPTION_CACHE_DB_TTL', 30 * 24 * 3600))
+
+    # Micro-batching de transcripciones (opt-in): varios audios en una request al endpoint batch
+    TRANSCRIPTION_BATCH_ENABLED: bool = os.getenv('TRANSCRIPTION_BATCH_ENABLED', 'false').lower() == 'true'
+    TRANSCRIPTION_BATCH_URL: str = os.getenv('TRANSCRIPTION_BATCH_URL', '')  # type: ignore  # vacío = {TRANSCRIPTION_API_URL}/batch
+    TRANSCRIPTION_BATCH_WINDOW: float = float(os.getenv('TRANSCRIPTION_BATCH_WINDOW', 0.1))
+    TRANSCRIPTION_BATCH_MAX_SIZE: int = int(os.getenv('TRANSCRIPTION_BATCH_MAX_SIZE', 8))
+    TRANSCRIPTION_BATCH_MAX_BYTES: int = int(os.getenv('TRANSCRIPTION_BATCH_MAX_BYTES', 20 * 1024 * 1024))
+    TRANSCRIPTION_BATCH_MAX_ITEM_BYTES: int = int(os.getenv('TRANSCRIPTION_BATCH_MAX_ITEM_BYTES', 5 * 1024 * 1024))
+
+    # Cache de respuestas del sistema de queries (opt-in): off | global | session
+    QUERY_CACHE_SCOPE: str = os.getenv('QUERY_CACHE_SCOPE', 'off')  # type: ignore
+    QUERY_CACHE_SIZE: int = int(os.getenv('QUERY_CACHE_SIZE', 500))
+    QUERY_CACHE_TTL: float = float(os.getenv('QUERY_CACHE_TTL', 600))
+    QUERY_CACHE_FOLLOWUP_PATTERN: str = os.getenv('QUERY_CACHE_FOLLOWUP_PATTERN', '')  # type: ignore  # vacío = patrón por defecto
+    QUERY_CACHE_STATEFUL_SESSIONS: list = [s for s in os.getenv('QUERY_CACHE_STATEFUL_SESSIONS', '').split(',') if s]
+
+    # Pool HTTP compartido por todos los servicios
+    HTTP_POOL_LIMIT: int = int(os.getenv('HTTP_POOL_LIMIT', 100))
+    HTTP_POOL_LIMIT_PER_HOST: int = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', 30))
+    HTTP_KEEPALIVE_TIMEOUT: float = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 60))
+    HTTP_DNS_CACHE_TTL: int = int(os.getenv('HTTP_DNS_CACHE_TTL', 300))
+
+    # Timeouts por endpoint (segundos)
+    TELEGRAM_API_TIMEOUT: float = float(os.getenv('TELEGRAM_API_TIMEOUT', 10))
+    TELEGRAM_DOWNLOAD_TIMEOUT: float = float(os.getenv('TELEGRAM_DOWNLOAD_TIMEOUT', 30))
+    TRANSCRIPTION_TIMEOUT: float = float(os.getenv('TRANSCRIPTION_TIMEOUT', 60))
+    QUERY_TIMEOUT: float = float(os.getenv('QUERY_TIMEOUT', 30))
+
+    # Resiliencia de los backends (transcripción y queries); los timeouts de arriba son el presupuesto total
+    TRANSCRIPTION_RETRIES: int = int(os.getenv('TRANSCRIPTION_RETRIES', 2))
+    QUERY_RETRIES: int = int(os.getenv('QUERY_RETRIES', 2))
+    RETRY_BASE_DELAY: float = float(os.getenv('RETRY_BASE_DELAY', 0.5))
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+    CIRCUIT_RECOVERY_TIMEOUT: float = float(os.getenv('CIRCUIT_RECOVERY_TIMEOUT', 30))
+    TRANSCRIPTION_MAX_CONCURRENCY: int = int(os.getenv('TRANSCRIPTION_MAX_CONCURRENCY', 8))
+    QUERY_MAX_CONCURRENCY: int = int(os.getenv('QUERY_MAX_CONCURRENCY', 32))
+    ADAPTIVE_MIN_CONCURRENCY: int = int(os.getenv('ADAPTIVE_MIN_CONCURRENCY', 1))
+    ADAPTIVE_LATENCY_TOLERANCE: float = float(os.getenv('ADAPTIVE_LATENCY_TOLERANCE', 2.0))
+    ADAPTIVE_QUEUE_TIMEOUT: float = float(os.getenv('ADAPTIVE_QUEUE_TIMEOUT', 2.0))
+
+    # Envío de mensajes (límites de Telegram: ~30 msg/s global, 1 msg/s por chat, 20 msg/min por grupo)
+    OUTBOUND_GLOBAL_RATE: float = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))
+    OUTBOUND_GLOBAL_BURST: float = float(os.getenv('OUTBOUND_GLOBAL_BURST', 30))
+    OUTBOUND_CHAT_RATE: float = float(os.getenv('OUTBOUND_CHAT_RATE', 1))
+    OUTBOUND_CHAT_BURST: float = float(os.getenv('OUTBOUND_CHAT_BURST', 3))
+    OUTBOUND_GROUP_RATE: float = float(os.getenv('OUTBOUND_GROUP_RATE', 20 / 60))
+    OUTBOUND_GROUP_BURST: float = float(os.getenv('OUTBOUND_GROUP_BURST', 3))
+    OUTBOUND_CHAT_QUEUE_MAXSIZE: int = int(os.getenv('OUTBOUND_CHAT_QUEUE_MAXSIZE', 100))
+    OUTBOUND_MAX_RETRIES: int = int(os.getenv('OUTBOUND_MAX_RETRIES', 5))
+    OUTBOUND_COALESCE: bool = os.getenv('OUTBOUND_COALESCE', 'false').lower() == 'true'
+    OUTBOUND_MAX_TRACKED_CHATS: int = int(os.getenv('OUTBOUND_MAX_TRACKED_CHATS', 10000))
+
+    # Métricas en formato Prometheus (en modo sharded cada worker usa METRICS_PORT + 1 + shard)
+    METRICS_ENABLED: bool = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_HOST: str = os.getenv('METRICS_HOST', '127.0.0.1')  # type: ignore
+    METRICS_PORT: int = int(os.getenv('METRICS_PORT', 9108))
+    METRICS_PATH: str = os.getenv('METRICS_PATH', '/metrics')  # type: ignore
+
+    # Control de admisión ante sobrecarga (opt-in; 0 = sin ese límite)
+    ADMISSION_ENABLED: bool = os.getenv('ADMISSION_ENABLED', 'false').lower() == 'true'
+    ADMISSION_CHAT_RATE: float = float(os.getenv('ADMISSION_CHAT_RATE', 0.3))  # Mensajes por segundo por chat (≈ lo que Telegram deja responder a un grupo)
+    ADMISSION_CHAT_BURST: float = float(os.getenv('ADMISSION_CHAT_BURST', 10))
+    ADMISSION_USER_RATE: float = float(os.getenv('ADMISSION_USER_RATE', 0.2))  # Mensajes por segundo por usuario
+    ADMISSION_USER_BURST: float = float(os.getenv('ADMISSION_USER_BURST', 10))
+    ADMISSION_MAX_IN_FLIGHT: int = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 100))  # Admitidos sin terminar (todas las lanes)
+    ADMISSION_AUDIO_MAX_AGE: float = float(os.getenv('ADMISSION_AUDIO_MAX_AGE', 120))  # Segundos desde que se envió el audio
+    ADMISSION_TEXT_DEADLINE: float = float(os.getenv('ADMISSION_TEXT_DEADLINE', 60))  # Segundos hasta la respuesta esperada
+    ADMISSION_BUSY_REPLY_INTERVAL: float = float(os.getenv('ADMISSION_BUSY_REPLY_INTERVAL', 60))  # Un aviso por chat cada N segundos
+    ADMISSION_MAX_TRACKED: int = int(os.getenv('ADMISSION_MAX_TRACKED', 10000))
+
+    # Agrupación de mensajes seguidos de un mismo chat en una sola query (opt-in)
+    DEBOUNCE_ENABLED: bool = os.getenv('DEBOUNCE_ENABLED', 'false').lower() == 'true'
+    DEBOUNCE_WINDOW: float = float(os.getenv('DEBOUNCE_WINDOW', 2.0))  # Segundos sin mensajes nuevos que cierran el grupo
+    DEBOUNCE_MAX_WAIT: float = float(os.getenv('DEBOUNCE_MAX_WAIT', 8.0))  # Espera máxima desde el primer mensaje del grupo
+    DEBOUNCE_MAX_MESSAGES: int = int(os.getenv('DEBOUNCE_MAX_MESSAGES', 10))  # 0 = sin límite
+
+    # Respuestas progresivas: mensaje provisorio que se edita con el avance (y la respuesta en streaming)
+    PROGRESSIVE_REPLIES_ENABLED: bool = os.getenv('PROGRESSIVE_REPLIES_ENABLED', 'false').lower() == 'true'
+    PROGRESSIVE_EDIT_INTERVAL: float = float(os.getenv('PROGRESSIVE_EDIT_INTERVAL', 1.5))
+    QUERY_STREAMING_ENABLED: bool = os.getenv('QUERY_STREAMING_ENABLED', 'false').lower() == 'true'
+
+    # Repositorio local de usuarios/chats (SQLite) y su cache de whitelist
+    USER_REPOSITORY_DB: str = os.getenv('USER_REPOSITORY_DB', 'data/users.db')  # type: ignore
+    USER_REPOSITORY_CACHE_SIZE: int = int(os.getenv('USER_REPOSITORY_CACHE_SIZE', 100000))
+    USER_REPOSITORY_CACHE_TTL: float = float(os.getenv('USER_REPOSITORY_CACHE_TTL', 300))
+    WHITELIST_USER_IDS: list = [int(i) for i in os.getenv('WHITELIST_USER_IDS', '').split(',') if i.strip()]
+    WHITELIST_CHAT_IDS: list = [int(i) for i in os.getenv('WHITELIST_CHAT_IDS', '').split(',') if i.strip()]
+
+    # Whitelist de usuarios: "local" (repositorio SQLite) o "remote" (sistema de usuarios,
+    # cache con TTL y negative caching)
+    USER_WHITELIST_ENABLED: bool = os.getenv('USER_WHITELIST_ENABLED', 'false').lower() == 'true'
+    USER_WHITELIST_SOURCE: str = os.getenv('USER_WHITELIST_SOURCE', 'local')  # type: ignore
+    USER_SYSTEM_TIMEOUT: float = float(os.getenv('USER_SYSTEM_TIMEOUT', 30))
+    USER_SYSTEM_BATCH_ENABLED: bool = os.getenv('USER_SYSTEM_BATCH_ENABLED', 'true').lower() == 'true'
+    USER_BATCH_WINDOW: float = float(os.getenv('USER_BATCH_WINDOW', 0.005))
+    USER_BATCH_MAX_SIZE: int = int(os.getenv('USER_BATCH_MAX_SIZE', 50))
+    USER_CACHE_SIZE: int = int(os.getenv('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL: float = float(os.getenv('USER_CACHE_TTL', 600))
+    USER_CACHE_NEGATIVE_TTL: float = float(os.getenv('USER_CACHE_NEGATIVE_TTL', 60))
+
+    # Checkpoint durable del offset y journal de updates en vuelo (SQLite)
+    UPDATE_STORE_ENABLED: bool = os.getenv('UPDATE_STORE_ENABLED', 'true').lower() == 'true'
+    UPDATE_STORE_DB: str = os.getenv('UPDATE_STORE_DB', 'data/updates.db')  # type: ignore
+    CHECKPOINT_FLUSH_INTERVAL: float = float(os.getenv('CHECKPOINT_FLUSH_INTERVAL', 1.0))
+    CHECKPOINT_FLUSH_MAX: int = int(os.getenv('CHECKPOINT_FLUSH_MAX', 100))
+    PROCESSED_UPDATES_RETENTION: float = float(os.getenv('PROCESSED_UPDATES_RETENTION', 7 * 24 * 3600))
 
     # Configuración de logs
     LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO')  # type: ignore
+    # Escritura en un thread aparte (QueueHandler/QueueListener): el event loop no se bloquea
+    LOG_ASYNC: bool = os.getenv('LOG_ASYNC', 'true').lower() == 'true'
+    LOG_FORMAT: str = os.getenv('LOG_FORMAT', 'text')  # type: ignore  # text | json
+    LOG_MAX_MESSAGE_LENGTH: int = int(os.getenv('LOG_MAX_MESSAGE_LENGTH', 2000))  # 0 = sin truncar
+    LOG_SAMPLE_EVERY: int = int(os.getenv('LOG_SAMPLE_EVERY', 100))  # Líneas repetitivas: 1 de cada N
+    LOG_QUEUE_SIZE: int = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # Registros en cola antes de descartar
 
     @classmethod
     def validate(cls):
@@ -35,11 +222,47 @@ class Settings:
             'QUERY_SYSTEM_URL'
         ]
 
+        if cls.USER_WHITELIST_ENABLED and cls.USER_WHITELIST_SOURCE == 'remote':
+            required_vars.append('USER_SYSTEM_URL')
+
         missing = [var for var in required_vars if not getattr(cls, var)]
 
         if missing:
             raise ValueError(f"Faltan las siguientes variables de entorno: {', '.join(missing)}")
 
+        if cls.SHARD_PROCESSES < 1:
+            raise ValueError(f"SHARD_PROCESSES invalido: {cls.SHARD_PROCESSES} (minimo 1)")
+
+        if cls.QUERY_CACHE_SCOPE not in ('off', 'global', 'session'):
+            raise ValueError(f"QUERY_CACHE_SCOPE invalido: {cls.QUERY_CACHE_SCOPE} (usar 'off', 'global' o 'session')")
+
+        if cls.USER_WHITELIST_SOURCE not in ('local', 'remote'):
+            raise ValueError(f"USER_WHITELIST_SOURCE invalido: {cls.USER_WHITELIST_SOURCE} (usar 'local' o 'remote')")
+
+        if cls.INGEST_MODE not in ('polling', 'webhook'):
+            raise ValueError(f"INGEST_MODE invalido: {cls.INGEST_MODE} (usar 'polling' o 'webhook')")
+
+        if cls.POLLING_MODE not in ('long', 'short'):
+            raise ValueError(f"POLLING_MODE invalido: {cls.POLLING_MODE} (usar 'long' o 'short')")
+
+        if cls.AUDIO_MAX_DURATION_POLICY not in ('reject', 'truncate'):
+            raise ValueError(f"AUDIO_MAX_DURATION_POLICY invalido: {cls.AUDIO_MAX_DURATION_POLICY} (usar 'reject' o 'truncate')")
+
+        if cls.AUDIO_SEGMENT_SECONDS <= 0 or cls.AUDIO_SEGMENT_OVERLAP < 0:
+            raise ValueError(
+                f"AUDIO_SEGMENT_SECONDS ({cls.AUDIO_SEGMENT_SECONDS}) debe ser positivo y "
+                f"AUDIO_SEGMENT_OVERLAP ({cls.AUDIO_SEGMENT_OVERLAP}) no puede ser negativo"
+            )
+
+        if cls.AUDIO_SEGMENT_OVERLAP >= cls.AUDIO_SEGMENT_SECONDS:
+            raise ValueError(
+                f"AUDIO_SEGMENT_OVERLAP ({cls.AUDIO_SEGMENT_OVERLAP}) debe ser menor que "
+                f"AUDIO_SEGMENT_SECONDS ({cls.AUDIO_SEGMENT_SECONDS})"
+            )
+
+        if cls.LOG_FORMAT not in ('text', 'json'):
+            raise ValueError(f"LOG_FORMAT invalido: {cls.LOG_FORMAT} (usar 'text' o 'json')")
+
         return True
 
 
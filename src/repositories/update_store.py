@@ -0,0 +1,207 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+from src.utils import fast_json
+
+logger = setup_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoint (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending_updates (
+    update_id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    accepted_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS processed_updates (
+    update_id INTEGER PRIMARY KEY,
+    processed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_processed_at ON processed_updates(processed_at);
+"""
+
+
+class UpdateStore:
+    """
+    Checkpoint durable del offset de Telegram e índice de updates procesados.
+
+    - Al aceptar un batch se guardan, en una sola transacción, los updates
+      (journal de pendientes) y el offset. Así, aunque Telegram ya los haya dado
+      por confirmados, un crash no pierde los mensajes en vuelo: al reiniciar se
+      reencolan los pendientes.
+    - Al terminar de procesar un update se marca como procesado. Las marcas se
+      acumulan en memoria y se escriben en batch (cada CHECKPOINT_FLUSH_INTERVAL
+      segundos o CHECKPOINT_FLUSH_MAX updates), no con un fsync por update.
+    - Los updates que ya están pendientes o procesados se descartan al llegar de
+      nuevo (reentregas de Telegram tras un reinicio), así no se vuelve a
+      transcribir ni a consultar un mensaje ya respondido.
+
+    Un crash entre el fin de un update y el siguiente flush puede hacer que ese
+    update se reprocese: la ventana está acotada por CHECKPOINT_FLUSH_INTERVAL.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.UPDATE_STORE_DB
+        self._lock = threading.Lock()
+        self._done: List[int] = []
+        self._done_set: Set[int] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.flushes = 0
+        self.duplicates = 0
+
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.execute(
+            "DELETE FROM processed_updates WHERE processed_at < ?",
+            (time.time() - settings.PROCESSED_UPDATES_RETENTION,)
+        )
+        self._db.commit()
+        row = self._db.execute("SELECT value FROM checkpoint WHERE name = 'last_update_id'").fetchone()
+        # Copia en memoria del offset persistido: stats() la lee sin tocar la base
+        self._offset = row[0] if row else 0
+
+    # --- Lecturas al iniciar ---
+
+    def get_offset(self) -> int:
+        """Último update_id aceptado (0 si no hay checkpoint)."""
+        return self._offset
+
+    def get_pending(self) -> List[dict]:
+        """Updates aceptados que no llegaron a procesarse, en orden de update_id."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT payload FROM pending_updates "
+                "WHERE update_id NOT IN (SELECT update_id FROM processed_updates) "
+                "ORDER BY update_id"
+            ).fetchall()
+        return [fast_json.loads(row[0]) for row in rows]
+
+    # --- Ingest ---
+
+    def _journal(self, updates: List[dict], offset: int) -> List[dict]:
+        """
+        En una transacción (y bajo el lock): guarda en el journal los updates que no
+        estaban pendientes ni procesados y avanza el offset. Retorna los nuevos.
+        """
+        ids = [u["update_id"] for u in updates]
+        placeholders = ",".join("?" * len(ids))
+        now = time.time()
+        fresh = []
+        with self._lock:
+            with self._db:
+                processed = {
+                    row[0] for row in self._db.execute(
+                        f"SELECT update_id FROM processed_updates WHERE update_id IN ({placeholders})", ids
+                    )
+                }
+                for update in updates:
+                    if update["update_id"] in processed:
+                        continue
+                    # INSERT OR IGNORE decide si es nuevo: dos entregas concurrentes no pasan las dos
+                    cursor = self._db.execute(
+                        "INSERT OR IGNORE INTO pending_updates (update_id, payload, accepted_at) VALUES (?, ?, ?)",
+                        (update["update_id"], fast_json.dumps(update), now)
+                    )
+                    if cursor.rowcount:
+                        fresh.append(update)
+                self._db.execute(
+                    "INSERT INTO checkpoint (name, value) VALUES ('last_update_id', ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)",
+                    (offset,)
+                )
+            self._offset = max(self._offset, offset)
+        return fresh
+
+    async def accept(self, updates: List[dict]) -> List[dict]:
+        """
+        Registra un batch recibido: descarta los ya conocidos y guarda el resto en el
+        journal junto con el nuevo offset (una transacción). Retorna los updates nuevos.
+        """
+        if not updates:
+            return []
+
+        ids = [u["update_id"] for u in updates]
+        # Procesados cuya marca todavía no se escribió (su fila de pendiente sigue en el journal)
+        done = self._done_set.intersection(ids)
+        fresh = await asyncio.to_thread(self._journal, [u for u in updates if u["update_id"] not in done], max(ids))
+        self.duplicates += len(updates) - len(fresh)
+        return fresh
+
+    # --- Procesamiento ---
+
+    def mark_processed(self, update_id: int):
+        """Marca un update como procesado (se persiste en el próximo flush)."""
+        self._done.append(update_id)
+        self._done_set.add(update_id)
+        if len(self._done) >= settings.CHECKPOINT_FLUSH_MAX and self._wakeup:
+            self._wakeup.set()
+
+    def _write_done(self, done: List[int]):
+        now = time.time()
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO processed_updates (update_id, processed_at) VALUES (?, ?)",
+                    [(update_id, now) for update_id in done]
+                )
+                self._db.executemany("DELETE FROM pending_updates WHERE update_id = ?", [(u,) for u in done])
+
+    async def flush(self):
+        """Escribe en una transacción las marcas de procesado acumuladas."""
+        if not self._done:
+            return
+        done, self._done = self._done, []
+        try:
+            await asyncio.to_thread(self._write_done, done)
+            self._done_set.difference_update(done)
+            self.flushes += 1
+        except sqlite3.Error as e:
+            logger.error(f"Error al guardar el checkpoint de updates: {e}")
+            self._done = done + self._done
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.CHECKPOINT_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        """Arranca el flush periódico de checkpoints."""
+        self._wakeup = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del checkpoint."""
+        return {
+            "offset": self.get_offset(),
+            "unflushed": len(self._done),
+            "flushes": self.flushes,
+            "duplicates_skipped": self.duplicates,
+        }
+
+    async def close(self):
+        """Detiene el flush periódico, escribe lo pendiente y cierra la base."""
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,239 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from src.config.settings import settings
+from src.schemas import TelegramUser, TelegramChat
+from src.utils.cache import TTLCache, MISSING
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    language_code TEXT,
+    is_bot INTEGER NOT NULL DEFAULT 0,
+    allowed INTEGER NOT NULL DEFAULT 0,
+    first_seen REAL,
+    last_seen REAL
+);
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE INDEX IF NOT EXISTS idx_users_allowed ON users(allowed) WHERE allowed = 1;
+
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY,
+    chat_type TEXT,
+    chat_title TEXT,
+    allowed INTEGER NOT NULL DEFAULT 0,
+    first_seen REAL,
+    last_seen REAL
+);
+CREATE INDEX IF NOT EXISTS idx_chats_allowed ON chats(allowed) WHERE allowed = 1;
+"""
+
+UPSERT_USER = """
+INSERT INTO users (user_id, username, first_name, last_name, language_code, is_bot, first_seen, last_seen)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(user_id) DO UPDATE SET
+    username = excluded.username,
+    first_name = excluded.first_name,
+    last_name = excluded.last_name,
+    language_code = excluded.language_code,
+    last_seen = excluded.last_seen
+"""
+
+UPSERT_CHAT = """
+INSERT INTO chats (chat_id, chat_type, chat_title, first_seen, last_seen)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(chat_id) DO UPDATE SET
+    chat_type = excluded.chat_type,
+    chat_title = COALESCE(excluded.chat_title, chats.chat_title),
+    last_seen = excluded.last_seen
+"""
+
+
+class UserRepository:
+    """
+    Repositorio local de usuarios y chats de Telegram (SQLite en modo WAL).
+
+    Las claves son los ids estables de Telegram (user_id y chat_id; los username
+    pueden cambiar). Los usuarios y chats vistos se registran con un upsert por
+    batch de updates, no uno por mensaje. La whitelist (columna `allowed`) se
+    consulta a través de una cache en memoria read-through, así el chequeo de cada
+    mensaje no toca el disco.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or settings.USER_REPOSITORY_DB
+        self._lock = threading.Lock()
+        self._allowed_cache = TTLCache(settings.USER_REPOSITORY_CACHE_SIZE, settings.USER_REPOSITORY_CACHE_TTL)
+
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    # --- Registro de usuarios y chats vistos ---
+
+    @staticmethod
+    def _rows_from_updates(updates: Iterable[dict]) -> Tuple[List[tuple], List[tuple]]:
+        """Extrae (sin duplicados) las filas de usuarios y chats de un batch de updates crudos."""
+        now = time.time()
+        users: Dict[int, tuple] = {}
+        chats: Dict[int, tuple] = {}
+        for update in updates:
+            message = update.get("message") or {}
+            user = message.get("from")
+            chat = message.get("chat")
+            if user and "id" in user:
+                users[user["id"]] = (
+                    user["id"], user.get("username"), user.get("first_name"), user.get("last_name"),
+                    user.get("language_code"), int(user.get("is_bot", False)), now, now
+                )
+            if chat and "id" in chat:
+                chats[chat["id"]] = (chat["id"], chat.get("type"), chat.get("title"), now, now)
+        return list(users.values()), list(chats.values())
+
+    def _upsert(self, user_rows: List[tuple], chat_rows: List[tuple]):
+        with self._lock:
+            with self._db:
+                if user_rows:
+                    self._db.executemany(UPSERT_USER, user_rows)
+                if chat_rows:
+                    self._db.executemany(UPSERT_CHAT, chat_rows)
+
+    async def record_updates(self, updates: List[dict]):
+        """Registra los usuarios y chats de un batch de updates en una sola transacción."""
+        user_rows, chat_rows = self._rows_from_updates(updates)
+        if not user_rows and not chat_rows:
+            return
+        try:
+            await asyncio.to_thread(self._upsert, user_rows, chat_rows)
+        except sqlite3.Error as e:
+            logger.error(f"Error al registrar usuarios/chats: {e}")
+
+    def upsert_users(self, users: Iterable[TelegramUser]):
+        """Guarda (o actualiza) usuarios."""
+        now = time.time()
+        rows = [
+            (u.user_id, u.username, u.user_first_name, u.user_last_name, u.user_language_code, int(u.is_bot), now, now)
+            for u in users
+        ]
+        self._upsert(rows, [])
+
+    def upsert_chats(self, chats: Iterable[TelegramChat]):
+        """Guarda (o actualiza) chats."""
+        now = time.time()
+        self._upsert([], [(c.chat_id, c.chat_type, c.chat_title, now, now) for c in chats])
+
+    # --- Lecturas ---
+
+    def get_user(self, user_id: int) -> Optional[TelegramUser]:
+        """Obtiene un usuario por su id de Telegram."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT user_id, username, first_name, last_name, language_code, is_bot FROM users WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return TelegramUser(
+            user_id=row[0],
+            username=row[1],
+            user_first_name=row[2] or "Unknown",
+            user_last_name=row[3],
+            user_language_code=row[4],
+            is_bot=bool(row[5])
+        )
+
+    def get_chat(self, chat_id: int) -> Optional[TelegramChat]:
+        """Obtiene un chat por su id de Telegram."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT chat_id, chat_type, chat_title FROM chats WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return TelegramChat(chat_id=row[0], chat_type=row[1] or "unknown", chat_title=row[2])
+
+    # --- Whitelist ---
+
+    def set_user_allowed(self, user_id: int, allowed: bool = True):
+        """Agrega o quita un usuario de la whitelist (lo crea si no existe)."""
+        self._set_allowed("users", "user_id", user_id, allowed)
+
+    def set_chat_allowed(self, chat_id: int, allowed: bool = True):
+        """Agrega o quita un chat de la whitelist (lo crea si no existe)."""
+        self._set_allowed("chats", "chat_id", chat_id, allowed)
+
+    def sync_allowed(self, user_ids: Iterable[int], chat_ids: Iterable[int]) -> Dict[str, int]:
+        """
+        Deja la whitelist igual a la configuración: habilita estos ids y deshabilita
+        los demás (también los habilitados en tiempo de ejecución). Retorna cuántos
+        usuarios y chats se deshabilitaron.
+        """
+        revoked = {}
+        with self._lock:
+            with self._db:
+                for table, column, ids in (("users", "user_id", set(user_ids)), ("chats", "chat_id", set(chat_ids))):
+                    placeholders = ",".join("?" * len(ids))
+                    keep = f" AND {column} NOT IN ({placeholders})" if ids else ""
+                    cursor = self._db.execute(f"UPDATE {table} SET allowed = 0 WHERE allowed = 1{keep}", list(ids))
+                    revoked[table] = cursor.rowcount
+                    self._db.executemany(
+                        f"INSERT INTO {table} ({column}, allowed) VALUES (?, 1) "
+                        f"ON CONFLICT({column}) DO UPDATE SET allowed = 1",
+                        [(entity_id,) for entity_id in ids]
+                    )
+        self._allowed_cache.clear()
+        return revoked
+
+    def _set_allowed(self, table: str, column: str, entity_id: int, allowed: bool):
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    f"INSERT INTO {table} ({column}, allowed) VALUES (?, ?) "
+                    f"ON CONFLICT({column}) DO UPDATE SET allowed = excluded.allowed",
+                    (entity_id, int(allowed))
+                )
+        self._allowed_cache.set((table, entity_id), allowed)
+
+    def _lookup_allowed(self, table: str, column: str, entity_id: int) -> bool:
+        with self._lock:
+            row = self._db.execute(f"SELECT allowed FROM {table} WHERE {column} = ?", (entity_id,)).fetchone()
+        return bool(row and row[0])
+
+    async def _is_allowed(self, table: str, column: str, entity_id: int) -> bool:
+        """Read-through: cache en memoria y, en un miss, lookup por clave primaria."""
+        allowed = self._allowed_cache.get((table, entity_id), MISSING)
+        if allowed is MISSING:
+            allowed = await asyncio.to_thread(self._lookup_allowed, table, column, entity_id)
+            self._allowed_cache.set((table, entity_id), allowed)
+        return allowed
+
+    async def is_allowed(self, user_id: int, chat_id: int) -> bool:
+        """Un mensaje está autorizado si su usuario o su chat están en la whitelist."""
+        return await self._is_allowed("users", "user_id", user_id) or await self._is_allowed("chats", "chat_id", chat_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño del repositorio y métricas de la cache de whitelist."""
+        with self._lock:
+            users = self._db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+            chats = self._db.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+        return {"users": users, "chats": chats, "whitelist_cache": self._allowed_cache.stats()}
+
+    def close(self):
+        """Cierra la base SQLite."""
+        with self._lock:
+            self._db.close()
@@ -1,18 +1,30 @@
-from pydantic import BaseModel, Field
+from dataclasses import asdict, dataclass
+from functools import lru_cache
 from typing import Optional
-from datetime import datetime
+from pydantic import TypeAdapter
 
+# Los mensajes se construyen una vez por update: son dataclasses con __slots__ (sin
+# validación ni copias) con solo los campos que usa el pipeline. La validación de
+# tipos con Pydantic es opcional (TELEGRAM_VALIDATE_UPDATES), ver validate().
 
-class TelegramUser(BaseModel):
+
+@dataclass(slots=True)
+class TelegramUser:
     """Modelo para usuario de Telegram"""
     user_id: int
     username: Optional[str] = None
-    user_first_name: str
+    user_first_name: str = "Unknown"
     user_last_name: Optional[str] = None
-    user_full_name: str
     user_language_code: Optional[str] = None
     is_bot: bool = False
 
+    @property
+    def user_full_name(self) -> str:
+        """Nombre y apellido (se arma solo cuando se usa)"""
+        if self.user_last_name:
+            return f"{self.user_first_name} {self.user_last_name}"
+        return self.user_first_name
+
     def get_display_name(self) -> str:
         """Retorna el nombre para mostrar (username o nombre completo)"""
         return self.username if self.username else self.user_full_name
@@ -20,38 +32,37 @@ class TelegramUser(BaseModel):
     @classmethod
     def from_telegram_data(cls, from_data: dict) -> 'TelegramUser':
         """Crea un usuario desde los datos de Telegram API"""
-        full_name = from_data.get("first_name", "")
-        if from_data.get("last_name"):
-            full_name += f" {from_data.get('last_name')}"
-
+        get = from_data.get
         return cls(
-            user_id=from_data["id"],
-            username=from_data.get("username"),
-            user_first_name=from_data.get("first_name", "Unknown"),
-            user_last_name=from_data.get("last_name"),
-            user_full_name=full_name,
-            user_language_code=from_data.get("language_code"),
-            is_bot=from_data.get("is_bot", False)
+            from_data["id"],
+            get("username"),
+            get("first_name", "Unknown"),
+            get("last_name"),
+            get("language_code"),
+            get("is_bot", False)
         )
 
 
-class TelegramChat(BaseModel):
+@dataclass(slots=True)
+class TelegramChat:
     """Modelo para chat/grupo de Telegram"""
     chat_id: int
-    chat_type: str  # "private", "group", "supergroup", "channel"
+    chat_type: str = "unknown"  # "private", "group", "supergroup", "channel"
     chat_title: Optional[str] = None
 
     @classmethod
     def from_telegram_data(cls, chat_data: dict) -> 'TelegramChat':
         """Crea un chat desde los datos de Telegram API"""
-        return cls(
-            chat_id=chat_data["id"],
-            chat_type=chat_data.get("type", "unknown"),
-            chat_title=chat_data.get("title")
-        )
+        return cls(chat_data["id"], chat_data.get("type", "unknown"), chat_data.get("title"))
+
+
+@lru_cache(maxsize=None)
+def _adapter(model: type) -> TypeAdapter:
+    return TypeAdapter(model)
 
 
-class TelegramBaseMessage(BaseModel):
+@dataclass(slots=True)
+class TelegramBaseMessage:
     """Modelo base para mensajes de Telegram"""
     update_id: int
     message_id: int
@@ -59,11 +70,15 @@ class TelegramBaseMessage(BaseModel):
     user: TelegramUser
     chat: TelegramChat
 
-    class Config:
-        # Permite campos extra sin error
-        extra = 'ignore'
+    def validate(self):
+        """
+        Valida los tipos de todos los campos con Pydantic. Lanza
+        pydantic.ValidationError si el update no tiene la forma esperada.
+        """
+        _adapter(type(self)).validate_python(asdict(self))
 
 
+@dataclass(slots=True)
 class TelegramTextMessage(TelegramBaseMessage):
     """Modelo para mensajes de texto"""
     text: str
@@ -74,18 +89,20 @@ class TelegramTextMessage(TelegramBaseMessage):
         message = update.get("message", {})
 
         return cls(
-            update_id=update["update_id"],
-            message_id=message["message_id"],
-            text=message["text"],
-            date=message.get("date"),
-            user=TelegramUser.from_telegram_data(message.get("from", {})),
-            chat=TelegramChat.from_telegram_data(message.get("chat", {}))
+            update["update_id"],
+            message["message_id"],
+            message.get("date"),
+            TelegramUser.from_telegram_data(message.get("from", {})),
+            TelegramChat.from_telegram_data(message.get("chat", {})),
+            message["text"]
         )
 
 
+@dataclass(slots=True)
 class TelegramAudioMessage(TelegramBaseMessage):
     """Modelo para mensajes de audio/voz"""
     file_id: str
+    file_unique_id: Optional[str] = None  # Igual para reenvíos del mismo archivo (clave de cache)
     duration: Optional[int] = None
 
     @classmethod
@@ -95,11 +112,12 @@ class TelegramAudioMessage(TelegramBaseMessage):
         audio_info = message.get("voice") or message.get("audio")
 
         return cls(
-            update_id=update["update_id"],
-            message_id=message["message_id"],
-            file_id=audio_info["file_id"],
-            duration=audio_info.get("duration"),
-            date=message.get("date"),
-            user=TelegramUser.from_telegram_data(message.get("from", {})),
-            chat=TelegramChat.from_telegram_data(message.get("chat", {}))
+            update["update_id"],
+            message["message_id"],
+            message.get("date"),
+            TelegramUser.from_telegram_data(message.get("from", {})),
+            TelegramChat.from_telegram_data(message.get("chat", {})),
+            audio_info["file_id"],
+            audio_info.get("file_unique_id"),
+            audio_info.get("duration")
         )
@@ -0,0 +1,264 @@
+import asyncio
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+from src.utils.metrics import stage
+from src.utils.stats import LatencyWindow
+
+logger = setup_logger(__name__)
+
+STAGES = ("queue", "probe", "transcode", "segment")
+
+
+@dataclass
+class PreprocessResult:
+    """Resultado del preprocesamiento de un audio."""
+    path: str
+    bytes_in: int
+    bytes_out: int
+    duration_in: Optional[float] = None
+    duration_out: Optional[float] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def segment_starts(duration: float, length: float, overlap: float) -> List[float]:
+    """
+    Inicios de los segmentos de `length` segundos que cubren el audio, cada uno
+    solapado `overlap` segundos con el anterior (Settings.validate exige overlap < length).
+    """
+    step = length - overlap
+    if step <= 0:
+        raise ValueError(f"El solapamiento ({overlap}s) debe ser menor que el segmento ({length}s)")
+    starts = [0.0]
+    while starts[-1] + length < duration:
+        starts.append(starts[-1] + step)
+    return starts
+
+
+def _probe_duration(ffprobe: str, path: str) -> Optional[float]:
+    """Duración en segundos según ffprobe (None si no se pudo leer)."""
+    completed = subprocess.run(
+        [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True, text=True, timeout=30
+    )
+    try:
+        return float(completed.stdout.strip())
+    except ValueError:
+        return None
+
+
+def _build_filters(options: Dict[str, Any]) -> List[str]:
+    filters = []
+    if options["trim_silence"]:
+        # silenceremove solo recorta el principio: se invierte el audio para recortar el final
+        trim = (
+            f"silenceremove=start_periods=1:start_threshold={options['silence_threshold_db']}dB"
+            f":start_silence={options['silence_min']}"
+        )
+        filters += [trim, "areverse", trim, "areverse"]
+    return filters
+
+
+def _preprocess_file(input_path: str, output_path: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Corre en un proceso del pool: mide la duración, recorta silencios, limita la
+    duración y recodifica a mono/sample rate compacto con una sola pasada de ffmpeg.
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    duration_in = _probe_duration(options["ffprobe"], input_path)
+    timings["probe"] = time.perf_counter() - started
+
+    command = [options["ffmpeg"], "-v", "error", "-y", "-i", input_path]
+    filters = _build_filters(options)
+    if filters:
+        command += ["-af", ",".join(filters)]
+    if options["max_duration"]:
+        command += ["-t", str(options["max_duration"])]
+    command += _encode_args(options) + [output_path]
+
+    started = time.perf_counter()
+    subprocess.run(command, capture_output=True, check=True, timeout=options["timeout"])
+    timings["transcode"] = time.perf_counter() - started
+
+    return {
+        "duration_in": duration_in,
+        "duration_out": _probe_duration(options["ffprobe"], output_path),
+        "bytes_in": os.path.getsize(input_path),
+        "bytes_out": os.path.getsize(output_path),
+        "timings": timings,
+    }
+
+
+def _encode_args(options: Dict[str, Any]) -> List[str]:
+    args = []
+    if options["mono"]:
+        args += ["-ac", "1"]
+    if options["sample_rate"]:
+        args += ["-ar", str(options["sample_rate"])]
+    return args + ["-c:a", options["codec"], "-b:a", options["bitrate"]]
+
+
+def _cut_segment(input_path: str, output_path: str, start: float, length: float, options: Dict[str, Any]) -> float:
+    """Corre en un proceso del pool: extrae [start, start + length) del audio. Retorna lo que tardó."""
+    started = time.perf_counter()
+    command = [options["ffmpeg"], "-v", "error", "-y", "-ss", str(start), "-t", str(length), "-i", input_path]
+    subprocess.run(command + _encode_args(options) + [output_path], capture_output=True, check=True, timeout=options["timeout"])
+    return time.perf_counter() - started
+
+
+class AudioPreprocessor:
+    """
+    Etapa de preprocesamiento entre la descarga y la transcripción (requiere ffmpeg).
+
+    El trabajo corre en un ProcessPoolExecutor (AUDIO_PREPROCESS_WORKERS procesos)
+    para no bloquear el event loop: recorte de silencios al principio y al final,
+    límite de duración (AUDIO_MAX_DURATION con política "truncate") y recodificación
+    a mono con sample rate y bitrate reducidos, lo que achica el upload y el tiempo
+    de transcripción. Se registran los tiempos de cada etapa (espera en el pool,
+    ffprobe y ffmpeg) y los bytes antes/después.
+
+    También corta los audios largos en segmentos (cut) para transcribirlos en
+    paralelo.
+
+    Si ffmpeg no está instalado la etapa queda deshabilitada; si falla para un
+    audio, se transcribe el original.
+    """
+
+    def __init__(self):
+        self.ffmpeg = shutil.which(settings.FFMPEG_PATH)
+        self.ffprobe = shutil.which(settings.FFPROBE_PATH)
+        available = bool(self.ffmpeg and self.ffprobe)
+        self.enabled = settings.AUDIO_PREPROCESS_ENABLED and available
+        self.can_segment = settings.AUDIO_SEGMENT_ENABLED and available
+        if not available:
+            # El preprocesamiento es opt-in: sin ffmpeg es un error de configuración.
+            # La segmentación viene activa por defecto, así que solo se informa.
+            if settings.AUDIO_PREPROCESS_ENABLED:
+                logger.warning("No se encontró ffmpeg/ffprobe: el preprocesamiento y la segmentación de audio quedan deshabilitados")
+            elif settings.AUDIO_SEGMENT_ENABLED:
+                logger.info("No se encontró ffmpeg/ffprobe: los audios largos se transcriben sin segmentar")
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._timings = {stage: LatencyWindow() for stage in STAGES}
+        self.processed = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds_removed = 0.0
+
+    def _options(self) -> Dict[str, Any]:
+        truncate = settings.AUDIO_MAX_DURATION_POLICY == "truncate"
+        return {
+            "ffmpeg": self.ffmpeg,
+            "ffprobe": self.ffprobe,
+            "trim_silence": settings.AUDIO_TRIM_SILENCE,
+            "silence_threshold_db": settings.AUDIO_SILENCE_THRESHOLD_DB,
+            "silence_min": settings.AUDIO_SILENCE_MIN,
+            "max_duration": settings.AUDIO_MAX_DURATION if truncate else 0,
+            "mono": settings.AUDIO_MONO,
+            "sample_rate": settings.AUDIO_RESAMPLE_RATE,
+            "codec": settings.AUDIO_OUTPUT_CODEC,
+            "bitrate": settings.AUDIO_OUTPUT_BITRATE,
+            "timeout": settings.AUDIO_PREPROCESS_TIMEOUT,
+        }
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=settings.AUDIO_PREPROCESS_WORKERS)
+        return self._pool
+
+    async def probe_duration(self, path: str) -> Optional[float]:
+        """Duración del audio en segundos (None si ffprobe no pudo leerla)."""
+        return await asyncio.get_running_loop().run_in_executor(self._get_pool(), _probe_duration, self.ffprobe, path)
+
+    async def cut(self, path: str, start: float, length: float, index: int) -> str:
+        """
+        Extrae un segmento del audio (recodificado igual que en process). Retorna el
+        path del archivo nuevo, que el llamador debe eliminar.
+        """
+        output_path = f"{os.path.splitext(path)[0]}.seg{index}.ogg"
+        try:
+            async with stage("segment"):
+                seconds = await asyncio.get_running_loop().run_in_executor(
+                    self._get_pool(), _cut_segment, path, output_path, start, length, self._options()
+                )
+        except BaseException:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise
+        self._timings["segment"].add(seconds)
+        return output_path
+
+    async def process(self, path: str) -> Optional[PreprocessResult]:
+        """
+        Preprocesa un audio en disco. Retorna el resultado (con el path del archivo
+        nuevo, que el llamador debe eliminar) o None si falló.
+        """
+
+        output_path = f"{os.path.splitext(path)[0]}.pre.ogg"
+        started = time.perf_counter()
+        try:
+            async with stage("preprocess"):
+                info = await asyncio.get_running_loop().run_in_executor(
+                    self._get_pool(), _preprocess_file, path, output_path, self._options()
+                )
+        except (subprocess.SubprocessError, OSError, BrokenProcessPool) as e:
+            self.failed += 1
+            logger.warning(f"Falló el preprocesamiento de {path}, se usa el audio original: {e}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return None
+
+        timings = info["timings"]
+        timings["queue"] = max(0.0, time.perf_counter() - started - sum(timings.values()))
+        for name, seconds in timings.items():
+            self._timings[name].add(seconds)
+
+        self.processed += 1
+        self.bytes_in += info["bytes_in"]
+        self.bytes_out += info["bytes_out"]
+        if info["duration_in"] and info["duration_out"] is not None:
+            self.seconds_removed += max(0.0, info["duration_in"] - info["duration_out"])
+
+        result = PreprocessResult(
+            path=output_path,
+            bytes_in=info["bytes_in"],
+            bytes_out=info["bytes_out"],
+            duration_in=info["duration_in"],
+            duration_out=info["duration_out"],
+            timings=timings,
+        )
+        logger.info(
+            f"Audio preprocesado: {result.bytes_in} -> {result.bytes_out} bytes, "
+            f"{result.duration_in}s -> {result.duration_out}s, "
+            + ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings.items())
+        )
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Audios procesados, bytes ahorrados, segundos recortados y tiempos por etapa."""
+        return {
+            "enabled": self.enabled,
+            "segmentation": self.can_segment,
+            "processed": self.processed,
+            "failed": self.failed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "seconds_removed": round(self.seconds_removed, 1),
+            "timings": {stage: window.summary() for stage, window in self._timings.items()},
+        }
+
+    def close(self):
+        """Detiene el pool de procesos."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,313 @@
+import asyncio
+import time
+import aiohttp
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+from src.utils.rate_limiter import TokenBucket
+from src.utils.stats import LatencyWindow
+
+logger = setup_logger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096  # Límite de Telegram para el texto de sendMessage
+RETRYABLE_STATUS = (502, 503, 504)  # Errores de gateway: Telegram no procesó el mensaje
+MAX_BACKOFF = 30.0
+
+
+class RetryAfter(Exception):
+    """Telegram respondió 429: no se puede volver a enviar hasta pasados retry_after segundos."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too Many Requests: retry after {retry_after}")
+        self.retry_after = retry_after
+
+
+def _utf16_len(text: str) -> int:
+    # Telegram mide el largo de los mensajes en unidades UTF-16 (un emoji puede contar 2)
+    return len(text.encode("utf-16-le")) // 2
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Divide un texto en partes de hasta `limit` caracteres, cortando preferentemente
+    en un párrafo, una línea o un espacio.
+    """
+    parts = []
+    while _utf16_len(text) > limit:
+        cut = min(len(text), limit)
+        while _utf16_len(text[:cut]) > limit:
+            # Cada caracter ocupa 1 o 2 unidades: se recorta de a la mitad del exceso
+            cut -= (_utf16_len(text[:cut]) - limit + 1) // 2
+
+        window = text[:cut]
+        for separator in ("\n\n", "\n", " "):
+            index = window.rfind(separator)
+            if index > cut // 2:
+                cut = index + len(separator)
+                break
+
+        part = text[:cut].rstrip()
+        if part:
+            parts.append(part)
+        text = text[cut:].lstrip()
+    if text or not parts:
+        parts.append(text)
+    return parts
+
+
+@dataclass
+class _Outgoing:
+    """Mensaje en la cola de salida de un chat."""
+    chat_id: Any
+    text: str
+    reply_to_message_id: Optional[int]
+    method: str = "sendMessage"
+    message_id: Optional[int] = None  # Mensaje a editar/borrar
+    enqueued_at: float = field(default_factory=time.monotonic)
+    futures: List[asyncio.Future] = field(default_factory=list)
+
+
+class DeliveryService:
+    """
+    Entrega de mensajes salientes respetando los límites de Telegram.
+
+    Cada chat tiene su cola FIFO y su token bucket (OUTBOUND_CHAT_RATE en privados,
+    OUTBOUND_GROUP_RATE en grupos), y todos comparten un bucket global
+    (OUTBOUND_GLOBAL_RATE). Un envío espera su turno en ambos en lugar de salir de
+    inmediato, así una ráfaga de respuestas no termina en una tormenta de 429.
+
+    Reintentos idempotentes: solo se reintenta cuando se sabe que Telegram no
+    procesó el mensaje (429 respetando retry_after, errores de gateway y fallas de
+    conexión antes de enviar). Un timeout o un corte a mitad de la respuesta no se
+    reintenta, porque el mensaje pudo haberse entregado y se duplicaría.
+
+    Con OUTBOUND_COALESCE, los mensajes que se acumulan en la cola de un chat
+    mientras espera su turno se unen en un solo envío (hasta 4096 caracteres).
+    """
+
+    def __init__(self, send: Callable[[str, dict], Awaitable[dict]]):
+        """
+        Args:
+            send: Corrutina que hace el POST a un método de la Bot API (sendMessage,
+                  editMessageText, deleteMessage) con un payload y retorna el
+                  resultado; lanza RetryAfter ante un 429
+        """
+        self._send = send
+        self._global_bucket = TokenBucket(settings.OUTBOUND_GLOBAL_RATE, settings.OUTBOUND_GLOBAL_BURST)
+        self._buckets: Dict[Any, TokenBucket] = {}
+        self._queues: Dict[Any, Deque[_Outgoing]] = {}
+        self._tasks: Dict[Any, asyncio.Task] = {}
+        self._latency = LatencyWindow()
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled = 0
+        self.coalesced = 0
+        self.split = 0
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= settings.OUTBOUND_MAX_TRACKED_CHATS:
+                self._prune_buckets()
+            # En Telegram los ids de grupos y canales son negativos
+            if str(chat_id).startswith("-"):
+                bucket = TokenBucket(settings.OUTBOUND_GROUP_RATE, settings.OUTBOUND_GROUP_BURST)
+            else:
+                bucket = TokenBucket(settings.OUTBOUND_CHAT_RATE, settings.OUTBOUND_CHAT_BURST)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_buckets(self):
+        """Descarta los buckets de chats sin cola y ya repuestos (no guardan estado útil)."""
+        for chat_id in [c for c, b in self._buckets.items() if c not in self._queues and b.is_idle()]:
+            del self._buckets[chat_id]
+
+    def enqueue(self, chat_id, text: str, reply_to_message_id: Optional[int] = None) -> List[asyncio.Future]:
+        """
+        Encola un mensaje (partido en varios si supera el límite de Telegram). Retorna
+        un future por parte, que se resuelve en el mensaje enviado o None si se descartó.
+        """
+        parts = split_message(text)
+        if len(parts) > 1:
+            self.split += 1
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for index, part in enumerate(parts):
+            # Solo la primera parte responde al mensaje original
+            reply_to = reply_to_message_id if index == 0 else None
+            future = loop.create_future()
+            futures.append(future)
+            self._push(_Outgoing(chat_id, part, reply_to, futures=[future]))
+        return futures
+
+    def enqueue_edit(self, chat_id, message_id: int, text: str) -> asyncio.Future:
+        """
+        Encola la edición de un mensaje ya enviado (se trunca al límite de Telegram).
+        Si ya hay una edición pendiente del mismo mensaje se reemplaza su texto: solo
+        se envía la última versión.
+        """
+        text = split_message(text)[0]
+        future = asyncio.get_running_loop().create_future()
+        for pending in self._queues.get(chat_id, ()):
+            if pending.method == "editMessageText" and pending.message_id == message_id:
+                pending.text = text
+                pending.futures.append(future)
+                self.coalesced += 1
+                return future
+        self._push(_Outgoing(chat_id, text, None, method="editMessageText", message_id=message_id, futures=[future]))
+        return future
+
+    def enqueue_delete(self, chat_id, message_id: int) -> asyncio.Future:
+        """Encola el borrado de un mensaje enviado."""
+        future = asyncio.get_running_loop().create_future()
+        self._push(_Outgoing(chat_id, "", None, method="deleteMessage", message_id=message_id, futures=[future]))
+        return future
+
+    def _push(self, message: _Outgoing):
+        """Agrega un envío a la cola de su chat y arranca su drenado si hace falta."""
+        queue = self._queues.setdefault(message.chat_id, deque())
+        if len(queue) >= settings.OUTBOUND_CHAT_QUEUE_MAXSIZE:
+            self.dropped += 1
+            logger.warning(f"Cola de salida llena para el chat {message.chat_id}: se descarta un mensaje")
+            for future in message.futures:
+                future.set_result(None)
+            if not queue:
+                self._queues.pop(message.chat_id, None)
+            return
+
+        queue.append(message)
+        if message.chat_id not in self._tasks:
+            self._tasks[message.chat_id] = asyncio.create_task(self._drain(message.chat_id))
+
+    def _coalesce(self, message: _Outgoing, queue: Deque[_Outgoing]):
+        """Une al mensaje los siguientes de la cola mientras entren en un solo envío."""
+        if message.method != "sendMessage":
+            return
+        while (
+            queue
+            and queue[0].method == "sendMessage"
+            and _utf16_len(message.text) + 2 + _utf16_len(queue[0].text) <= MAX_MESSAGE_LENGTH
+        ):
+            following = queue.popleft()
+            message.text = f"{message.text}\n\n{following.text}"
+            message.futures.extend(following.futures)
+            message.reply_to_message_id = message.reply_to_message_id or following.reply_to_message_id
+            self.coalesced += 1
+
+    async def _drain(self, chat_id):
+        """Envía en orden los mensajes de un chat, respetando sus límites."""
+        queue = self._queues[chat_id]
+        message: Optional[_Outgoing] = None
+        try:
+            while queue:
+                message = queue.popleft()
+                bucket = self._bucket(chat_id)
+                waited = bucket.delay() > 0
+                await bucket.acquire()
+                if settings.OUTBOUND_COALESCE and waited:
+                    # Mientras se esperaba el turno pudieron llegar más mensajes del chat
+                    self._coalesce(message, queue)
+                await self._global_bucket.acquire()
+
+                result = await self._deliver(message, bucket)
+                for future in message.futures:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            # Si se canceló (apagado), lo que quedaba sin enviar se resuelve como descartado
+            for unsent in ([message] if message else []) + list(queue):
+                for future in unsent.futures:
+                    if not future.done():
+                        future.set_result(None)
+            self._queues.pop(chat_id, None)
+            self._tasks.pop(chat_id, None)
+
+    async def _deliver(self, message: _Outgoing, bucket: TokenBucket) -> Optional[dict]:
+        """Envía un mensaje, reintentando solo cuando Telegram seguro no lo procesó."""
+        payload: dict[str, str | int] = {"chat_id": message.chat_id}
+        if message.method != "deleteMessage":
+            payload["text"] = message.text
+        if message.message_id:
+            payload["message_id"] = message.message_id
+        if message.reply_to_message_id:
+            payload["reply_to_message_id"] = message.reply_to_message_id
+
+        attempt = 0
+        while True:
+            try:
+                result = await self._send(message.method, payload)
+                self.delivered += 1
+                self._latency.add(time.monotonic() - message.enqueued_at)
+                return result
+
+            except RetryAfter as e:
+                self.throttled += 1
+                wait = e.retry_after
+                logger.warning(f"Telegram limitó los envíos al chat {message.chat_id}: reintento en {wait}s")
+                bucket.block(wait)
+
+            except aiohttp.ClientResponseError as e:
+                if e.status not in RETRYABLE_STATUS:
+                    self.failed += 1
+                    logger.error(f"Error al enviar mensaje (HTTP {e.status}): {e.message}")
+                    return None
+                wait = min(MAX_BACKOFF, 2 ** attempt)
+
+            except aiohttp.ClientConnectorError as e:
+                # No se llegó a conectar: el mensaje no salió
+                wait = min(MAX_BACKOFF, 2 ** attempt)
+                logger.warning(f"Error de conexión al enviar mensaje: {e}")
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.failed += 1
+                logger.error(f"Error al enviar mensaje (no se reintenta, pudo haberse entregado): {e!r}")
+                return None
+
+            attempt += 1
+            if attempt > settings.OUTBOUND_MAX_RETRIES:
+                self.failed += 1
+                logger.error(f"Se agotaron los reintentos al enviar mensaje al chat {message.chat_id}")
+                return None
+
+            self.retries += 1
+            await asyncio.sleep(wait)
+            await bucket.acquire()
+            await self._global_bucket.acquire()
+
+    @property
+    def pending(self) -> int:
+        """Mensajes encolados que todavía no se enviaron."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de entrega: enviados, descartados, 429, reintentos y latencia."""
+        latency = self._latency.summary()
+        return {
+            "pending": self.pending,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "coalesced": self.coalesced,
+            "split": self.split,
+            "latency_p50": latency["p50"],
+            "latency_p99": latency["p99"],
+        }
+
+    async def close(self, drain_timeout: Optional[float] = None):
+        """Espera (hasta drain_timeout) a que se envíe lo encolado y descarta el resto."""
+        tasks = list(self._tasks.values())
+        if tasks:
+            _, not_done = await asyncio.wait(tasks, timeout=drain_timeout)
+            if not_done:
+                logger.warning(f"Timeout drenando la cola de salida: se descartan {self.pending} mensajes")
+                self.dropped += self.pending
+                for task in not_done:
+                    task.cancel()
+                await asyncio.gather(*not_done, return_exceptions=True)
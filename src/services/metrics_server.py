@@ -0,0 +1,51 @@
+from typing import Optional
+from aiohttp import web
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+from src.utils.metrics import MetricsRegistry, registry as default_registry
+
+logger = setup_logger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsServer:
+    """
+    Endpoint HTTP de métricas en formato Prometheus (GET METRICS_PATH).
+
+    Cada scrape renderiza el registro en el momento: las métricas de etapas y los
+    stats() de los servicios registrados como collectors.
+    """
+
+    def __init__(self, port: int, metrics: Optional[MetricsRegistry] = None):
+        self.port = port
+        self.registry = metrics or default_registry
+        self._runner: Optional[web.AppRunner] = None
+        self.scrapes = 0
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.scrapes += 1
+        return web.Response(body=self.registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self) -> bool:
+        """
+        Levanta el servidor en segundo plano. Si no puede escuchar en el puerto (p. ej.
+        ya está ocupado) lo registra y el bot sigue sin endpoint de métricas.
+        """
+        app = web.Application()
+        app.router.add_get(settings.METRICS_PATH, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, settings.METRICS_HOST, self.port).start()
+        except OSError as e:
+            logger.error(f"No se pudo levantar el endpoint de métricas en {settings.METRICS_HOST}:{self.port}, se sigue sin él: {e}")
+            await self.stop()
+            return False
+        logger.info(f"Métricas en http://{settings.METRICS_HOST}:{self.port}{settings.METRICS_PATH}")
+        return True
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
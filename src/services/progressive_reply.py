@@ -0,0 +1,106 @@
+import asyncio
+import time
+from typing import Optional
+from src.config.settings import settings
+from src.services.delivery_service import split_message
+from src.services.telegram_service import TelegramService
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class ProgressiveReply:
+    """
+    Respuesta que se muestra de inmediato y se completa de a poco.
+
+    start envía un mensaje provisorio ("⏳ ..."), update lo edita con el avance
+    (transcripción lista, respuesta parcial en streaming) y finish deja el texto
+    final. Las ediciones intermedias se limitan a una cada PROGRESSIVE_EDIT_INTERVAL
+    segundos: si llegan más rápido, solo se envía la última versión. Si el texto
+    final supera el límite de Telegram, el resto sale en mensajes nuevos.
+
+    Registra cuánto tardó el usuario en ver algo (first_visible) y la respuesta
+    completa (complete), medidos desde que se creó la respuesta.
+    """
+
+    def __init__(self, telegram_service: TelegramService, chat_id, reply_to_message_id: Optional[int] = None):
+        self.telegram_service = telegram_service
+        self.chat_id = chat_id
+        self.reply_to_message_id = reply_to_message_id
+        self.message_id: Optional[int] = None
+        self.started_at = time.monotonic()
+        self.first_visible: Optional[float] = None
+        self.complete: Optional[float] = None
+        self._last_edit = 0.0
+        self._pending: Optional[str] = None
+        self._timer: Optional[asyncio.Task] = None
+
+    async def start(self, text: str):
+        """Envía el mensaje provisorio."""
+        self.message_id = await self.telegram_service.send_placeholder(
+            text,
+            reply_to_message_id=self.reply_to_message_id,
+            chat_id=self.chat_id
+        )
+        if self.message_id is not None:
+            self.first_visible = time.monotonic() - self.started_at
+            self._last_edit = time.monotonic()
+
+    async def update(self, text: str):
+        """Muestra un avance (sin esperar la entrega). Se descarta si no hay mensaje provisorio."""
+        if self.message_id is None:
+            return
+        self._pending = text
+        wait = self._last_edit + settings.PROGRESSIVE_EDIT_INTERVAL - time.monotonic()
+        if wait <= 0:
+            await self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later(wait))
+
+    async def _flush_later(self, wait: float):
+        await asyncio.sleep(wait)
+        self._timer = None
+        await self._flush()
+
+    async def _flush(self):
+        if self._pending is None:
+            return
+        text, self._pending = self._pending, None
+        self._last_edit = time.monotonic()
+        await self.telegram_service.edit_message(self.message_id, text, chat_id=self.chat_id, wait=False)
+
+    def _cancel_timer(self):
+        self._pending = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def finish(self, text: str) -> bool:
+        """
+        Deja el texto final. Si no hubo mensaje provisorio (o no se pudo editar) se
+        envía como una respuesta normal.
+        """
+        self._cancel_timer()
+        if self.message_id is None:
+            sent = await self._send(text, self.reply_to_message_id)
+        else:
+            first, *rest = split_message(text)
+            sent = await self.telegram_service.edit_message(self.message_id, first, chat_id=self.chat_id)
+            if not sent:
+                logger.warning(f"No se pudo editar el mensaje {self.message_id}: se envía la respuesta completa")
+                sent = await self._send(text, self.reply_to_message_id)
+            elif rest:
+                sent = await self._send("\n\n".join(rest), None)
+
+        self.complete = time.monotonic() - self.started_at
+        return sent
+
+    async def abort(self):
+        """Borra el mensaje provisorio (p. ej. antes de responder con un error)."""
+        self._cancel_timer()
+        if self.message_id is not None:
+            await self.telegram_service.delete_message(self.message_id, chat_id=self.chat_id)
+            self.message_id = None
+
+    async def _send(self, text: str, reply_to_message_id: Optional[int]) -> bool:
+        return await self.telegram_service.send_message(text, reply_to_message_id=reply_to_message_id, chat_id=self.chat_id)
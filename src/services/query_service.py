@@ -1,31 +1,128 @@
+import json
+import re
+import unicodedata
 import aiohttp
-from typing import Dict, Any, Optional
+from typing import Any, Awaitable, Callable, Dict, Optional
 from src.config.settings import settings
+from src.utils.cache import TTLCache
+from src.utils.singleflight import SingleFlight
 from src.utils.logger import setup_logger
+from src.utils.metrics import stage
+from src.utils.http_client import HttpClient, http_client as shared_http_client
+from src.utils.resilience import ResilientBackend
 
 logger = setup_logger(__name__)
 
+PartialCallback = Callable[[str], Awaitable[None]]
+STREAM_CONTENT_TYPES = ('text/event-stream', 'application/x-ndjson')
+
+# Preguntas que dependen de la conversación previa ("¿y eso?", "explicame más"): nunca se cachean
+DEFAULT_FOLLOWUP_PATTERN = (
+    r"^(y|pero|entonces|tambien|ademas|ok|vale|dale|si|no)\b"
+    r"|\b(eso|esto|esa|ese|aquello|anterior|lo de|mas detalle|explica(me)? mas|otra vez|de nuevo)\b"
+)
+
+
+def normalize_question(question: str) -> str:
+    """Normaliza una pregunta para usarla como clave: minúsculas, sin acentos ni puntuación, espacios colapsados."""
+    text = unicodedata.normalize('NFKD', question.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
 
 class QueryService:
 
-    def __init__(self):
+    def __init__(self, http_client: Optional[HttpClient] = None):
         self.api_url = settings.QUERY_SYSTEM_URL
-        self._session: Optional[aiohttp.ClientSession] = None
+        self.http_client = http_client or shared_http_client
         #self.api_key = settings.QUERY_SYSTEM_API_KEY
 
+        # Cache de respuestas (opt-in): "off", "global" o "session"
+        self.cache_scope = settings.QUERY_CACHE_SCOPE
+        self._cache = TTLCache(settings.QUERY_CACHE_SIZE, settings.QUERY_CACHE_TTL)
+        self._single_flight = SingleFlight()
+        self._followup_re = re.compile(settings.QUERY_CACHE_FOLLOWUP_PATTERN or DEFAULT_FOLLOWUP_PATTERN)
+        self._stateful_sessions = set(settings.QUERY_CACHE_STATEFUL_SESSIONS)
+        self.cache_bypassed = 0
+
+        # Circuit breaker, límite de concurrencia adaptativo y reintentos con presupuesto QUERY_TIMEOUT.
+        # El sistema guarda la conversación por sesión: una query repetida tras un 502/504 podría duplicarse
+        self.backend = ResilientBackend(
+            "queries",
+            timeout=settings.QUERY_TIMEOUT,
+            retries=settings.QUERY_RETRIES,
+            max_concurrency=settings.QUERY_MAX_CONCURRENCY,
+            idempotent=False
+        )
+
     async def _get_session(self) -> aiohttp.ClientSession:
-        """Obtiene o crea la sesión de aiohttp."""
-        if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession()
-        return self._session
-
-    async def close(self):
-        """Cierra la sesión de aiohttp."""
-        if self._session and not self._session.closed:
-            await self._session.close()
-
-    async def send_query(self, question: str, session_id: str = "telegram-bot-session", retries: int = 0) -> Dict[str, Any]:
-        """Envía una query al sistema destino y retorna la respuesta."""
+        """Obtiene la sesión de aiohttp compartida."""
+        return await self.http_client.get_session()
+
+    def _cache_key(self, question: str, session_id: str) -> Optional[tuple]:
+        """Clave de cache de una query, o None si no debe cachearse."""
+        if self.cache_scope not in ("global", "session") or session_id in self._stateful_sessions:
+            return None
+
+        normalized = normalize_question(question)
+        if not normalized or self._followup_re.search(normalized):
+            self.cache_bypassed += 1
+            return None
+
+        return (normalized,) if self.cache_scope == "global" else (session_id, normalized)
+
+    async def send_query(
+        self,
+        question: str,
+        session_id: str = "telegram-bot-session",
+        retries: int = 0,
+        on_partial: Optional[PartialCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Envía una query al sistema destino y retorna la respuesta.
+
+        Con QUERY_CACHE_SCOPE activo, las respuestas exitosas se cachean por pregunta
+        normalizada (global o por session_id) y las preguntas idénticas concurrentes
+        comparten una sola request. Las preguntas de seguimiento y las sesiones de
+        QUERY_CACHE_STATEFUL_SESSIONS siempre van al sistema.
+
+        Con QUERY_STREAMING_ENABLED y on_partial, se pide la respuesta en streaming
+        y on_partial recibe el texto acumulado a medida que llega.
+        """
+        async with stage("query"):
+            key = self._cache_key(question, session_id)
+            if key is None:
+                return await self._send_query(question, session_id, on_partial)
+
+            cached = self._cache.get(key)
+            if cached is not None:
+                logger.info("Respuesta en cache para: %s", question)
+                return dict(cached)
+
+            async def fetch():
+                result = await self._send_query(question, session_id, on_partial)
+                self._cache.set(key, result)
+                return result
+
+            return dict(await self._single_flight.do(key, fetch))
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Métricas de la cache de respuestas y de la coalescencia de requests."""
+        return {
+            "scope": self.cache_scope,
+            **self._cache.stats(),
+            "bypassed": self.cache_bypassed,
+            "backend_calls": self._single_flight.calls,
+            "coalesced": self._single_flight.shared,
+        }
+
+    async def _send_query(self, question: str, session_id: str, on_partial: Optional[PartialCallback] = None) -> Dict[str, Any]:
+        """Envía la query a través de la capa de resiliencia del backend."""
+        return await self.backend.call(self._post_query, question, session_id, on_partial)
+
+    async def _post_query(self, question: str, session_id: str, on_partial: Optional[PartialCallback] = None) -> Dict[str, Any]:
+        """Hace la request al sistema de queries. Solo retorna respuestas con success: true."""
         headers = {'Content-Type': 'application/json'}
         #if self.api_key:
         #    headers['Authorization'] = f'Bearer {self.api_key}'
@@ -35,7 +132,12 @@ class QueryService:
             'session_id': session_id
         }
 
-        logger.info(f"Enviando query al sistema: {question}...")
+        streaming = on_partial is not None and settings.QUERY_STREAMING_ENABLED
+        if streaming:
+            payload['stream'] = True
+            headers['Accept'] = 'text/event-stream, application/x-ndjson, application/json'
+
+        logger.info("Enviando query al sistema: %s", question)
 
         session = await self._get_session()
 
@@ -43,15 +145,54 @@ class QueryService:
             self.api_url,
             json=payload,
             headers=headers,
-            timeout=aiohttp.ClientTimeout(total=30)
+            timeout=aiohttp.ClientTimeout(total=settings.QUERY_TIMEOUT)
         ) as response:
             response.raise_for_status()
-            result = await response.json()
+            if streaming and response.content_type in STREAM_CONTENT_TYPES:
+                result = await self._read_stream(response, on_partial)
+            else:
+                # El sistema puede ignorar "stream" y responder el JSON completo
+                result = await response.json()
 
             # Validar que la respuesta sea exitosa
             if not result.get('success'):
                 error_msg = result.get('error', 'Unknown error')
                 raise ValueError(f"Query failed: {error_msg}")
 
-            logger.info(f"Query procesada exitosamente. Answer: {result.get('answer')}")
-            return result
\ No newline at end of file
+            logger.info("Query procesada exitosamente. Answer: %s", result.get('answer'))
+            return result
+
+    @staticmethod
+    async def _read_stream(response: aiohttp.ClientResponse, on_partial: PartialCallback) -> Dict[str, Any]:
+        """
+        Lee una respuesta en streaming: SSE ("data: {...}") o JSON por línea. Cada
+        evento trae {"delta": "..."} (texto nuevo) o {"answer": "..."} (texto
+        completo hasta el momento); el que trae "success" define el resultado final.
+        El stream termina al cerrarse o con "data: [DONE]".
+        """
+        sse = response.content_type == 'text/event-stream'
+        answer = ""
+        final: Dict[str, Any] = {}
+        async for raw_line in response.content:
+            line = raw_line.decode('utf-8').strip()
+            if sse:
+                if not line.startswith('data:'):
+                    continue
+                line = line[len('data:'):].strip()
+            if not line:
+                continue
+            if line == '[DONE]':
+                break
+
+            event = json.loads(line)
+            previous = answer
+            if 'delta' in event:
+                answer += event['delta'] or ""
+            elif 'answer' in event:
+                answer = event['answer'] or ""
+            if 'success' in event:
+                final = event
+            if answer != previous:
+                await on_partial(answer)
+
+        return {**final, 'success': final.get('success', True), 'answer': answer}
@@ -1,10 +1,18 @@
 import asyncio
 import aiohttp
+import logging
 import os
-from typing import Optional, List
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, List
 from src.config.settings import settings
-from src.utils.logger import setup_logger
+from src.utils.logger import SAMPLED, setup_logger
+from src.utils.http_client import HttpClient, http_client as shared_http_client
 from src.schemas import TelegramTextMessage, TelegramAudioMessage
+from src.utils.dispatcher import ChatDispatcher
+from src.utils.audio_stream import AudioStream
+from src.utils import fast_json
+from src.utils.metrics import stage
+from src.services.delivery_service import DeliveryService, RetryAfter
 
 logger = setup_logger(__name__)
 
@@ -12,161 +20,371 @@ logger = setup_logger(__name__)
 class TelegramService:
     """Servicio para interactuar con la API de Telegram"""
 
-    def __init__(self):
+    def __init__(self, http_client: Optional[HttpClient] = None):
         self.bot_token = settings.TELEGRAM_BOT_TOKEN
         self.chat_id = settings.TELEGRAM_CHAT_ID
-        self.base_url = f"https://api.telegram.org/bot{self.bot_token}"
+        self.api_base_url = settings.TELEGRAM_API_BASE_URL.rstrip("/")
+        self.base_url = f"{self.api_base_url}/bot{self.bot_token}"
         self.last_update_id = 0
+        self.long_polling = settings.POLLING_MODE == "long"
+        self._poll_errors = 0
         self.temp_audio_dir = "temp_audio"
-        self._session: Optional[aiohttp.ClientSession] = None
+        self.http_client = http_client or shared_http_client
+        self.delivery = DeliveryService(self._post)
 
         if not os.path.exists(self.temp_audio_dir):
             os.makedirs(self.temp_audio_dir)
 
     async def _get_session(self) -> aiohttp.ClientSession:
-        """Obtiene o crea la sesión de aiohttp."""
-        if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession()
-        return self._session
-
-    async def close(self):
-        """Cierra la sesión de aiohttp."""
-        if self._session and not self._session.closed:
-            await self._session.close()
-
-    async def get_updates(self, offset: Optional[int] = None) -> list:
-        """Obtiene las actualizaciones del bot de Telegram."""
+        """Obtiene la sesión de aiohttp compartida."""
+        return await self.http_client.get_session()
+
+    async def get_updates(self, offset: Optional[int] = None, timeout: int = 0) -> list:
+        """
+        Obtiene las actualizaciones del bot de Telegram.
+
+        Args:
+            offset: Primer update_id a recibir
+            timeout: Segundos que Telegram mantiene abierta la request si no hay updates
+                     (long polling). Con 0 responde inmediatamente (short polling).
+        """
         url = f"{self.base_url}/getUpdates"
         params: dict[str, int] = {
-            "timeout": 0,  # le especifico un polling a telegram (ya lo hacemos con un sleep en el bot)
+            "timeout": timeout,
         }
 
         # Solo agregar offset si no es None (aiohttp no acepta None como valor)
         if offset is not None:
             params["offset"] = offset
 
+        # El timeout del cliente tiene que cubrir la espera del lado del servidor
+        client_timeout = aiohttp.ClientTimeout(total=timeout + settings.LONG_POLLING_CLIENT_MARGIN)
+
         try:
             session = await self._get_session()
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=5)) as response:
+            async with stage("get_updates"), session.get(url, params=params, timeout=client_timeout) as response:
                 response.raise_for_status()
-                data = await response.json()
+                data = await response.json(loads=fast_json.loads)
 
                 if data.get("ok"):
+                    self._poll_errors = 0
                     return data.get("result", [])
                 else:
                     logger.error(f"Error en getUpdates: {data}")
+                    self._poll_errors += 1
                     return []
 
         except aiohttp.ClientError as e:
             logger.error(f"Error al obtener actualizaciones de Telegram: {e}")
+            self._poll_errors += 1
             return []
         except asyncio.TimeoutError as e:
             logger.error(f"Timeout al obtener actualizaciones de Telegram: {e}")
+            self._poll_errors += 1
             return []
 
-    async def download_audio(self, file_id: str, retries: int = 0) -> str:
-        """Descarga un archivo de audio de Telegram."""
-        # Obtener información del archivo
+    def _error_backoff(self) -> float:
+        """Calcula la espera exponencial tras errores consecutivos de polling."""
+        delay = settings.POLLING_BACKOFF_BASE * (2 ** max(self._poll_errors - 1, 0))
+        return min(delay, settings.POLLING_BACKOFF_MAX)
+
+    async def set_webhook(self, url: str, secret_token: Optional[str] = None) -> bool:
+        """Registra la URL del webhook en Telegram (reemplaza al polling)."""
+        payload: dict = {
+            "url": url,
+            "allowed_updates": ["message"],
+            "max_connections": settings.WEBHOOK_MAX_CONNECTIONS,
+        }
+        if secret_token:
+            payload["secret_token"] = secret_token
+
+        session = await self._get_session()
+        async with session.post(
+            f"{self.base_url}/setWebhook",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=settings.TELEGRAM_API_TIMEOUT)
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+            if not data.get("ok"):
+                raise ValueError(f"Telegram API error en setWebhook: {data}")
+            return True
+
+    async def delete_webhook(self) -> bool:
+        """Elimina el webhook registrado (necesario para volver a usar getUpdates)."""
+        session = await self._get_session()
+        async with session.post(
+            f"{self.base_url}/deleteWebhook",
+            timeout=aiohttp.ClientTimeout(total=settings.TELEGRAM_API_TIMEOUT)
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+            return data.get("ok", False)
+
+    async def get_file(self, file_id: str) -> dict:
+        """Obtiene la información de un archivo (file_path, file_size) vía getFile."""
         file_info_url = f"{self.base_url}/getFile"
         params = {"file_id": file_id}
 
         session = await self._get_session()
 
-        async with session.get(file_info_url, params=params) as response:
+        async with stage("get_file"), session.get(file_info_url, params=params, timeout=aiohttp.ClientTimeout(total=settings.TELEGRAM_API_TIMEOUT)) as response:
             response.raise_for_status()
             data = await response.json()
 
             if not data.get("ok"):
                 raise ValueError(f"Telegram API error: {data}")
 
-            file_path = data["result"]["file_path"]
+            return data["result"]
 
-        # Descargar el archivo
-        download_url = f"https://api.telegram.org/file/bot{self.bot_token}/{file_path}"
-        async with session.get(download_url, timeout=aiohttp.ClientTimeout(total=30)) as audio_response:
-            audio_response.raise_for_status()
-            audio_content = await audio_response.read()
-
-        # Guardar archivo localmente
+    async def _write_to_disk(self, response: aiohttp.ClientResponse, file_id: str) -> str:
+        """Vuelca una respuesta a temp_audio chunk a chunk (sin copia completa en memoria)."""
         local_file_path = os.path.join(self.temp_audio_dir, f"{file_id}.ogg")
-        with open(local_file_path, 'wb') as f:
-            f.write(audio_content)
-
-        logger.info(f"Audio descargado: {local_file_path}")
+        try:
+            with stage("download"), open(local_file_path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(settings.AUDIO_STREAM_CHUNK_SIZE):
+                    f.write(chunk)
+        except BaseException:
+            self.cleanup_audio_file(local_file_path)
+            raise
         return local_file_path
 
-    async def send_message(self, text: str, reply_to_message_id: Optional[int] = None, retries: int = 0) -> bool:
-        """Envía un mensaje al chat configurado."""
-        url = f"{self.base_url}/sendMessage"
-        payload: dict[str, str | int] = {  # Diccionario con claves str y valores str o int
-            "chat_id": self.chat_id,
-            "text": text
-        }
-        logger.info("PASO 4 - Enviar mensaje al chat")
-        if reply_to_message_id:
-            payload["reply_to_message_id"] = reply_to_message_id
+    @asynccontextmanager
+    async def open_audio(self, file_id: str) -> AsyncIterator[AudioStream]:
+        """
+        Abre la descarga de un audio de Telegram como AudioStream.
+
+        Por defecto el contenido se lee de la respuesta HTTP a medida que se sube a
+        la API de transcripción (sin pasar por memoria completa ni por disco). Si el
+        archivo supera AUDIO_SPILL_THRESHOLD bytes se descarga a temp_audio y el
+        AudioStream apunta al archivo; en ese caso su `path` debe devolverse al
+        decorador handle_telegram_errors(cleanup_audio=True) para el cleanup. Si
+        ocurre un error dentro del bloque, el archivo se elimina acá.
+        """
+        file_info = await self.get_file(file_id)
+        file_path = file_info["file_path"]
+        filename = os.path.basename(file_path) or f"{file_id}.ogg"
 
-        try:
-            session = await self._get_session()
-            async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                response.raise_for_status()
-                data = await response.json()
-                return data.get("ok", False)
+        session = await self._get_session()
+        download_url = f"{self.api_base_url}/file/bot{self.bot_token}/{file_path}"
+        # sock_read en lugar de total: la descarga dura lo que tarde la subida en consumirla
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=settings.TELEGRAM_DOWNLOAD_TIMEOUT)
 
-        except Exception as e:
-            logger.error(f"Error al enviar mensaje: {e}")
-            return False
+        async with session.get(download_url, timeout=timeout) as audio_response:
+            audio_response.raise_for_status()
+            size = file_info.get("file_size") or audio_response.content_length
+            threshold = settings.AUDIO_SPILL_THRESHOLD
+
+            if threshold and size and size > threshold:
+                local_file_path = await self._write_to_disk(audio_response, file_id)
+                logger.info("Audio descargado a disco (%d bytes): %s", size, local_file_path)
+                try:
+                    yield AudioStream(filename, path=local_file_path, size=size)
+                except BaseException:
+                    self.cleanup_audio_file(local_file_path)
+                    raise
+            else:
+                chunks = audio_response.content.iter_chunked(settings.AUDIO_STREAM_CHUNK_SIZE)
+                yield AudioStream(filename, chunks=chunks, size=size)
+
+    async def download_audio(self, file_id: str, retries: int = 0) -> str:
+        """Descarga un archivo de audio de Telegram a temp_audio y retorna su path."""
+        file_path = (await self.get_file(file_id))["file_path"]
+
+        # Descargar el archivo
+        session = await self._get_session()
+        download_url = f"{self.api_base_url}/file/bot{self.bot_token}/{file_path}"
+        async with session.get(download_url, timeout=aiohttp.ClientTimeout(total=settings.TELEGRAM_DOWNLOAD_TIMEOUT)) as audio_response:
+            audio_response.raise_for_status()
+            local_file_path = await self._write_to_disk(audio_response, file_id)
 
-    async def _process_update(self, update, audio_callback, text_callback):
-        """Procesa un update individual. Parsea el mensaje y llama al callback correspondiente."""
+        logger.info("Audio descargado: %s", local_file_path)
+        return local_file_path
+
+    async def _post(self, method: str, payload: dict) -> dict:
+        """POST a un método de la Bot API. Retorna su resultado; lanza RetryAfter ante un 429."""
+        session = await self._get_session()
+        async with session.post(
+            f"{self.base_url}/{method}",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=settings.TELEGRAM_API_TIMEOUT)
+        ) as response:
+            if response.status == 429:
+                try:
+                    data = await response.json(content_type=None)
+                    retry_after = data.get("parameters", {}).get("retry_after")
+                except ValueError:
+                    retry_after = None
+                raise RetryAfter(float(retry_after or response.headers.get("Retry-After", 1)))
+
+            if response.status == 400 and method == "editMessageText":
+                # Editar con el mismo texto no es un error para nosotros
+                data = await response.json(content_type=None)
+                if "message is not modified" in data.get("description", ""):
+                    return {"message_id": payload.get("message_id")}
+
+            response.raise_for_status()
+            data = await response.json()
+            return data.get("result", {})
+
+    async def send_message(
+        self,
+        text: str,
+        reply_to_message_id: Optional[int] = None,
+        retries: int = 0,
+        chat_id: Optional[int] = None
+    ) -> bool:
+        """
+        Envía un mensaje al chat indicado (por defecto, al chat configurado) a través
+        de la cola de salida, que respeta los límites de Telegram y divide los textos
+        largos. Retorna True si se entregaron todas las partes.
+        """
+        logger.info("PASO 4 - Enviar mensaje al chat")
+        futures = self.delivery.enqueue(chat_id or self.chat_id, text, reply_to_message_id)
+        async with stage("send"):
+            results = await asyncio.gather(*futures)
+        return all(result is not None for result in results)
+
+    async def send_placeholder(self, text: str, reply_to_message_id: Optional[int] = None, chat_id: Optional[int] = None) -> Optional[int]:
+        """Envía un mensaje que después se va a editar. Retorna su message_id (None si no se pudo enviar)."""
+        futures = self.delivery.enqueue(chat_id or self.chat_id, text, reply_to_message_id)
+        results = await asyncio.gather(*futures)
+        return results[0].get("message_id") if results and results[0] else None
+
+    async def edit_message(self, message_id: int, text: str, chat_id: Optional[int] = None, wait: bool = True) -> bool:
+        """
+        Edita el texto de un mensaje enviado (editMessageText) a través de la cola de
+        salida. Con wait=False no espera la entrega: si llega otra edición del mismo
+        mensaje antes de enviarse, solo sale la última.
+        """
+        future = self.delivery.enqueue_edit(chat_id or self.chat_id, message_id, text)
+        if not wait:
+            return True
+        return await future is not None
+
+    async def delete_message(self, message_id: int, chat_id: Optional[int] = None) -> bool:
+        """Borra un mensaje enviado (deleteMessage)."""
+        return await self.delivery.enqueue_delete(chat_id or self.chat_id, message_id) is not None
+
+    async def _process_update(self, update, audio_callback, text_callback, authorizer=None):
+        """
+        Procesa un update individual. Parsea el mensaje y llama al callback correspondiente.
+
+        Si se pasa un authorizer (corrutina que recibe el mensaje y retorna bool), los
+        mensajes no autorizados se descartan antes de llegar al callback.
+        """
         message = update.get("message", {})
         logger.info("PASO 2 - process_update")
         try:
             # Procesar mensaje de audio/voz
             if "voice" in message or "audio" in message:
                 msg = TelegramAudioMessage.from_telegram_update(update)
-                logger.info(f"Audio de {msg.user.get_display_name()}")
-                await audio_callback(msg)
+                logger.info("Audio de %s", msg.user.get_display_name())
+                callback = audio_callback
 
             # Procesar mensaje de texto
             elif "text" in message:
                 msg = TelegramTextMessage.from_telegram_update(update)
-                logger.info(f"Texto de {msg.user.get_display_name()}: {msg.text}...")
-                await text_callback(msg)
+                logger.info("Texto de %s: %s", msg.user.get_display_name(), msg.text)
+                callback = text_callback
+
+            else:
+                return
+
+            if settings.TELEGRAM_VALIDATE_UPDATES:
+                msg.validate()
+
+            if authorizer and not await authorizer(msg):
+                logger.info("Mensaje descartado: usuario %s no autorizado", msg.user.user_id)
+                return
+
+            await callback(msg)
 
         except Exception as e:
             logger.error(f"Error al procesar mensaje (update_id: {update.get('update_id')}): {e}")
 
-    async def start_polling(self, audio_callback, text_callback):
-        """Inicia el polling. Procesa mensajes en orden cronológico."""
-        logger.info("Iniciando polling de Telegram...")
+    def make_update_handler(self, audio_callback, text_callback, authorizer=None):
+        """Construye el handler de updates que consumen los workers del dispatcher."""
+        async def handle(update: dict):
+            await self._process_update(update, audio_callback, text_callback, authorizer)
+        return handle
+
+    @staticmethod
+    def chat_key(update: dict):
+        """Clave de orden de un update: el chat_id (equivale a la session_id del grupo)."""
+        return update.get("message", {}).get("chat", {}).get("id")
+
+    @staticmethod
+    def update_lane(update: dict) -> str:
+        """Lane de procesamiento de un update: "audio" para voz/audio, "text" para el resto."""
+        message = update.get("message", {})
+        return "audio" if "voice" in message or "audio" in message else "text"
+
+    async def start_polling(self, dispatcher: ChatDispatcher, on_batch=None, update_store=None):
+        """
+        Inicia el polling (etapa de ingest). Solo obtiene updates y los encola en el
+        dispatcher; el procesamiento ocurre en su pool de workers. Si la cola está
+        llena, submit() bloquea y el siguiente getUpdates se demora (backpressure).
+
+        last_update_id avanza únicamente por los updates que el dispatcher aceptó.
+        on_batch (corrutina opcional) recibe cada batch de updates antes de encolarlo,
+        p. ej. para registrar usuarios y chats con una sola escritura por batch.
+        Con un update_store, cada batch se guarda en el journal durable (junto con el
+        offset) antes de encolarse y se descartan los updates ya conocidos.
+
+        En modo "long" Telegram retiene la request hasta que llega un update (o vence
+        LONG_POLLING_TIMEOUT), por lo que no se duerme entre polls. En modo "short" se
+        espera POLLING_INTERVAL solo si el poll volvió vacío. Ante errores se aplica
+        un backoff exponencial acotado por POLLING_BACKOFF_MAX.
+        """
+        poll_timeout = settings.LONG_POLLING_TIMEOUT if self.long_polling else 0
+        logger.info(f"Iniciando polling de Telegram (modo {settings.POLLING_MODE})...")
 
         while True:
             try:
                 # Obtener actualizaciones
                 offset = self.last_update_id + 1 if self.last_update_id > 0 else None
-                updates = await self.get_updates(offset)
-                logger.info("PASO 1 - get_updates")
+                updates = await self.get_updates(offset, timeout=poll_timeout)
+                logger.info("PASO 1 - get_updates", extra=SAMPLED)
                 if updates:
-                    # Actualizar el último update_id
-                    self.last_update_id = max(update["update_id"] for update in updates)
+                    if on_batch:
+                        await on_batch(updates)
+
+                    batch_last_id = max(update["update_id"] for update in updates)
+                    if update_store:
+                        updates = await update_store.accept(updates)
+
+                    # Encolar en orden cronológico; el orden se mantiene dentro de cada chat
+                    for update in sorted(updates, key=lambda u: u["update_id"]):
+                        await dispatcher.submit(self.chat_key(update), update)
+                        self.last_update_id = update["update_id"]
+
+                    # Los duplicados descartados también cuentan como aceptados
+                    self.last_update_id = max(self.last_update_id, batch_last_id)
+
+                    # stats() calcula percentiles: solo se arma si el nivel DEBUG está activo
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Estado de la cola: %s", dispatcher.stats())
 
-                    # Procesar cada mensaje en orden cronológico
-                    for update in updates:
-                        await self._process_update(update, audio_callback, text_callback)
+                    # Si hubo datos se vuelve a consultar inmediatamente
+                    continue
 
-                # Esperar el intervalo configurado antes del siguiente poll
-                await asyncio.sleep(settings.POLLING_INTERVAL)
+                if self._poll_errors:
+                    await asyncio.sleep(self._error_backoff())
+                elif not self.long_polling:
+                    # Short polling: esperar el intervalo configurado antes del siguiente poll
+                    await asyncio.sleep(settings.POLLING_INTERVAL)
 
             except Exception as e:
                 logger.error(f"Error en el polling: {e}")
-                await asyncio.sleep(settings.POLLING_INTERVAL)
+                self._poll_errors += 1
+                await asyncio.sleep(self._error_backoff())
 
     def cleanup_audio_file(self, file_path: str):
         """Elimina un archivo de audio temporal."""
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                logger.info(f"Archivo eliminado: {file_path}")
+                logger.info("Archivo eliminado: %s", file_path)
         except Exception as e:
             logger.error(f"Error al eliminar archivo {file_path}: {e}")
@@ -0,0 +1,134 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from src.config.settings import settings
+from src.utils.cache import TTLCache
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class TranscriptionCache:
+    """
+    Cache de transcripciones direccionada por contenido.
+
+    Claves: el file_unique_id de Telegram (igual para reenvíos del mismo archivo,
+    permite evitar incluso la descarga) y, como fallback, el sha256 del audio.
+    Tiene un tier en memoria (LRU + TTL) y un tier opcional en SQLite que
+    sobrevive a reinicios (TRANSCRIPTION_CACHE_DB).
+    """
+
+    def __init__(self):
+        self.enabled = settings.TRANSCRIPTION_CACHE_ENABLED
+        self._memory = TTLCache(settings.TRANSCRIPTION_CACHE_SIZE, settings.TRANSCRIPTION_CACHE_TTL)
+        self._db_path = settings.TRANSCRIPTION_CACHE_DB
+        self._db_ttl = settings.TRANSCRIPTION_CACHE_DB_TTL
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.db_hits = 0
+        self.misses = 0
+
+        if self.enabled and self._db_path:
+            self._open_db()
+
+    def _open_db(self):
+        """Abre (o crea) la base SQLite del tier persistente."""
+        self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS transcriptions ("
+            "key TEXT PRIMARY KEY, transcription TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        if self._db_ttl:
+            # Purga de entradas vencidas al iniciar
+            self._db.execute("DELETE FROM transcriptions WHERE created_at < ?", (time.time() - self._db_ttl,))
+        self._db.commit()
+        logger.info(f"Cache persistente de transcripciones: {self._db_path}")
+
+    @staticmethod
+    def _keys(file_unique_id: Optional[str], content_hash: Optional[str]) -> List[str]:
+        """Claves a consultar/guardar, de la más barata a la más cara de obtener."""
+        keys = []
+        if file_unique_id:
+            keys.append(f"uid:{file_unique_id}")
+        if content_hash:
+            keys.append(f"sha256:{content_hash}")
+        return keys
+
+    def _db_get(self, keys: List[str]) -> Optional[str]:
+        with self._db_lock:
+            for key in keys:
+                row = self._db.execute(
+                    "SELECT transcription, created_at FROM transcriptions WHERE key = ?", (key,)
+                ).fetchone()
+                if row and (not self._db_ttl or row[1] + self._db_ttl > time.time()):
+                    return row[0]
+        return None
+
+    def _db_set(self, keys: List[str], transcription: str):
+        now = time.time()
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO transcriptions (key, transcription, created_at) VALUES (?, ?, ?)",
+                [(key, transcription, now) for key in keys]
+            )
+            self._db.commit()
+
+    async def get(self, file_unique_id: Optional[str] = None, content_hash: Optional[str] = None) -> Optional[str]:
+        """Busca una transcripción por file_unique_id y/o hash de contenido."""
+        keys = self._keys(file_unique_id, content_hash)
+        if not self.enabled or not keys:
+            return None
+
+        for key in keys:
+            transcription = self._memory.get(key)
+            if transcription is not None:
+                return transcription
+
+        if self._db is not None:
+            transcription = await asyncio.to_thread(self._db_get, keys)
+            if transcription is not None:
+                self.db_hits += 1
+                for key in keys:
+                    self._memory.set(key, transcription)
+                return transcription
+
+        self.misses += 1
+        return None
+
+    async def set(self, transcription: str, file_unique_id: Optional[str] = None, content_hash: Optional[str] = None):
+        """Guarda una transcripción bajo todas las claves disponibles."""
+        keys = self._keys(file_unique_id, content_hash)
+        if not self.enabled or not keys:
+            return
+
+        for key in keys:
+            self._memory.set(key, transcription)
+
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._db_set, keys, transcription)
+            except sqlite3.Error as e:
+                logger.error(f"Error al guardar en la cache persistente: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de hits/misses por tier."""
+        memory = self._memory.stats()
+        hits = memory["hits"] + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "hits": hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory": memory,
+            "db_hits": self.db_hits,
+        }
+
+    def close(self):
+        """Cierra la base SQLite."""
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
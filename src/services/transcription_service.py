@@ -1,57 +1,290 @@
+import asyncio
+import re
 import aiohttp
-from typing import Optional
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 from src.config.settings import settings
 from src.utils.logger import setup_logger
+from src.utils.metrics import stage
+from src.utils.http_client import HttpClient, http_client as shared_http_client
+from src.utils.audio_stream import AudioStream
+from src.utils.resilience import ResilientBackend
 
 logger = setup_logger(__name__)
 
 
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def _find_overlap(left: List[str], right: List[str], max_words: int, min_words: int) -> Tuple[int, int]:
+    """
+    Busca el solapamiento más largo entre el final de `left` y el principio de
+    `right`. Tolera hasta 2 palabras cortadas en cada borde (el corte del segmento
+    puede partir una palabra); un solapamiento de una sola palabra (por debajo de
+    min_words) solo se acepta sin palabras cortadas. Retorna (palabras a descartar al final de left,
+    palabras a descartar al principio de right).
+    """
+    tail = [_normalize_word(w) for w in left[-(max_words + 2):]]
+    head = [_normalize_word(w) for w in right[:max_words + 2]]
+    for size in range(min(max_words, len(tail), len(head)), min_words - 1, -1):
+        for cut_left in range(3):
+            end = len(tail) - cut_left
+            if end - size < 0:
+                break
+            for skip_right in range(3):
+                if skip_right + size > len(head):
+                    break
+                if tail[end - size:end] == head[skip_right:skip_right + size]:
+                    return cut_left, skip_right + size
+    # Solapamiento de una sola palabra: solo si es exactamente la última de left y la primera de right
+    if tail and head and tail[-1] and tail[-1] == head[0]:
+        return 0, 1
+    return 0, 0
+
+
+def stitch_transcripts(parts: List[str], max_overlap_words: int = 40, min_overlap_words: int = 2) -> str:
+    """
+    Une en orden las transcripciones de segmentos solapados, eliminando las
+    palabras repetidas en cada solapamiento.
+    """
+    words: List[str] = []
+    for part in parts:
+        following = part.split()
+        if words and following:
+            cut_left, skip_right = _find_overlap(words, following, max_overlap_words, min_overlap_words)
+            words = words[:len(words) - cut_left]
+            following = following[skip_right:]
+        words.extend(following)
+    return " ".join(words)
+
+
+class _BatchItem:
+    """Audio en espera de ser enviado en un batch."""
+    __slots__ = ("filename", "content_type", "content", "future")
+
+    def __init__(self, filename: str, content_type: str, content: bytes, future: asyncio.Future):
+        self.filename = filename
+        self.content_type = content_type
+        self.content = content
+        self.future = future
+
+
 class TranscriptionService:
-    """Servicio para transcribir audios usando la API externa"""
+    """
+    Servicio para transcribir audios usando la API externa.
+
+    Las llamadas pasan por un ResilientBackend: si la API se degrada, el circuit
+    breaker y el límite de concurrencia adaptativo rechazan rápido en lugar de
+    dejar a cada audio esperando el timeout completo.
 
-    def __init__(self):
+    Con TRANSCRIPTION_BATCH_ENABLED, los audios que llegan dentro de
+    TRANSCRIPTION_BATCH_WINDOW se agrupan (hasta TRANSCRIPTION_BATCH_MAX_SIZE
+    audios o TRANSCRIPTION_BATCH_MAX_BYTES) en una sola request multipart al
+    endpoint batch, y cada resultado vuelve a quien lo espera. Si el backend no
+    soporta batch se transcribe de a uno.
+    """
+
+    def __init__(self, http_client: Optional[HttpClient] = None):
         self.api_url = settings.TRANSCRIPTION_API_URL
-        self._session: Optional[aiohttp.ClientSession] = None
+        self.batch_url = settings.TRANSCRIPTION_BATCH_URL or f"{(self.api_url or '').rstrip('/')}/batch"
+        self.http_client = http_client or shared_http_client
+        self.backend = ResilientBackend(
+            "transcripcion",
+            timeout=settings.TRANSCRIPTION_TIMEOUT,
+            retries=settings.TRANSCRIPTION_RETRIES,
+            max_concurrency=settings.TRANSCRIPTION_MAX_CONCURRENCY
+        )
         #self.api_key = settings.TRANSCRIPTION_API_KEY
 
+        self._batch_enabled = settings.TRANSCRIPTION_BATCH_ENABLED
+        self._batch: List[_BatchItem] = []
+        self._batch_bytes = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self.batch_requests = 0
+        self.batched_audios = 0
+
     async def _get_session(self) -> aiohttp.ClientSession:
-        """Obtiene o crea la sesión de aiohttp."""
-        if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession()
-        return self._session
-
-    async def close(self):
-        """Cierra la sesión de aiohttp."""
-        if self._session and not self._session.closed:
-            await self._session.close()
-
-    async def transcribe_audio(self, audio_file_path: str, retries: int = 0) -> str:
-        """Transcribe un archivo de audio usando la API externa."""
+        """Obtiene la sesión de aiohttp compartida."""
+        return await self.http_client.get_session()
+
+    async def transcribe_audio(self, audio: Union[str, AudioStream], retries: int = 0) -> str:
+        """
+        Transcribe un audio usando la API externa.
+
+        Args:
+            audio: Path de un archivo local o un AudioStream (p. ej. el de
+                   TelegramService.open_audio, que se sube a medida que se descarga)
+        """
+        async with stage("transcribe"):
+            if isinstance(audio, str):
+                audio = AudioStream.from_path(audio)
+
+            if self._batch_enabled and audio.size and audio.size <= settings.TRANSCRIPTION_BATCH_MAX_ITEM_BYTES:
+                return await self._transcribe_batched(audio)
+
+            # Un upload en streaming consume el audio: solo se reintenta si está en disco
+            retries = 0 if audio.is_streaming else None
+            return await self.backend.call(self._post_audio, audio, retries=retries)
+
+    # --- Micro-batching ---
+
+    async def _transcribe_batched(self, audio: AudioStream) -> str:
+        """Lee el audio (chico) a memoria y lo suma al batch en formación."""
+        if audio.is_streaming:
+            content = b"".join([chunk async for chunk in audio.chunks])
+        else:
+            content = await asyncio.to_thread(_read_file, audio.path)
+
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append(_BatchItem(audio.filename, audio.content_type, content, future))
+        self._batch_bytes += len(content)
+
+        if len(self._batch) >= settings.TRANSCRIPTION_BATCH_MAX_SIZE or self._batch_bytes >= settings.TRANSCRIPTION_BATCH_MAX_BYTES:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(settings.TRANSCRIPTION_BATCH_WINDOW, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Envía el batch en formación."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        items, self._batch, self._batch_bytes = self._batch, [], 0
+        if items:
+            # Se guarda la referencia: el loop no retiene las tareas y close() las espera
+            task = asyncio.create_task(self._resolve(items))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _resolve(self, items: List[_BatchItem]):
+        """Transcribe un grupo de audios y entrega cada resultado a quien lo espera."""
+        results: List[Union[str, BaseException]]
+        try:
+            if self._batch_enabled and len(items) > 1:
+                batch_results = await self.backend.call(self._post_batch, items)
+                if batch_results is None:
+                    logger.warning("La API de transcripción no soporta batch, se transcribe de a uno")
+                    self._batch_enabled = False
+                    results = await self._transcribe_each(items)
+                else:
+                    results = batch_results
+            else:
+                results = await self._transcribe_each(items)
+        except Exception as e:
+            results = [e] * len(items)
+
+        for item, result in zip(items, results):
+            if item.future.done():
+                continue
+            if isinstance(result, BaseException):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(result)
+
+    async def _transcribe_each(self, items: List[_BatchItem]) -> List[Union[str, BaseException]]:
+        """Transcribe los audios de a uno, en paralelo."""
+        return await asyncio.gather(
+            *(self.backend.call(self._post_file, item.filename, item.content_type, item.content) for item in items),
+            return_exceptions=True
+        )
+
+    async def _post_batch(self, items: List[_BatchItem]) -> Optional[List[Union[str, BaseException]]]:
+        """
+        POST multipart a TRANSCRIPTION_BATCH_URL con un campo 'audio' por archivo.
+        Respuesta esperada: {"results": [{"transcription": "..."} | {"error": "..."}, ...]}
+        en el mismo orden. Retorna None si el backend no soporta batch.
+        """
+        data = aiohttp.FormData()
+        for item in items:
+            data.add_field('audio', item.content, filename=item.filename, content_type=item.content_type)
+
+        logger.info("Enviando %d audios a transcribir en batch", len(items))
+        session = await self._get_session()
+        async with session.post(
+            self.batch_url,
+            data=data,
+            timeout=aiohttp.ClientTimeout(total=settings.TRANSCRIPTION_TIMEOUT)
+        ) as response:
+            if response.status in (404, 405, 501):
+                return None
+
+            response.raise_for_status()
+            entries = (await response.json()).get('results') or []
+            if len(entries) != len(items):
+                raise ValueError(f"La respuesta batch trae {len(entries)} resultados para {len(items)} audios")
+
+        self.batch_requests += 1
+        self.batched_audios += len(items)
+        results: List[Union[str, BaseException]] = []
+        for entry in entries:
+            transcription = entry.get('transcription') if isinstance(entry, dict) else None
+            if transcription:
+                results.append(transcription)
+            else:
+                results.append(ValueError(f"No 'transcription' field in API response: {entry}"))
+        return results
+
+    # --- Request individual ---
+
+    async def _post_audio(self, audio: AudioStream) -> str:
+        """Sube el audio a la API de transcripción (un intento)."""
+        logger.info("Enviando audio a transcribir: %s (%s)", audio.filename, 'stream' if audio.is_streaming else audio.path)
+        with audio.body() as body:
+            return await self._post_file(audio.filename, audio.content_type, body)
+
+    async def _post_file(self, filename: str, content_type: str, body) -> str:
+        """POST multipart de un archivo (bytes, archivo abierto o iterador de chunks)."""
         headers = {}
         #if self.api_key:
         #    headers['Authorization'] = f'Bearer {self.api_key}'
 
-        logger.info(f"Enviando audio a transcribir: {audio_file_path}")
-
         session = await self._get_session()
 
-        with open(audio_file_path, 'rb') as audio_file:
-            data = aiohttp.FormData()
-            data.add_field('audio', audio_file, filename=audio_file_path, content_type='audio/ogg')
+        data = aiohttp.FormData()
+        data.add_field('audio', body, filename=filename, content_type=content_type)
+
+        async with session.post(
+            self.api_url,
+            data=data,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=settings.TRANSCRIPTION_TIMEOUT)
+        ) as response:
+            response.raise_for_status()
+            result = await response.json()
+
+            transcription = result.get('transcription')
+
+            if not transcription:
+                raise ValueError(f"No 'transcription' field in API response: {result}")
+
+            logger.info("Transcripción exitosa: %.100s...", transcription)
+            return transcription
 
-            async with session.post(
-                self.api_url,
-                data=data,
-                headers=headers,
-                timeout=aiohttp.ClientTimeout(total=60)
-            ) as response:
-                response.raise_for_status()
-                result = await response.json()
+    def stats(self) -> Dict[str, Any]:
+        """Métricas del backend y del micro-batching."""
+        return {
+            **self.backend.stats(),
+            "batch_enabled": self._batch_enabled,
+            "batch_requests": self.batch_requests,
+            "batched_audios": self.batched_audios,
+        }
 
-                transcription = result.get('transcription')
+    async def close(self, drain_timeout: Optional[float] = None):
+        """Envía el batch en formación y espera (hasta drain_timeout) los batches de transcripción en curso."""
+        self._flush()
+        if self._batch_tasks:
+            _, not_done = await asyncio.wait(list(self._batch_tasks), timeout=drain_timeout)
+            if not_done:
+                logger.warning(f"Timeout esperando batches de transcripción: se cancelan {len(not_done)} batches")
+                for task in not_done:
+                    task.cancel()
+                await asyncio.gather(*not_done, return_exceptions=True)
 
-                if not transcription:
-                    raise ValueError(f"No 'transcription' field in API response: {result}")
 
-                logger.info(f"Transcripción exitosa: {transcription[:100]}...")
-                return transcription
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as audio_file:
+        return audio_file.read()
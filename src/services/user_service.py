@@ -1,18 +1,49 @@
-import requests
-from typing import Optional, Dict, Any
+import asyncio
+import aiohttp
+from typing import Optional, Dict, Any, Iterable, List, Set
 from src.config.settings import settings
+from src.utils.cache import TTLCache, MISSING
 from src.utils.logger import setup_logger
+from src.utils.http_client import HttpClient, http_client as shared_http_client
 
 logger = setup_logger(__name__)
 
 class UserService:
-    """Servicio para gestionar usuarios, validación y obtención de su id"""
+    """
+    Servicio para gestionar usuarios, validación y obtención de su id.
 
-    def __init__(self):
-        self.api_url = settings.USER_SYSTEM_URL
+    Las consultas al sistema de usuarios son async y pasan por una cache en memoria
+    con TTL, que también recuerda los usuarios inexistentes (negative caching). Las
+    consultas concurrentes del mismo user_id comparten una request, y las de ids
+    distintos que llegan dentro de USER_BATCH_WINDOW se agrupan en una sola request
+    al endpoint batch (si el sistema no lo soporta se consulta de a uno).
+    """
+
+    def __init__(self, http_client: Optional[HttpClient] = None):
+        self.api_url = (settings.USER_SYSTEM_URL or '').rstrip('/')
+        self.http_client = http_client or shared_http_client
         #self.api_key = settings.USER_SYSTEM_API_KEY
 
-    def get_user_info_from_message(self, user_id: str) -> Optional[Dict[str, Any]]:
+        self._cache = TTLCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._batch: List[str] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self._batch_supported = settings.USER_SYSTEM_BATCH_ENABLED
+        self.requests = 0
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Obtiene la sesión de aiohttp compartida."""
+        return await self.http_client.get_session()
+
+    def get_cached_user(self, user_id) -> Any:
+        """
+        Lookup sincrónico en la cache (sin I/O). Retorna la info, None si el usuario
+        se sabe inexistente, o MISSING si no hay dato cacheado.
+        """
+        return self._cache.get(str(user_id), MISSING)
+
+    async def get_user_info_from_message(self, user_id) -> Optional[Dict[str, Any]]:
         """
         Obtiene información del usuario desde el sistema destino
 
@@ -20,31 +51,144 @@ class UserService:
             user_id: ID del usuario
 
         Returns:
-            Diccionario con la información del usuario o None si falla
+            Diccionario con la información del usuario o None si no existe o falla
         """
+        user_id = str(user_id)
+        cached = self._cache.get(user_id, MISSING)
+        if cached is not MISSING:
+            return cached
+
+        future = self._pending.get(user_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[user_id] = future
+            self._enqueue(user_id)
+
+        return await asyncio.shield(future)
+
+    async def get_users(self, user_ids: Iterable) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Obtiene varios usuarios a la vez (se resuelven en un mismo batch)."""
+        ids = [str(user_id) for user_id in user_ids]
+        results = await asyncio.gather(*(self.get_user_info_from_message(user_id) for user_id in ids))
+        return dict(zip(ids, results))
+
+    def _enqueue(self, user_id: str):
+        """Agrega un id al batch en formación y agenda su envío."""
+        self._batch.append(user_id)
+        if len(self._batch) >= settings.USER_BATCH_MAX_SIZE:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(settings.USER_BATCH_WINDOW, self._flush)
+
+    def _flush(self):
+        """Envía el batch en formación."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        ids, self._batch = self._batch, []
+        if ids:
+            # Se guarda la referencia: el loop no retiene las tareas y close() las espera
+            task = asyncio.create_task(self._resolve(ids))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _resolve(self, ids: List[str]):
+        """Consulta un grupo de ids y resuelve los futures de quienes los esperan."""
+        results: Dict[str, Optional[Dict[str, Any]]] = {}
         try:
-            # Preparar headers
-            headers = {'Content-Type': 'application/json'}
-            #if self.api_key:
-            #    headers['Authorization'] = f'Bearer {self.api_key}'
-
-            # Enviar request
-            logger.info(f"Obteniendo información del usuario: {user_id}...")
-            response = requests.get(
+            if self._batch_supported and len(ids) > 1:
+                results = await self._fetch_batch(ids)
+            else:
+                results = await self._fetch_each(ids)
+        except Exception as e:
+            logger.error(f"Error inesperado al obtener información de usuarios: {e}")
+
+        for user_id in ids:
+            # Solo se cachea lo que el sistema respondió (incluido "no existe"), nunca los errores
+            if user_id in results:
+                info = results[user_id]
+                ttl = settings.USER_CACHE_TTL if info is not None else settings.USER_CACHE_NEGATIVE_TTL
+                self._cache.set(user_id, info, ttl=ttl)
+
+            future = self._pending.pop(user_id, None)
+            if future is not None and not future.done():
+                future.set_result(results.get(user_id))
+
+    async def _fetch_batch(self, ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Consulta varios usuarios en una request: POST {USER_SYSTEM_URL}/batch con
+        {"user_ids": [...]} y respuesta {"users": {"<id>": {...} | null}}.
+        """
+        headers = {'Content-Type': 'application/json'}
+        logger.info(f"Obteniendo información de {len(ids)} usuarios en batch...")
+
+        session = await self._get_session()
+        self.requests += 1
+        try:
+            async with session.post(
+                f"{self.api_url}/batch",
+                json={'user_ids': ids},
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=settings.USER_SYSTEM_TIMEOUT)
+            ) as response:
+                if response.status in (404, 405, 501):
+                    logger.warning("El sistema de usuarios no soporta batch, se consulta de a uno")
+                    self._batch_supported = False
+                    return await self._fetch_each(ids)
+
+                response.raise_for_status()
+                users = (await response.json()).get('users', {})
+                return {user_id: users.get(user_id) for user_id in ids}
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error al obtener información de usuarios en batch: {e}")
+            return {}
+
+    async def _fetch_each(self, ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Consulta los usuarios de a uno, en paralelo."""
+        results = await asyncio.gather(*(self._fetch_one(user_id) for user_id in ids))
+        return {user_id: info for user_id, (found, info) in zip(ids, results) if found}
+
+    async def _fetch_one(self, user_id: str):
+        """GET {USER_SYSTEM_URL}/{user_id}. Retorna (respondió, info); info es None si no existe."""
+        headers = {'Content-Type': 'application/json'}
+        #if self.api_key:
+        #    headers['Authorization'] = f'Bearer {self.api_key}'
+
+        logger.info(f"Obteniendo información del usuario: {user_id}...")
+        session = await self._get_session()
+        self.requests += 1
+        try:
+            async with session.get(
                 f"{self.api_url}/{user_id}",
                 headers=headers,
-                timeout=30
-            )
+                timeout=aiohttp.ClientTimeout(total=settings.USER_SYSTEM_TIMEOUT)
+            ) as response:
+                if response.status == 404:
+                    return True, None
 
-            response.raise_for_status()
-            result = response.json()
+                response.raise_for_status()
+                result = await response.json()
 
-            logger.info(f"Información del usuario obtenida exitosamente: {result.get('name', 'N/A')}")
-            return result
+                logger.info(f"Información del usuario obtenida exitosamente: {result.get('name', 'N/A')}")
+                return True, result
 
-        except requests.exceptions.RequestException as e:
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.error(f"Error al obtener información del usuario: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"Error inesperado al obtener información del usuario: {e}")
-            return None
\ No newline at end of file
+            return False, None
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas de la cache y cantidad de requests al sistema de usuarios."""
+        return {**self._cache.stats(), "requests": self.requests, "in_flight": len(self._pending)}
+
+    async def close(self, drain_timeout: Optional[float] = None):
+        """Envía el batch en formación y espera (hasta drain_timeout) los batches de usuarios en curso."""
+        self._flush()
+        if self._batch_tasks:
+            _, not_done = await asyncio.wait(list(self._batch_tasks), timeout=drain_timeout)
+            if not_done:
+                logger.warning(f"Timeout esperando consultas de usuarios: se cancelan {len(not_done)} batches")
+                for task in not_done:
+                    task.cancel()
+                await asyncio.gather(*not_done, return_exceptions=True)
@@ -0,0 +1,125 @@
+import asyncio
+import hmac
+from typing import Optional
+from aiohttp import web
+from src.config.settings import settings
+from src.utils.dispatcher import ChatDispatcher
+from src.utils.logger import setup_logger
+from src.utils import fast_json
+
+logger = setup_logger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Ingest por webhook: servidor aiohttp que recibe los updates que Telegram empuja.
+
+    Cada request se valida (header de secret token), se registra en el checkpoint
+    durable si hay update_store y se responde 200 de inmediato; una tarea aparte
+    entrega los updates al dispatcher en orden de llegada, por el mismo camino que
+    el polling. Si la cola interna está llena se responde 503 y Telegram reintenta
+    más tarde (backpressure).
+    """
+
+    def __init__(self, dispatcher: ChatDispatcher, chat_key, on_batch=None, update_store=None):
+        self.dispatcher = dispatcher
+        self.chat_key = chat_key
+        self.on_batch = on_batch
+        self.update_store = update_store
+        self.secret_token = settings.WEBHOOK_SECRET_TOKEN
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WEBHOOK_QUEUE_MAXSIZE)
+        self._runner: Optional[web.AppRunner] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self.received = 0
+        self.rejected = 0
+
+    def build_app(self) -> web.Application:
+        """Aplicación aiohttp con la ruta del webhook."""
+        app = web.Application()
+        app.router.add_post(settings.WEBHOOK_PATH, self._handle)
+        return app
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        """Recibe un update: valida, registra y responde sin esperar el procesamiento."""
+        if self.secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_TOKEN_HEADER, "").encode(), self.secret_token.encode()
+        ):
+            self.rejected += 1
+            logger.warning(f"Webhook rechazado: secret token invalido desde {request.remote}")
+            return web.Response(status=403)
+
+        if self._queue.full():
+            self.rejected += 1
+            return web.Response(status=503)
+
+        try:
+            update = await request.json(loads=fast_json.loads)
+        except (fast_json.JSONDecodeError, UnicodeDecodeError):
+            return web.Response(status=400)
+
+        if not isinstance(update, dict) or "update_id" not in update:
+            return web.Response(status=400)
+
+        self.received += 1
+        if self.update_store:
+            # Reentregas de un update ya aceptado se confirman sin volver a encolarlas
+            if not await self.update_store.accept([update]):
+                return web.Response(status=200)
+
+        # Si otra request llenó la cola mientras se registraba, espera lugar (ya está aceptado)
+        await self._queue.put(update)
+        return web.Response(status=200)
+
+    async def _consume(self):
+        """Entrega al dispatcher los updates recibidos, agrupando los que se acumularon."""
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            if self.on_batch:
+                try:
+                    await self.on_batch(batch)
+                except Exception as e:
+                    logger.error(f"Error en on_batch del webhook: {e}")
+
+            # Cada update ya está en el journal: un error con uno no abandona el resto del batch
+            for update in batch:
+                try:
+                    await self.dispatcher.submit(self.chat_key(update), update)
+                except Exception as e:
+                    logger.error(f"Error al encolar el update {update.get('update_id')} del webhook: {e}")
+
+    async def start(self):
+        """Levanta el servidor HTTP y la tarea que alimenta al dispatcher."""
+        self._consumer = asyncio.create_task(self._consume())
+        self._runner = web.AppRunner(self.build_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+        await site.start()
+        logger.info(f"Webhook escuchando en http://{settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}")
+
+    async def stop(self):
+        """Deja de recibir updates y entrega al dispatcher lo que quedó en la cola."""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+        deadline = asyncio.get_running_loop().time() + settings.SHUTDOWN_DRAIN_TIMEOUT
+        while not self._queue.empty() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.01)
+
+        if self._consumer:
+            self._consumer.cancel()
+            await asyncio.gather(self._consumer, return_exceptions=True)
+            self._consumer = None
+
+    async def serve(self):
+        """Atiende el webhook hasta que se cancele la tarea."""
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
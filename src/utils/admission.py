@@ -0,0 +1,178 @@
+"""
+Control de admisión: qué updates se procesan cuando llega más de lo que el bot
+puede atender.
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+from src.utils.metrics import registry
+from src.utils.rate_limiter import TokenBucket
+from src.utils.stats import LatencyWindow
+
+logger = setup_logger(__name__)
+
+ADMISSION_DECISIONS = registry.counter(
+    "admission_decisions_total",
+    "Updates admitidos o descartados por el control de admisión, por lane y motivo",
+    ("lane", "decision"),
+)
+
+# Motivos de descarte
+CHAT_RATE = "chat_rate"
+USER_RATE = "user_rate"
+IN_FLIGHT = "in_flight"
+AUDIO_AGE = "audio_age"
+TEXT_DEADLINE = "text_deadline"
+
+
+class AdmissionController:
+    """
+    Control de admisión en dos puntos:
+
+    - Ingest (submit, delante del dispatcher): límite de mensajes por chat y por
+      usuario (token buckets) y tope global de updates admitidos sin terminar. Lo
+      rechazado no se encola: un grupo que inunda al bot no ocupa la cola de los
+      demás ni frena el polling con backpressure.
+    - Procesamiento (check_deadline, cuando un worker toma el update): un audio
+      que esperó más de ADMISSION_AUDIO_MAX_AGE se descarta, y un texto se
+      descarta si su respuesta llegaría después de ADMISSION_TEXT_DEADLINE
+      (antigüedad + tiempo típico de procesamiento de un texto).
+
+    La antigüedad se mide desde el `date` del mensaje en Telegram, así incluye la
+    espera en Telegram, en la cola y en los reinicios, y vale entre procesos.
+    Cada decisión se cuenta en la métrica admission_decisions_total.
+    """
+
+    def __init__(
+        self,
+        dispatcher,
+        lane_of: Callable[[dict], str],
+        on_shed: Callable[[dict, str], Awaitable[None]],
+    ):
+        """
+        Args:
+            dispatcher: Dispatcher (o ShardRouter) al que se pasan los updates admitidos
+            lane_of: Lane de un update ("text" o "audio")
+            on_shed: Corrutina que recibe cada update rechazado en el ingest y el motivo
+        """
+        self._dispatcher = dispatcher
+        self._lane_of = lane_of
+        self._on_shed = on_shed
+        self._chat_buckets: Dict[Hashable, TokenBucket] = {}
+        self._user_buckets: Dict[Hashable, TokenBucket] = {}
+        self._in_flight: Set[int] = set()
+        self._notified: Dict[Hashable, float] = {}  # chat -> último aviso de "ocupado"
+        self._text_seconds = LatencyWindow(200)
+        self.admitted = 0
+        self.shed: Dict[str, int] = {}
+
+    async def submit(self, key: Hashable, update: dict):
+        """Admite el update y lo encola en el dispatcher, o lo rechaza (on_shed) sin encolarlo."""
+        reason = self._admit(update)
+        if reason:
+            self._count_shed(update, reason)
+            await self._on_shed(update, reason)
+            return
+
+        self.admitted += 1
+        ADMISSION_DECISIONS.inc(self._lane_of(update), "admitted")
+        self._in_flight.add(update["update_id"])
+        try:
+            await self._dispatcher.submit(key, update)
+        except BaseException:
+            # No quedó encolado (error o cancelación al cerrar): no ocupa lugar en el tope
+            self._in_flight.discard(update["update_id"])
+            raise
+
+    def _admit(self, update: dict) -> Optional[str]:
+        """Motivo de rechazo en el ingest, o None si se admite."""
+        if settings.ADMISSION_MAX_IN_FLIGHT and len(self._in_flight) >= settings.ADMISSION_MAX_IN_FLIGHT:
+            return IN_FLIGHT
+
+        message = update.get("message", {})
+        chat = self._bucket(self._chat_buckets, message.get("chat", {}).get("id"), settings.ADMISSION_CHAT_RATE, settings.ADMISSION_CHAT_BURST)
+        user = self._bucket(self._user_buckets, message.get("from", {}).get("id"), settings.ADMISSION_USER_RATE, settings.ADMISSION_USER_BURST)
+        # Se consulta antes de consumir: un rechazo por usuario no gasta el cupo del chat
+        if chat and chat.delay() > 0:
+            return CHAT_RATE
+        if user and user.delay() > 0:
+            return USER_RATE
+        for bucket in (chat, user):
+            if bucket:
+                bucket.try_acquire()
+        return None
+
+    @staticmethod
+    def _bucket(buckets: Dict[Hashable, TokenBucket], key, rate: float, burst: float) -> Optional[TokenBucket]:
+        if key is None or rate <= 0:
+            return None
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= settings.ADMISSION_MAX_TRACKED:
+                # Los buckets llenos no guardan estado útil
+                for idle in [k for k, b in buckets.items() if b.is_idle()]:
+                    del buckets[idle]
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def release(self, update_id: int):
+        """Marca como terminado un update admitido (libera su lugar en el tope global)."""
+        self._in_flight.discard(update_id)
+
+    def check_deadline(self, update: dict) -> Optional[str]:
+        """Motivo para descartar un update que un worker está por procesar, o None."""
+        date = update.get("message", {}).get("date")
+        if not date:
+            return None
+        age = time.time() - date
+        if self._lane_of(update) == "audio":
+            if settings.ADMISSION_AUDIO_MAX_AGE and age > settings.ADMISSION_AUDIO_MAX_AGE:
+                return AUDIO_AGE
+        elif settings.ADMISSION_TEXT_DEADLINE:
+            expected = self._text_seconds.summary()["p50"] if self._text_seconds.samples else 0.0
+            if age + expected > settings.ADMISSION_TEXT_DEADLINE:
+                return TEXT_DEADLINE
+        return None
+
+    def record_processed(self, update: dict, seconds: float):
+        """Registra cuánto tardó un update procesado (estima la respuesta de los textos)."""
+        if self._lane_of(update) == "text":
+            self._text_seconds.add(seconds)
+
+    def count_deadline_shed(self, update: dict, reason: str):
+        """Cuenta un descarte hecho por check_deadline."""
+        self._count_shed(update, reason)
+
+    def _count_shed(self, update: dict, reason: str):
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+        ADMISSION_DECISIONS.inc(self._lane_of(update), reason)
+        message = update.get("message", {})
+        # Cada descarte queda en el log (el aviso al chat sí se limita por ADMISSION_BUSY_REPLY_INTERVAL)
+        logger.warning(
+            "Update %s del chat %s descartado por sobrecarga (%s)",
+            update.get("update_id"), message.get("chat", {}).get("id"), reason
+        )
+
+    def should_notify(self, chat_id: Hashable) -> bool:
+        """True si corresponde avisar "ocupado" al chat (como mucho uno cada ADMISSION_BUSY_REPLY_INTERVAL)."""
+        now = time.monotonic()
+        last = self._notified.get(chat_id)
+        if last is not None and now - last < settings.ADMISSION_BUSY_REPLY_INTERVAL:
+            return False
+        if len(self._notified) >= settings.ADMISSION_MAX_TRACKED:
+            cutoff = now - settings.ADMISSION_BUSY_REPLY_INTERVAL
+            self._notified = {k: t for k, t in self._notified.items() if t >= cutoff}
+        self._notified[chat_id] = now
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Admitidos, descartados por motivo, en vuelo y tiempo típico de un texto."""
+        return {
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "in_flight": len(self._in_flight),
+            "tracked_chats": len(self._chat_buckets),
+            "tracked_users": len(self._user_buckets),
+            "text_seconds_p50": round(self._text_seconds.summary()["p50"], 3),
+        }
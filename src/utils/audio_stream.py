@@ -0,0 +1,82 @@
+"""
+Representación de un audio en tránsito entre Telegram y la API de transcripción.
+"""
+import asyncio
+import hashlib
+import os
+from contextlib import contextmanager
+from typing import AsyncIterator, Optional
+
+
+class AudioStream:
+    """
+    Audio listo para subir: un stream de chunks (sin copia en memoria ni en disco)
+    o un archivo local cuando se descargó a disco (spill por tamaño).
+
+    Un stream solo puede consumirse una vez. Mientras se consume se calcula el
+    sha256 del contenido, disponible en content_hash() una vez terminado.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        chunks: Optional[AsyncIterator[bytes]] = None,
+        path: Optional[str] = None,
+        size: Optional[int] = None,
+        content_type: str = 'audio/ogg',
+    ):
+        if (chunks is None) == (path is None):
+            raise ValueError("AudioStream requiere chunks o path (uno de los dos)")
+
+        self._digest = hashlib.sha256()
+        self._hash: Optional[str] = None
+
+        self.filename = filename
+        self.chunks = self._hashing(chunks) if chunks is not None else None
+        self.path = path
+        self.size = size
+        self.content_type = content_type
+
+    @classmethod
+    def from_path(cls, path: str) -> 'AudioStream':
+        """Crea un AudioStream a partir de un archivo local."""
+        return cls(os.path.basename(path), path=path, size=os.path.getsize(path))
+
+    async def _hashing(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Envuelve el iterador de chunks calculando el sha256 a medida que pasan."""
+        async for chunk in chunks:
+            self._digest.update(chunk)
+            yield chunk
+        self._hash = self._digest.hexdigest()
+
+    async def content_hash(self) -> Optional[str]:
+        """
+        sha256 del contenido. Para archivos en disco se calcula al pedirlo (en un
+        thread); para streams solo está disponible después de consumirlos.
+        """
+        if self._hash is None and self.path is not None:
+            self._hash = await asyncio.to_thread(_file_sha256, self.path)
+        return self._hash
+
+    @property
+    def is_streaming(self) -> bool:
+        """True si el contenido se lee directamente de la respuesta HTTP."""
+        return self.chunks is not None
+
+    @contextmanager
+    def body(self):
+        """Cuerpo para el multipart: el iterador de chunks o el archivo abierto."""
+        if self.chunks is not None:
+            yield self.chunks
+        else:
+            with open(self.path, 'rb') as audio_file:
+                yield audio_file
+
+
+def _file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """sha256 de un archivo leído por bloques."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as audio_file:
+        for block in iter(lambda: audio_file.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,134 @@
+"""
+Agrupación (debounce) de items que llegan seguidos para una misma clave.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+@dataclass
+class _Batch:
+    """Items de una clave que todavía no se entregaron."""
+    items: List[Any] = field(default_factory=list)
+    first_at: float = field(default_factory=time.monotonic)
+    last_at: float = field(default_factory=time.monotonic)
+    timer: Optional[asyncio.Task] = None
+
+
+class SessionDebouncer:
+    """
+    Junta los items que llegan seguidos para una misma clave (p. ej. la sesión de un
+    chat) y los entrega juntos, en orden de llegada, a `flush`.
+
+    Un batch se cierra cuando pasan `window` segundos sin items nuevos, cuando
+    cumple `max_wait` segundos desde el primero (así la espera queda acotada aunque
+    los items no paren de llegar) o cuando junta `max_items`. Los batches de una
+    misma clave se entregan de a uno y en orden; los de claves distintas, en paralelo.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[Hashable, List[Any]], Awaitable[None]],
+        window: float,
+        max_wait: float,
+        max_items: int = 0,
+    ):
+        """
+        Args:
+            flush: Corrutina que recibe la clave y los items de un batch cerrado
+            window: Segundos sin items nuevos que cierran un batch
+            max_wait: Segundos máximos desde el primer item de un batch
+            max_items: Items que cierran un batch de inmediato (0 = sin límite)
+        """
+        self._flush = flush
+        self.window = window
+        self.max_wait = max_wait
+        self.max_items = max_items
+        self._batches: Dict[Hashable, _Batch] = {}
+        self._flushing: Dict[Hashable, asyncio.Task] = {}
+        self.items = 0
+        self.batches = 0
+        self.merged = 0
+        self.failed = 0
+
+    def add(self, key: Hashable, item: Any):
+        """Agrega un item al batch abierto de la clave (o abre uno). No espera la entrega."""
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch()
+            batch.timer = asyncio.create_task(self._wait(key, batch))
+        batch.items.append(item)
+        batch.last_at = time.monotonic()
+        self.items += 1
+        if self.max_items and len(batch.items) >= self.max_items:
+            self._close(key)
+
+    async def _wait(self, key: Hashable, batch: _Batch):
+        """Cierra el batch cuando se cumple la ventana sin items o la espera máxima."""
+        while True:
+            deadline = min(batch.last_at + self.window, batch.first_at + self.max_wait)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        self._close(key)
+
+    def _close(self, key: Hashable):
+        """Cierra el batch de la clave y agenda su entrega detrás del anterior."""
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None and batch.timer is not asyncio.current_task():
+            batch.timer.cancel()
+
+        task = asyncio.create_task(self._deliver(key, batch.items, self._flushing.get(key)))
+        self._flushing[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+
+    async def _deliver(self, key: Hashable, items: List[Any], previous: Optional[asyncio.Task]):
+        if previous is not None:
+            # Respeta el orden entre batches de la misma clave (sus errores ya se registraron)
+            await asyncio.wait([previous])
+        self.batches += 1
+        self.merged += len(items) - 1
+        try:
+            await self._flush(key, items)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Error entregando {len(items)} items agrupados de {key}: {e}", exc_info=True)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._flushing.get(key) is task:
+            del self._flushing[key]
+
+    @property
+    def pending(self) -> int:
+        """Items en batches que todavía no se cerraron."""
+        return sum(len(batch.items) for batch in self._batches.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Items recibidos, batches entregados, items unidos a otro y pendientes."""
+        return {
+            "pending": self.pending,
+            "items": self.items,
+            "batches": self.batches,
+            "merged": self.merged,
+            "failed": self.failed,
+        }
+
+    async def close(self, drain_timeout: Optional[float] = None):
+        """Cierra los batches abiertos sin esperar la ventana y espera (hasta drain_timeout) su entrega."""
+        for key in list(self._batches):
+            self._close(key)
+        tasks = list(self._flushing.values())
+        if tasks:
+            _, not_done = await asyncio.wait(tasks, timeout=drain_timeout)
+            if not_done:
+                logger.warning(f"Timeout entregando mensajes agrupados: se cancelan {len(not_done)} batches")
+                for task in not_done:
+                    task.cancel()
+                await asyncio.gather(*not_done, return_exceptions=True)
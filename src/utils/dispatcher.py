@@ -0,0 +1,202 @@
+"""
+Dispatcher concurrente de updates con orden garantizado por chat.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+from src.utils.logger import setup_logger
+from src.utils.stats import percentile
+
+logger = setup_logger(__name__)
+
+LATENCY_WINDOW = 1000  # muestras recientes de espera en cola por lane
+
+
+class _Lane:
+    """Estado de una lane: chats listos, capacidad y métricas."""
+
+    def __init__(self, name: str, workers: int, max_pending: int):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.capacity = asyncio.Semaphore(max_pending)
+        self.ready: Deque[Hashable] = deque()
+        self.pending = 0
+        self.in_flight = 0
+        self.busy_seconds = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.wait_samples: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+
+class ChatDispatcher:
+    """
+    Cola de trabajo acotada con pools de workers por lane y orden por chat.
+
+    Cada chat (key) tiene su propia cola FIFO. Cuando un chat tiene trabajo se
+    publica como "listo" en la lane de su primer item (p. ej. "text" o "audio");
+    un chat nunca está en manos de más de un worker a la vez, por lo que los
+    mensajes de un grupo se procesan en orden mientras distintos grupos avanzan
+    en paralelo.
+
+    Cada lane tiene su propio pool de workers y su propia capacidad. El orden de
+    `priority` define las preferencias: los workers de una lane también atienden
+    las lanes de mayor prioridad (y las prefieren), pero nunca las de menor. Con
+    priority=["text", "audio"], los textos tienen workers exclusivos y además los
+    workers de audio toman textos cuando hay, así una ráfaga de audios no frena
+    las respuestas rápidas.
+
+    La capacidad por lane aplica backpressure: submit() espera hasta que haya
+    lugar, lo que frena al ingest en lugar de acumular memoria.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Any]],
+        lanes: Dict[str, Tuple[int, int]],
+        lane_of: Callable[[Any], str],
+        priority: Optional[List[str]] = None,
+    ):
+        """
+        Args:
+            handler: Corrutina que procesa un item
+            lanes: {nombre: (workers, max_pending)} de cada lane
+            lane_of: Función que asigna un item a su lane
+            priority: Lanes de mayor a menor prioridad (default: orden de `lanes`)
+        """
+        self._handler = handler
+        self._lane_of = lane_of
+        self._lanes = {name: _Lane(name, workers, max_pending) for name, (workers, max_pending) in lanes.items()}
+        self._priority = priority or list(lanes)
+        self._queues: Dict[Hashable, Deque[Tuple[Any, str, float]]] = {}
+        self._scheduled: Set[Hashable] = set()  # chats listos o en proceso
+        self._condition = asyncio.Condition()
+        self._workers: List[asyncio.Task] = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._accepting = False
+        self._started_at: Optional[float] = None
+
+    def start(self):
+        """Arranca los pools de workers de cada lane."""
+        self._accepting = True
+        self._started_at = time.monotonic()
+        for index, name in enumerate(self._priority):
+            serves = self._priority[:index + 1]
+            for i in range(self._lanes[name].workers):
+                self._workers.append(asyncio.create_task(self._worker(f"{name}-{i}", serves)))
+
+    async def submit(self, key: Hashable, item: Any):
+        """
+        Encola un item en la cola de su chat. Si su lane está llena espera (backpressure).
+        Cuando retorna, el item fue aceptado y será procesado.
+        """
+        if not self._accepting:
+            raise RuntimeError("El dispatcher no acepta trabajo (detenido o sin iniciar)")
+
+        lane = self._lanes[self._lane_of(item)]
+        await lane.capacity.acquire()
+        lane.pending += 1
+        self._idle.clear()
+
+        self._queues.setdefault(key, deque()).append((item, lane.name, time.monotonic()))
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            async with self._condition:
+                lane.ready.append(key)
+                self._condition.notify_all()
+
+    def _next_ready(self, serves: List[str]) -> Optional[_Lane]:
+        """Primera lane (en orden de prioridad) con chats listos."""
+        for name in serves:
+            if self._lanes[name].ready:
+                return self._lanes[name]
+        return None
+
+    async def _worker(self, worker_id: str, serves: List[str]):
+        """Toma un chat listo, procesa su siguiente item y lo vuelve a publicar si quedan."""
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: self._next_ready(serves) is not None)
+                lane = self._next_ready(serves)
+                key = lane.ready.popleft()
+
+            queue = self._queues[key]
+            item, _, enqueued_at = queue.popleft()
+            lane.pending -= 1
+            lane.capacity.release()
+            lane.wait_samples.append(time.monotonic() - enqueued_at)
+
+            lane.in_flight += 1
+            started = time.monotonic()
+            try:
+                await self._handler(item)
+                lane.processed += 1
+            except Exception as e:
+                lane.failed += 1
+                logger.error(f"Error no controlado en el worker {worker_id} (chat {key}): {e}")
+            finally:
+                lane.busy_seconds += time.monotonic() - started
+                lane.in_flight -= 1
+
+                if queue:
+                    # El siguiente item del chat define la lane; va al final para repartir turnos
+                    async with self._condition:
+                        self._lanes[queue[0][1]].ready.append(key)
+                        self._condition.notify_all()
+                else:
+                    self._scheduled.discard(key)
+                    self._queues.pop(key, None)
+
+                if not any(l.pending or l.in_flight for l in self._lanes.values()):
+                    self._idle.set()
+
+    @property
+    def pending(self) -> int:
+        """Cantidad de items encolados que todavía no empezaron a procesarse."""
+        return sum(lane.pending for lane in self._lanes.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas por lane: profundidad de cola, utilización de workers y espera en cola."""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        lanes = {}
+        for name, lane in self._lanes.items():
+            capacity_seconds = elapsed * lane.workers
+            lanes[name] = {
+                "queue_depth": lane.pending,
+                "queue_capacity": lane.max_pending,
+                "workers": lane.workers,
+                "busy": lane.in_flight,
+                "worker_utilization": lane.busy_seconds / capacity_seconds if capacity_seconds else 0.0,
+                "processed": lane.processed,
+                "failed": lane.failed,
+                "queue_wait_p50": percentile(lane.wait_samples, 50),
+                "queue_wait_p99": percentile(lane.wait_samples, 99),
+            }
+        return {
+            "queue_depth": self.pending,
+            "active_chats": len(self._queues),
+            "lanes": lanes,
+        }
+
+    async def join(self):
+        """Espera a que se procesen todos los items aceptados."""
+        await self._idle.wait()
+
+    async def stop(self, drain_timeout: Optional[float] = None):
+        """
+        Deja de aceptar trabajo, drena las colas (hasta drain_timeout segundos) y
+        detiene los workers. Lo que no llegó a procesarse se descarta.
+        """
+        self._accepting = False
+        if self._workers:
+            try:
+                await asyncio.wait_for(self.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Timeout drenando la cola: se descartan {self.pending} items pendientes")
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
@@ -2,10 +2,15 @@
 Middleware para manejo centralizado de errores en callbacks de Telegram.
 Similar a los error handlers de Express.js
 """
+import asyncio
 import aiohttp
 from functools import wraps
 from typing import Callable
+from src.schemas import TelegramAudioMessage
 from src.utils.logger import setup_logger
+from src.utils.metrics import stage
+from src.utils.resilience import BackendUnavailable
+from src.utils.trace import start_trace, end_trace
 
 logger = setup_logger(__name__)
 
@@ -18,15 +23,21 @@ def handle_telegram_errors(cleanup_audio: bool = False):
         cleanup_audio: Si True, espera que la función retorne (result, audio_path)
                        para hacer cleanup del archivo temporal
 
+    Cada mensaje abre un trace (su id aparece en los logs) y su procesamiento
+    completo se mide como la etapa "message" de las métricas.
+
     """
     def decorator(func: Callable):
         @wraps(func)
         async def wrapper(self, message, *args, **kwargs):
             audio_file_path = None
+            # Trace del mensaje: lo leen los logs y las métricas de cada etapa
+            trace = start_trace("audio" if isinstance(message, TelegramAudioMessage) else "text")
 
             try:
-                # Ejecutar la función original
-                result = await func(self, message, *args, **kwargs)
+                # Ejecutar la función original (se mide como la etapa "message")
+                async with stage("message"):
+                    result = await func(self, message, *args, **kwargs)
 
                 # Si retorna tupla con audio_path, extraerlo
                 if cleanup_audio and isinstance(result, tuple):
@@ -38,35 +49,56 @@ def handle_telegram_errors(cleanup_audio: bool = False):
                 logger.error(f"Archivo no encontrado: {e}")
                 await self.telegram_service.send_message(
                     "❌ Error: Archivo no encontrado",
-                    reply_to_message_id=message.message_id
+                    reply_to_message_id=message.message_id,
+                    chat_id=message.chat.chat_id
+                )
+
+            except BackendUnavailable as e:
+                logger.warning(f"Backend no disponible: {e}")
+                await self.telegram_service.send_message(
+                    "🚧 El servicio está saturado o no disponible, probá de nuevo en unos minutos",
+                    reply_to_message_id=message.message_id,
+                    chat_id=message.chat.chat_id
+                )
+
+            except asyncio.TimeoutError:
+                logger.error("Timeout esperando la respuesta de la API")
+                await self.telegram_service.send_message(
+                    "⏱️ Error: La API tardó demasiado en responder",
+                    reply_to_message_id=message.message_id,
+                    chat_id=message.chat.chat_id
                 )
 
             except aiohttp.ClientResponseError as e:
                 logger.error(f"Error HTTP de API: {e}")
                 await self.telegram_service.send_message(
                     f"❌ Error de conexión con API (HTTP {e.status})",
-                    reply_to_message_id=message.message_id
+                    reply_to_message_id=message.message_id,
+                    chat_id=message.chat.chat_id
                 )
 
             except aiohttp.ClientError as e:
                 logger.error(f"Error de conexión con API: {e}")
                 await self.telegram_service.send_message(
                     "⏱️ Error: La API tardó demasiado en responder o falló la conexión",
-                    reply_to_message_id=message.message_id
+                    reply_to_message_id=message.message_id,
+                    chat_id=message.chat.chat_id
                 )
 
             except ValueError as e:
                 logger.error(f"Error de validación: {e}")
                 await self.telegram_service.send_message(
                     f"⚠️ Error al procesar: {str(e)}",
-                    reply_to_message_id=message.message_id
+                    reply_to_message_id=message.message_id,
+                    chat_id=message.chat.chat_id
                 )
 
             except Exception as e:
                 logger.error(f"Error inesperado en {func.__name__}: {e}", exc_info=True)
                 await self.telegram_service.send_message(
                     f"💥 Error inesperado: {str(e)}",
-                    reply_to_message_id=message.message_id
+                    reply_to_message_id=message.message_id,
+                    chat_id=message.chat.chat_id
                 )
 
             finally:
@@ -76,6 +108,7 @@ def handle_telegram_errors(cleanup_audio: bool = False):
                         self.telegram_service.cleanup_audio_file(audio_file_path)
                     except Exception as cleanup_error:
                         logger.error(f"Error en cleanup: {cleanup_error}")
+                end_trace(trace)
 
         return wrapper
     return decorator
@@ -0,0 +1,33 @@
+"""
+JSON rápido para el camino de cada update: usa orjson si está instalado y el
+módulo json de la librería estándar si no.
+"""
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional
+    orjson = None
+
+# orjson.JSONDecodeError hereda de json.JSONDecodeError: se captura igual en ambos casos
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Decodifica un documento JSON."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """Codifica un objeto como JSON compacto."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def backend() -> str:
+    """Nombre de la implementación en uso."""
+    return "orjson" if orjson is not None else "json"
@@ -0,0 +1,89 @@
+"""
+Cliente HTTP compartido: una sola sesión aiohttp (y un solo pool de conexiones)
+para todos los servicios.
+"""
+from typing import Any, Dict, Optional
+import aiohttp
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class HttpClient:
+    """
+    Dueño de la ClientSession compartida y de su TCPConnector.
+
+    El connector mantiene conexiones keep-alive por host (se evita un handshake
+    TLS por cada ráfaga), cachea las resoluciones DNS y limita las conexiones
+    totales y por host. aiohttp activa TCP_NODELAY en cada conexión, así las
+    requests chicas (sendMessage, queries) no esperan por Nagle.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._stats = {
+            "requests": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "pool_waits": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        """Trace hooks de aiohttp que alimentan las estadísticas del pool."""
+        trace = aiohttp.TraceConfig()
+
+        def counter(name: str):
+            async def increment(session, context, params):
+                self._stats[name] += 1
+            return increment
+
+        trace.on_request_start.append(counter("requests"))
+        trace.on_connection_create_end.append(counter("connections_created"))
+        trace.on_connection_reuseconn.append(counter("connections_reused"))
+        trace.on_connection_queued_start.append(counter("pool_waits"))
+        trace.on_dns_cache_hit.append(counter("dns_cache_hits"))
+        trace.on_dns_cache_miss.append(counter("dns_cache_misses"))
+        return trace
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Obtiene o crea la sesión compartida (sin awaits: no hay carrera al crearla)."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.HTTP_POOL_LIMIT,
+                limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+                use_dns_cache=True,
+                ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+                enable_cleanup_closed=True,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                trace_configs=[self._trace_config()],
+            )
+        return self._session
+
+    def stats(self) -> Dict[str, Any]:
+        """Reutilización de sockets y utilización del pool."""
+        connector = self._session.connector if self._session and not self._session.closed else None
+        # _acquired es interno de aiohttp: conexiones actualmente prestadas a una request
+        in_use = len(getattr(connector, "_acquired", ())) if connector else 0
+        limit = connector.limit if connector else settings.HTTP_POOL_LIMIT
+        opened = self._stats["connections_created"] + self._stats["connections_reused"]
+        return {
+            **self._stats,
+            "reuse_ratio": self._stats["connections_reused"] / opened if opened else 0.0,
+            "connections_in_use": in_use,
+            "pool_limit": limit,
+            "pool_utilization": in_use / limit if limit else 0.0,
+        }
+
+    async def close(self):
+        """Cierra la sesión compartida y todas sus conexiones."""
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+
+http_client = HttpClient()
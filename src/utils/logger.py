@@ -1,6 +1,205 @@
+"""
+Logging del servicio.
+
+Con LOG_ASYNC (default) los loggers no escriben: encolan el registro sin
+formatear en una QueueHandler y un QueueListener en un thread aparte formatea y
+escribe en stdout, así una escritura lenta (pipe lleno, driver de logs de
+Docker) no frena el event loop. Si la cola se llena se descartan registros en
+lugar de bloquear.
+
+Los mensajes usan formato lazy (`logger.info("Texto: %s", texto)`): si el nivel
+está deshabilitado no se arma el string, y si está habilitado se arma en el
+thread del listener (si algún arg es mutable, al loguear, para no mostrar un
+estado posterior). Los mensajes largos se truncan a LOG_MAX_MESSAGE_LENGTH.
+
+Las líneas repetitivas (p. ej. una por cada poll) se pueden muestrear desde el
+llamador con `extra=SAMPLED`: se emite una de cada LOG_SAMPLE_EVERY.
+"""
+import atexit
 import logging
+import queue
 import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import IO, Dict, Optional, Tuple
 from src.config.settings import settings
+from src.utils import fast_json
+from src.utils.trace import current_trace_id
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(trace)s%(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Args que se pueden formatear más tarde en el listener sin cambiar el mensaje
+_IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+# extra= para líneas repetitivas: se emite una de cada LOG_SAMPLE_EVERY
+SAMPLED = {"sample": True}
+
+
+def _truncate(message: str, limit: int) -> str:
+    if limit and len(message) > limit:
+        return f"{message[:limit]}... (+{len(message) - limit} caracteres)"
+    return message
+
+
+class _TraceFilter(logging.Filter):
+    """
+    Agrega el trace id del mensaje en proceso (si hay) a cada registro. Corre en
+    el thread del llamador: el contextvar no se ve desde el listener.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace_id = current_trace_id()
+        record.trace = f"[{trace_id}] " if trace_id else ""
+        record.trace_id = trace_id
+        return True
+
+
+class _SamplingFilter(logging.Filter):
+    """Deja pasar uno de cada `every` registros marcados con SAMPLED (por logger y mensaje)."""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._counts: Dict[Tuple[str, str], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every <= 1 or not getattr(record, "sample", False):
+            return True
+        key = (record.name, str(record.msg))
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """Formato de texto de siempre, con el mensaje truncado."""
+
+    def __init__(self, max_length: int):
+        super().__init__(TEXT_FORMAT, datefmt=DATE_FORMAT)
+        self.max_length = max_length
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = _truncate(record.message, self.max_length)
+        return super().formatMessage(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea: ts, level, logger, msg y, si hay, trace_id, sampled y exc."""
+
+    def __init__(self, max_length: int):
+        super().__init__()
+        self.max_length = max_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": _truncate(record.getMessage(), self.max_length),
+        }
+        if getattr(record, "trace_id", None):
+            entry["trace_id"] = record.trace_id
+        if getattr(record, "sampled", None):
+            entry["sampled"] = record.sampled
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return fast_json.dumps(entry)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler que encola el registro sin formatearlo en el thread del llamador
+    (salvo que tenga args mutables) y descarta si la cola está llena.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock_dropped = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Los args inmutables se formatean en el listener. Uno mutable (dict, lista,
+        # objeto) podría cambiar antes de eso: ese mensaje se arma acá, con su estado
+        # al momento del log.
+        if record.args and not (
+            isinstance(record.args, tuple) and all(isinstance(arg, _IMMUTABLE_ARGS) for arg in record.args)
+        ):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+
+
+def create_handler(
+    stream: IO[str],
+    use_queue: bool,
+    log_format: str = "text",
+    max_length: int = 0,
+    sample_every: int = 1,
+    queue_size: int = 10000,
+) -> Tuple[logging.Handler, Optional[QueueListener]]:
+    """
+    Arma el handler de los loggers. Con use_queue retorna una QueueHandler y el
+    QueueListener (ya iniciado) que escribe en stream; si no, un StreamHandler.
+    """
+    formatter_class = JsonFormatter if log_format == "json" else TextFormatter
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(formatter_class(max_length))
+
+    listener = None
+    handler: logging.Handler = stream_handler
+    if use_queue:
+        handler = _NonBlockingQueueHandler(queue.Queue(queue_size))
+        listener = QueueListener(handler.queue, stream_handler)
+        listener.start()
+
+    handler.addFilter(_SamplingFilter(sample_every))
+    handler.addFilter(_TraceFilter())
+    return handler, listener
+
+
+_handler: Optional[logging.Handler] = None
+_listener: Optional[QueueListener] = None
+
+
+def _shared_handler() -> logging.Handler:
+    """Handler único del proceso, compartido por todos los loggers."""
+    global _handler, _listener
+    if _handler is None:
+        _handler, _listener = create_handler(
+            sys.stdout,
+            use_queue=settings.LOG_ASYNC,
+            log_format=settings.LOG_FORMAT,
+            max_length=settings.LOG_MAX_MESSAGE_LENGTH,
+            sample_every=settings.LOG_SAMPLE_EVERY,
+            queue_size=settings.LOG_QUEUE_SIZE,
+        )
+        _handler.setLevel(getattr(logging, settings.LOG_LEVEL))
+        if _listener is not None:
+            atexit.register(shutdown_logging)
+    return _handler
+
+
+def shutdown_logging():
+    """Escribe lo que quedó en la cola y detiene el listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        dropped = getattr(_handler, "dropped", 0)
+        if dropped:
+            sys.stderr.write(f"logger: {dropped} registros descartados por cola llena\n")
 
 
 def setup_logger(name: str) -> logging.Logger:
@@ -10,15 +209,6 @@ def setup_logger(name: str) -> logging.Logger:
     logger.setLevel(getattr(logging, settings.LOG_LEVEL))
 
     if not logger.handlers:
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(getattr(logging, settings.LOG_LEVEL))
-
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        handler.setFormatter(formatter)
-
-        logger.addHandler(handler)
+        logger.addHandler(_shared_handler())
 
     return logger
@@ -0,0 +1,215 @@
+"""
+Métricas en memoria con exposición en formato Prometheus (text format 0.0.4).
+
+Registro liviano sin dependencias: contadores, gauges e histogramas con labels,
+más "collectors" que exportan en cada scrape los stats() que ya tienen los
+servicios. Registrar una observación es un par de operaciones sobre un dict, así
+que la instrumentación queda siempre activa.
+"""
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.utils.trace import current_kind
+
+# Segundos: de una respuesta de cache a una transcripción larga
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Contador monótono por combinación de labels."""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1):
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, values)} {_format_value(value)}"
+            for values, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+    """Valor que sube y baja (p. ej. llamadas en curso)."""
+    kind = "gauge"
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues):
+        self._values[labelvalues] = value
+
+
+class Histogram(_Metric):
+    """Histograma acumulativo con buckets fijos por combinación de labels."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List[float]] = {}  # labels -> [count por bucket..., +Inf, suma]
+
+    def observe(self, value: float, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        # Se cuenta solo en el primer bucket que lo contiene; render() acumula
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]!r}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _flatten(prefix: str, stats: Dict[str, Any], gauges: Dict[str, List[Tuple[str, float]]]):
+    """
+    Aplana un dict de stats() en gauges: las claves anidadas se unen con "_", los
+    bool pasan a 0/1 y los textos (p. ej. el estado de un breaker) se exportan como
+    label state con valor 1.
+    """
+    for key, value in stats.items():
+        name = f"{prefix}_{key}".replace("-", "_").replace(".", "_")
+        if isinstance(value, dict):
+            _flatten(name, value, gauges)
+        elif isinstance(value, bool):
+            gauges.setdefault(name, []).append(("", int(value)))
+        elif isinstance(value, (int, float)):
+            gauges.setdefault(name, []).append(("", value))
+        elif isinstance(value, str):
+            gauges.setdefault(name, []).append((f'{{state="{_escape(value)}"}}', 1))
+
+
+class MetricsRegistry:
+    """Métricas del proceso y collectors de stats() de los servicios."""
+
+    def __init__(self, namespace: str = "telegram_bot"):
+        self.namespace = namespace
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(f"{self.namespace}_{name}", help_text, labelnames))  # type: ignore
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(f"{self.namespace}_{name}", help_text, labelnames))  # type: ignore
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(f"{self.namespace}_{name}", help_text, labelnames, buckets))  # type: ignore
+
+    def add_collector(self, prefix: str, stats: Callable[[], Dict[str, Any]]):
+        """Exporta en cada scrape el dict de stats() como gauges {namespace}_{prefix}_*."""
+        self._collectors[prefix] = stats
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+
+        for prefix, stats in self._collectors.items():
+            gauges: Dict[str, List[Tuple[str, float]]] = {}
+            try:
+                _flatten(f"{self.namespace}_{prefix}", stats(), gauges)
+            except Exception as e:  # Un collector roto no debe tirar el scrape completo
+                lines.append(f"# collector {prefix} falló: {_escape(e)}")
+                continue
+            for name, samples in gauges.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{labels} {_format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram(
+    "stage_duration_seconds", "Duración de cada etapa del pipeline", ("stage", "kind")
+)
+STAGE_IN_FLIGHT = registry.gauge(
+    "stage_in_flight", "Llamadas en curso por etapa", ("stage", "kind")
+)
+STAGE_ERRORS = registry.counter(
+    "stage_errors_total", "Errores por etapa y tipo de excepción", ("stage", "kind", "error")
+)
+
+
+class stage:
+    """
+    Mide una etapa del pipeline (context manager sync o async):
+
+        async with stage("transcribe"):
+            ...
+
+    Registra la duración en un histograma, las llamadas en curso y los errores por
+    tipo de excepción, con labels stage y kind (el tipo del mensaje del trace actual).
+    """
+    __slots__ = ("name", "kind", "started")
+
+    def __init__(self, name: str, kind: Optional[str] = None):
+        self.name = name
+        self.kind = kind
+
+    def __enter__(self) -> "stage":
+        if self.kind is None:
+            self.kind = current_kind()
+        STAGE_IN_FLIGHT.inc(self.name, self.kind)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_DURATION.observe(time.perf_counter() - self.started, self.name, self.kind)
+        STAGE_IN_FLIGHT.dec(self.name, self.kind)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(self.name, self.kind, exc_type.__name__)
+        return False
+
+    async def __aenter__(self) -> "stage":
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
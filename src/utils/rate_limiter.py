@@ -0,0 +1,70 @@
+"""
+Rate limiting con token bucket.
+"""
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket async: `rate` tokens por segundo con ráfagas de hasta `capacity`.
+
+    acquire() espera hasta que haya un token; las esperas se atienden en orden de
+    llegada. block() congela el bucket (p. ej. tras un 429 con retry_after).
+    No es thread-safe: está pensado para usarse desde el event loop.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Args:
+            rate: Tokens que se reponen por segundo
+            capacity: Máximo de tokens acumulables (tamaño de ráfaga)
+        """
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Segundos hasta que haya un token disponible (0 si hay uno ya)."""
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """Consume un token, esperando lo necesario."""
+        async with self._lock:
+            while True:
+                wait = self.delay()
+                if wait <= 0:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(wait)
+
+    def try_acquire(self) -> bool:
+        """Consume un token si hay uno disponible ya; no espera."""
+        if self._lock.locked() or self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    def block(self, seconds: float):
+        """No entrega tokens durante `seconds` y vacía el bucket (sin ráfaga al reanudar)."""
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        self.tokens = 0.0
+        self._updated = self._blocked_until
+
+    def is_idle(self) -> bool:
+        """True si el bucket está lleno y sin bloqueo (se puede descartar sin perder estado)."""
+        return not self._lock.locked() and self.delay() == 0.0 and self.tokens >= self.capacity
@@ -0,0 +1,262 @@
+"""
+Capa de resiliencia para backends HTTP: circuit breaker, límite de concurrencia
+adaptativo (AIMD) y reintentos con presupuesto de tiempo.
+"""
+import asyncio
+import time
+import aiohttp
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+from src.config.settings import settings
+from src.utils.logger import setup_logger
+from src.utils.retry import retry_async
+
+logger = setup_logger(__name__)
+
+RETRYABLE_STATUS = (429, 502, 503, 504)  # El backend no procesó la request
+# Tras un 502/504 del gateway la request pudo haber llegado al backend: solo se
+# reintenta con estos en backends que no guardan estado (repetirla no duplica nada)
+NON_IDEMPOTENT_RETRYABLE_STATUS = (429, 503)
+
+
+class BackendUnavailable(Exception):
+    """El backend no acepta más trabajo por ahora (se falla rápido en lugar de esperar)."""
+
+
+class CircuitOpenError(BackendUnavailable):
+    """El circuit breaker del backend está abierto."""
+
+
+class OverloadedError(BackendUnavailable):
+    """No hubo lugar en el límite de concurrencia del backend a tiempo."""
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """Errores que indican un backend degradado (cuentan para el breaker y el límite)."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500 or error.status == 429
+    return isinstance(error, (asyncio.TimeoutError, aiohttp.ClientConnectionError))
+
+
+def is_retryable(error: BaseException, statuses: Tuple[int, ...] = RETRYABLE_STATUS) -> bool:
+    """
+    Errores en los que el backend seguro no procesó la request: se pueden reintentar
+    sin duplicar trabajo. Un timeout no se reintenta (además agotó el presupuesto).
+    Las fallas de conexión solo se reintentan si ocurrieron antes de enviar la request.
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in statuses
+    return isinstance(error, aiohttp.ClientConnectorError)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por fallas consecutivas.
+
+    closed: las llamadas pasan. Tras `failure_threshold` fallas seguidas se abre.
+    open: las llamadas fallan de inmediato con CircuitOpenError durante
+          `recovery_timeout` segundos.
+    half_open: se deja pasar una llamada de prueba; si sale bien se cierra, si
+               falla se vuelve a abrir.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self.opens = 0
+        self.rejected = 0
+
+    def allow(self):
+        """Lanza CircuitOpenError si la llamada no puede pasar."""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = "half_open"
+            logger.info(f"Circuit breaker de {self.name}: probando el backend (half-open)")
+
+        if self.state == "open" or (self.state == "half_open" and self._trial_in_flight):
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} no disponible (circuit breaker abierto)")
+
+        if self.state == "half_open":
+            self._trial_in_flight = True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit breaker de {self.name}: cerrado, el backend respondió")
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.opens += 1
+            logger.warning(
+                f"Circuit breaker de {self.name}: abierto tras {self.failures} fallas, "
+                f"se rechazan llamadas por {self.recovery_timeout}s"
+            )
+
+    def release(self):
+        """Libera la llamada de prueba sin resultado (p. ej. cancelada)."""
+        self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures, "opens": self.opens, "rejected": self.rejected}
+
+
+class AdaptiveLimiter:
+    """
+    Límite de concurrencia adaptativo AIMD guiado por la latencia observada.
+
+    La latencia base es la mínima de las últimas muestras (el backend sin carga).
+    Cada respuesta rápida (latencia <= base * tolerance) sube el límite de a
+    1/límite (≈ +1 por cada ronda completa de llamadas); una respuesta lenta lo
+    baja un 10% y una falla (timeout, 5xx, conexión) un 30%. Cuando el backend se
+    degrada el límite cae rápido y las llamadas que no consiguen lugar dentro de
+    `queue_timeout` se rechazan (OverloadedError) en lugar de ocupar workers.
+    """
+
+    def __init__(self, name: str, max_limit: int, min_limit: int = 1, tolerance: float = 2.0, queue_timeout: float = 2.0):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.tolerance = tolerance
+        self.queue_timeout = queue_timeout
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._samples: Deque[float] = deque(maxlen=100)
+        self._condition = asyncio.Condition()
+        self.shed = 0
+
+    async def acquire(self, timeout: Optional[float] = None):
+        """Ocupa un lugar; lanza OverloadedError si no lo consigue a tiempo."""
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        async with self._condition:
+            try:
+                await asyncio.wait_for(self._condition.wait_for(lambda: self.in_flight < int(self.limit)), timeout)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                raise OverloadedError(
+                    f"{self.name} saturado: {self.in_flight} llamadas en curso (límite {int(self.limit)})"
+                ) from None
+            self.in_flight += 1
+
+    async def release(self, latency: Optional[float] = None, failed: bool = False):
+        """Libera el lugar y ajusta el límite según el resultado de la llamada."""
+        if failed:
+            self.limit = max(self.min_limit, self.limit * 0.7)
+        elif latency is not None:
+            self._samples.append(latency)
+            if latency > min(self._samples) * self.tolerance:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"limit": round(self.limit, 2), "in_flight": self.in_flight, "shed": self.shed}
+
+
+class ResilientBackend:
+    """
+    Envoltorio de llamadas a un backend: circuit breaker + límite adaptativo +
+    reintentos con backoff exponencial y jitter, todo dentro de un presupuesto de
+    tiempo total (`timeout`) que cubre la espera de lugar, los intentos y los
+    backoffs. Cada intento recibe solo lo que queda del presupuesto.
+
+    Con idempotent=False (backends con estado, como el de queries) no se reintentan
+    los 502/504: el gateway pudo haber entregado la request antes de fallar.
+    """
+
+    def __init__(self, name: str, timeout: float, retries: int, max_concurrency: int, idempotent: bool = True):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_status = RETRYABLE_STATUS if idempotent else NON_IDEMPOTENT_RETRYABLE_STATUS
+        self.breaker = CircuitBreaker(name, settings.CIRCUIT_FAILURE_THRESHOLD, settings.CIRCUIT_RECOVERY_TIMEOUT)
+        self.limiter = AdaptiveLimiter(
+            name,
+            max_concurrency,
+            min_limit=settings.ADAPTIVE_MIN_CONCURRENCY,
+            tolerance=settings.ADAPTIVE_LATENCY_TOLERANCE,
+            queue_timeout=settings.ADAPTIVE_QUEUE_TIMEOUT
+        )
+        self.calls = 0
+        self.attempts = 0
+        self.failures = 0
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args, retries: Optional[int] = None) -> Any:
+        """
+        Ejecuta func(*args) con la política del backend.
+
+        Args:
+            retries: Reintentos para esta llamada (default: los del backend). Usar 0
+                     cuando func no puede repetirse (p. ej. un upload en streaming)
+        """
+        self.calls += 1
+        deadline = time.monotonic() + self.timeout
+        return await retry_async(
+            self._attempt,
+            func,
+            deadline,
+            *args,
+            retries=self.retries if retries is None else retries,
+            delay=settings.RETRY_BASE_DELAY,
+            retry_if=lambda error: is_retryable(error, self.retry_status),
+            deadline=deadline
+        )
+
+    async def _attempt(self, func: Callable[..., Awaitable[Any]], deadline: float, *args) -> Any:
+        self.breaker.allow()
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"Se agotó el presupuesto de tiempo de {self.name}")
+            await self.limiter.acquire(remaining)
+        except BaseException:
+            # La llamada no llegó al backend: si era la de prueba, no deja el breaker trabado en half-open
+            self.breaker.release()
+            raise
+
+        self.attempts += 1
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(*args), deadline - started)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            await self.limiter.release()
+            raise
+        except Exception as e:
+            if is_backend_failure(e):
+                self.failures += 1
+                self.breaker.record_failure()
+                await self.limiter.release(failed=True)
+            else:
+                # El backend respondió (p. ej. un 4xx o una respuesta inválida): está sano
+                self.breaker.record_success()
+                await self.limiter.release(latency=time.monotonic() - started)
+            raise
+
+        self.breaker.record_success()
+        await self.limiter.release(latency=time.monotonic() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Estado del breaker, del límite de concurrencia y contadores de llamadas."""
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "failures": self.failures,
+            "breaker": self.breaker.stats(),
+            "concurrency": self.limiter.stats(),
+        }
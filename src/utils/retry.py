@@ -2,7 +2,9 @@
 Utilidad para manejar reintentos en llamadas async
 """
 import asyncio
-from typing import TypeVar, Callable, Any
+import random
+import time
+from typing import TypeVar, Callable, Any, Optional, Tuple, Type
 from src.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
@@ -10,12 +12,27 @@ logger = setup_logger(__name__)
 T = TypeVar('T')
 
 
+def backoff_delay(attempt: int, delay: float = 1.0, backoff: float = 2.0, max_delay: float = 30.0, jitter: bool = True) -> float:
+    """
+    Espera antes del reintento número `attempt` (desde 0): backoff exponencial acotado.
+    Con jitter se usa "full jitter" (un valor al azar entre 0 y el delay), así los
+    clientes que fallaron juntos no reintentan todos al mismo tiempo.
+    """
+    current = min(max_delay, delay * backoff ** attempt)
+    return random.uniform(0, current) if jitter else current
+
+
 async def retry_async(
     func: Callable[..., Any],
     *args,
     retries: int = 0,
     delay: float = 1.0,
     backoff: float = 2.0,
+    max_delay: float = 30.0,
+    jitter: bool = True,
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+    retry_if: Optional[Callable[[BaseException], bool]] = None,
+    deadline: Optional[float] = None,
     **kwargs
 ) -> T:
     """
@@ -27,6 +44,11 @@ async def retry_async(
         retries: Número de reintentos (default: 0 = sin reintentos)
         delay: Tiempo de espera inicial entre reintentos en segundos (default: 1.0)
         backoff: Multiplicador para el delay en cada reintento (default: 2.0)
+        max_delay: Tope del delay entre reintentos en segundos (default: 30.0)
+        jitter: Si True, cada espera es un valor al azar entre 0 y el delay (default: True)
+        retry_on: Excepciones que se reintentan; el resto se propaga de inmediato
+        retry_if: Filtro adicional: solo se reintenta si retry_if(excepción) es True
+        deadline: Instante (time.monotonic) a partir del cual no se reintenta más
         **kwargs: Argumentos con nombre para la función
 
     Returns:
@@ -35,26 +57,22 @@ async def retry_async(
     Raises:
         La última excepción si se agotan los reintentos
     """
-    last_exception = None
-    current_delay = delay
-
     for attempt in range(retries + 1):
         try:
             return await func(*args, **kwargs)
-        except Exception as e:
-            last_exception = e
+        except retry_on as e:
+            if retry_if is not None and not retry_if(e):
+                raise
+
+            wait = backoff_delay(attempt, delay, backoff, max_delay, jitter)
+            out_of_time = deadline is not None and time.monotonic() + wait >= deadline
 
-            if attempt < retries:
+            if attempt < retries and not out_of_time:
                 logger.warning(
                     f"Intento {attempt + 1}/{retries + 1} falló para {func.__name__}: {e}. "
-                    f"Reintentando en {current_delay}s..."
+                    f"Reintentando en {wait:.2f}s..."
                 )
-                await asyncio.sleep(current_delay)
-                current_delay *= backoff
+                await asyncio.sleep(wait)
             else:
                 logger.error(f"Todos los intentos fallaron para {func.__name__}: {e}")
-                raise last_exception
-
-    # Esto no debería ejecutarse nunca, pero por si acaso
-    if last_exception:
-        raise last_exception
+                raise
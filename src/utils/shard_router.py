@@ -0,0 +1,255 @@
+"""
+Reparto de updates entre procesos worker por hash del chat_id (modo sharded).
+"""
+import asyncio
+import multiprocessing
+import queue
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+from src.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+SUPERVISE_INTERVAL = 1.0
+STABLE_AFTER = 60.0  # Un worker que vivió esto se considera sano: se reinicia el backoff
+
+
+def shard_of(key: Hashable, shards: int) -> int:
+    """Shard de un chat. Estable entre procesos y reinicios (no usa hash(), que es aleatorio para str)."""
+    return zlib.crc32(str(key).encode()) % shards
+
+
+class _Shard:
+    """Proceso worker de un shard, su canal de entrada y los updates sin confirmar."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[multiprocessing.Process] = None
+        self.inbox: Optional[multiprocessing.Queue] = None
+        self.unacked: "OrderedDict[int, Any]" = OrderedDict()  # update_id -> update, en orden de envío
+        self.started_at = 0.0
+        self.restarts = 0
+        self.failures = 0  # Caídas seguidas (para el backoff)
+        self.restart_at: Optional[float] = None
+        self.sent = 0
+        self.acked = 0
+
+
+class ShardRouter:
+    """
+    Etapa de ingest del modo sharded: reemplaza al ChatDispatcher en el proceso que
+    hace polling o atiende el webhook.
+
+    Cada update se envía, por un multiprocessing.Queue, al proceso worker de su
+    shard (hash del chat_id): un chat siempre cae en el mismo proceso y ahí su
+    ChatDispatcher mantiene el orden, mientras los distintos procesos usan
+    núcleos distintos. Los workers confirman cada update procesado por una cola
+    de salida compartida.
+
+    Backpressure: si un shard tiene `max_in_flight` updates sin confirmar, submit()
+    espera (igual que el dispatcher con su cola llena).
+
+    Supervisión: si un worker muere se levanta otro (con backoff exponencial si
+    se cae seguido) y se le reenvían en orden los updates que no había confirmado.
+    Para esos updates la entrega es al menos una vez.
+    """
+
+    def __init__(
+        self,
+        target: Callable[..., None],
+        shards: int,
+        max_in_flight: int = 500,
+        on_processed: Optional[Callable[[int], None]] = None,
+        restart_backoff_max: float = 30.0,
+    ):
+        """
+        Args:
+            target: Función (de nivel de módulo) que corre en cada worker:
+                    target(shard, shards, inbox, outbox). Recibe updates de inbox
+                    hasta un None y pone en outbox (shard, update_id) por cada uno procesado
+            shards: Cantidad de procesos worker
+            max_in_flight: Updates sin confirmar por shard antes de frenar al ingest
+            on_processed: Callback con el update_id de cada update confirmado
+            restart_backoff_max: Tope de la espera antes de reiniciar un worker caído
+        """
+        self._target = target
+        self._context = multiprocessing.get_context("spawn")
+        self._shards = [_Shard(i) for i in range(shards)]
+        self._outbox = self._context.Queue()
+        self.max_in_flight = max_in_flight
+        self._on_processed = on_processed
+        self._restart_backoff_max = restart_backoff_max
+        self._condition: Optional[asyncio.Condition] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._supervisor: Optional[asyncio.Task] = None
+        self._accepting = False
+        self._started_at: Optional[float] = None
+
+    def start(self):
+        """Levanta los procesos worker y las tareas de confirmación y supervisión."""
+        self._condition = asyncio.Condition()
+        self._accepting = True
+        self._started_at = time.monotonic()
+        for shard in self._shards:
+            self._spawn(shard)
+        self._collector = asyncio.create_task(self._collect_acks())
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    def _spawn(self, shard: _Shard):
+        shard.inbox = self._context.Queue()
+        shard.process = self._context.Process(
+            target=self._target,
+            args=(shard.index, len(self._shards), shard.inbox, self._outbox),
+            name=f"shard-{shard.index}",
+            daemon=True,
+        )
+        shard.process.start()
+        shard.started_at = time.monotonic()
+        # Lo que el worker anterior no confirmó se reenvía primero, en el orden original
+        for update in shard.unacked.values():
+            shard.inbox.put(update)
+        logger.info(f"Worker del shard {shard.index} iniciado (pid {shard.process.pid}, {len(shard.unacked)} updates reenviados)")
+
+    async def submit(self, key: Hashable, item: Any):
+        """Envía un update al worker de su shard. Espera si el shard tiene demasiados sin confirmar."""
+        if not self._accepting:
+            raise RuntimeError("El router no acepta trabajo (detenido o sin iniciar)")
+
+        shard = self._shards[shard_of(key, len(self._shards))]
+        if len(shard.unacked) >= self.max_in_flight:
+            async with self._condition:
+                await self._condition.wait_for(lambda: len(shard.unacked) < self.max_in_flight)
+
+        shard.unacked[item["update_id"]] = item
+        shard.sent += 1
+        if shard.restart_at is None:
+            # Mientras el worker está caído el update queda en unacked y se envía al reiniciarlo
+            shard.inbox.put(item)
+
+    async def _collect_acks(self):
+        """Lee las confirmaciones de los workers (en un thread, la cola es bloqueante)."""
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self._get_ack)
+            if message is None:
+                continue
+            index, update_id = message
+            shard = self._shards[index]
+            if shard.unacked.pop(update_id, None) is not None:
+                shard.acked += 1
+                if self._on_processed:
+                    self._on_processed(update_id)
+                async with self._condition:
+                    self._condition.notify_all()
+
+    def _get_ack(self):
+        try:
+            return self._outbox.get(timeout=0.5)
+        except queue.Empty:
+            return None
+
+    async def _supervise(self):
+        """Reinicia los workers que murieron."""
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            now = time.monotonic()
+            for shard in self._shards:
+                if shard.restart_at is not None:
+                    if now >= shard.restart_at:
+                        shard.restart_at = None
+                        shard.restarts += 1
+                        self._spawn(shard)
+                    continue
+
+                if shard.process.is_alive():
+                    if now - shard.started_at >= STABLE_AFTER:
+                        shard.failures = 0
+                    continue
+
+                wait = min(self._restart_backoff_max, 2 ** shard.failures - 1)
+                shard.failures += 1
+                shard.restart_at = now + wait
+                logger.error(
+                    f"El worker del shard {shard.index} terminó (exit code {shard.process.exitcode}) "
+                    f"con {len(shard.unacked)} updates sin confirmar: se reinicia en {wait:.0f}s"
+                )
+                shard.inbox.close()
+
+    @property
+    def pending(self) -> int:
+        """Updates enviados a los workers que todavía no confirmaron."""
+        return sum(len(shard.unacked) for shard in self._shards)
+
+    def stats(self) -> Dict[str, Any]:
+        """Por shard: pid, vivo, updates en vuelo, enviados, confirmados y reinicios."""
+        return {
+            "shards": len(self._shards),
+            "in_flight": self.pending,
+            "workers": {
+                shard.index: {
+                    "pid": shard.process.pid if shard.process else None,
+                    "alive": bool(shard.process and shard.process.is_alive()),
+                    "in_flight": len(shard.unacked),
+                    "sent": shard.sent,
+                    "acked": shard.acked,
+                    "restarts": shard.restarts,
+                }
+                for shard in self._shards
+            },
+        }
+
+    async def join(self):
+        """Espera a que los workers confirmen todo lo enviado."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.pending == 0)
+
+    async def stop(self, drain_timeout: Optional[float] = None):
+        """
+        Deja de aceptar updates, espera (hasta drain_timeout) a que los workers
+        confirmen lo enviado y los detiene; cada worker drena su propio dispatcher.
+        """
+        self._accepting = False
+        if self._condition is not None:
+            try:
+                await asyncio.wait_for(self.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Timeout drenando los shards: {self.pending} updates sin confirmar")
+
+        # Desde acá los workers terminan a propósito: no se reinician
+        await self._cancel(self._supervisor)
+        for shard in self._shards:
+            if shard.process and shard.process.is_alive():
+                shard.inbox.put(None)
+
+        loop = asyncio.get_running_loop()
+        for shard in self._shards:
+            if shard.process is None:
+                continue
+            await loop.run_in_executor(None, shard.process.join, drain_timeout)
+            if shard.process.is_alive():
+                logger.warning(f"El worker del shard {shard.index} no terminó a tiempo: se fuerza la salida")
+                shard.process.terminate()
+                await loop.run_in_executor(None, shard.process.join, 5)
+
+        # Las confirmaciones que llegaron mientras los workers terminaban
+        while (message := self._get_ack_nowait()) is not None:
+            index, update_id = message
+            if self._shards[index].unacked.pop(update_id, None) is not None and self._on_processed:
+                self._on_processed(update_id)
+
+        await self._cancel(self._collector)
+        self._collector = self._supervisor = None
+
+    @staticmethod
+    async def _cancel(task: Optional[asyncio.Task]):
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def _get_ack_nowait(self):
+        try:
+            return self._outbox.get_nowait()
+        except queue.Empty:
+            return None
@@ -0,0 +1,42 @@
+"""
+Coalescencia de llamadas async concurrentes con la misma clave (single-flight).
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Ejecuta a lo sumo una llamada en vuelo por clave: los llamadores concurrentes
+    con la misma clave esperan el mismo resultado (o la misma excepción).
+
+    La llamada corre en su propia tarea, así la cancelación de un llamador no
+    cancela el trabajo compartido con los demás.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta func() o se suma a la ejecución en curso para la misma clave."""
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    @property
+    def in_flight(self) -> int:
+        """Cantidad de claves con una llamada en curso."""
+        return len(self._calls)
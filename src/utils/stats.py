@@ -0,0 +1,28 @@
+"""
+Helpers estadísticos livianos para métricas en memoria.
+"""
+from collections import deque
+from typing import Deque, Dict, Iterable
+
+
+def percentile(samples: Iterable[float], pct: float) -> float:
+    """Percentil simple (nearest-rank) sobre una secuencia de muestras."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class LatencyWindow:
+    """Ventana de las últimas N muestras de latencia (segundos)."""
+
+    def __init__(self, size: int = 1000):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, value: float):
+        self.samples.append(value)
+
+    def summary(self) -> Dict[str, float]:
+        """p50/p99 de la ventana."""
+        return {"p50": percentile(self.samples, 50), "p99": percentile(self.samples, 99)}
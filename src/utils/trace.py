@@ -0,0 +1,39 @@
+"""
+Contexto del mensaje en proceso (trace id y tipo), propagado con contextvars.
+
+handle_telegram_errors abre un trace por mensaje: todo lo que corre dentro (las
+llamadas a servicios, los logs y las métricas) puede leerlo sin recibirlo como
+argumento.
+"""
+import contextvars
+import uuid
+from typing import NamedTuple, Optional
+
+
+class Trace(NamedTuple):
+    trace_id: str
+    kind: str  # "text" o "audio"
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace(kind: str) -> contextvars.Token:
+    """Abre un trace nuevo en el contexto actual. Retorna el token para cerrarlo."""
+    return _current.set(Trace(uuid.uuid4().hex[:16], kind))
+
+
+def end_trace(token: contextvars.Token):
+    """Restaura el contexto anterior a start_trace."""
+    _current.reset(token)
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current.get()
+    return trace.trace_id if trace else None
+
+
+def current_kind() -> str:
+    """Tipo del mensaje en proceso ("none" fuera de un mensaje, p. ej. en el polling)."""
+    trace = _current.get()
+    return trace.kind if trace else "none"
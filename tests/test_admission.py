@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from src.config.settings import settings
+from src.utils.admission import AdmissionController, CHAT_RATE, IN_FLIGHT, USER_RATE
+
+
+class FakeDispatcher:
+    def __init__(self, error=None):
+        self.submitted = []
+        self.error = error
+
+    async def submit(self, key, update):
+        if self.error:
+            raise self.error
+        self.submitted.append(update["update_id"])
+
+
+def _update(update_id, chat_id=-100, user_id=1):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "from": {"id": user_id}, "text": "hola"}}
+
+
+def _controller(dispatcher):
+    shed = []
+
+    async def on_shed(update, reason):
+        shed.append((update["update_id"], reason))
+
+    return AdmissionController(dispatcher, lambda update: "text", on_shed), shed
+
+
+@pytest.fixture(autouse=True)
+def _limites(monkeypatch):
+    # Tasas casi nulas: los buckets no se reponen durante el test
+    monkeypatch.setattr(settings, "ADMISSION_CHAT_RATE", 0.0001)
+    monkeypatch.setattr(settings, "ADMISSION_CHAT_BURST", 100)
+    monkeypatch.setattr(settings, "ADMISSION_USER_RATE", 0.0001)
+    monkeypatch.setattr(settings, "ADMISSION_USER_BURST", 100)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_IN_FLIGHT", 100)
+
+
+def _submit_all(controller, updates):
+    async def scenario():
+        for update in updates:
+            await controller.submit(update["message"]["chat"]["id"], update)
+    asyncio.run(scenario())
+
+
+def test_tope_de_updates_en_vuelo(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_MAX_IN_FLIGHT", 2)
+    dispatcher = FakeDispatcher()
+    controller, shed = _controller(dispatcher)
+
+    _submit_all(controller, [_update(1), _update(2), _update(3)])
+    assert dispatcher.submitted == [1, 2]
+    assert shed == [(3, IN_FLIGHT)]
+
+    controller.release(1)
+    _submit_all(controller, [_update(4)])
+    assert dispatcher.submitted == [1, 2, 4]
+
+
+def test_limite_por_chat(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_CHAT_BURST", 2)
+    dispatcher = FakeDispatcher()
+    controller, shed = _controller(dispatcher)
+
+    _submit_all(controller, [_update(1, user_id=1), _update(2, user_id=2), _update(3, user_id=3), _update(4, chat_id=-200)])
+    assert dispatcher.submitted == [1, 2, 4]
+    assert shed == [(3, CHAT_RATE)]
+
+
+def test_limite_por_usuario_no_gasta_el_cupo_del_chat(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_CHAT_BURST", 3)
+    monkeypatch.setattr(settings, "ADMISSION_USER_BURST", 1)
+    dispatcher = FakeDispatcher()
+    controller, shed = _controller(dispatcher)
+
+    _submit_all(controller, [_update(1, user_id=1), _update(2, user_id=1), _update(3, user_id=1), _update(4, user_id=2), _update(5, user_id=3)])
+    # Los dos rechazos del usuario 1 no consumieron tokens del chat: entran los otros dos usuarios
+    assert dispatcher.submitted == [1, 4, 5]
+    assert shed == [(2, USER_RATE), (3, USER_RATE)]
+    assert controller.stats()["shed"] == {USER_RATE: 2}
+
+
+@pytest.mark.parametrize("error", [RuntimeError("cola cerrada"), asyncio.CancelledError()])
+def test_update_que_no_se_pudo_encolar_no_ocupa_lugar(error):
+    controller, _ = _controller(FakeDispatcher(error))
+
+    with pytest.raises(type(error)):
+        _submit_all(controller, [_update(1)])
+    assert controller.stats()["in_flight"] == 0
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import stat
+from unittest import mock
+from src.config.settings import settings
+from src.services import audio_preprocessor
+from src.services.audio_preprocessor import AudioPreprocessor
+
+FAKE_FFMPEG = """#!/bin/sh
+# ffmpeg falso: copia la mitad de la entrada (-i) a la salida (último argumento)
+while [ $# -gt 1 ]; do
+    [ "$1" = "-i" ] && input="$2"
+    shift
+done
+head -c 500 "$input" > "$1"
+"""
+
+FAKE_FFPROBE = """#!/bin/sh
+echo 3.5
+"""
+
+
+def _executable(path, content):
+    path.write_text(content)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_process_preprocesa_y_registra_tiempos(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "FFMPEG_PATH", _executable(tmp_path / "ffmpeg", FAKE_FFMPEG))
+    monkeypatch.setattr(settings, "FFPROBE_PATH", _executable(tmp_path / "ffprobe", FAKE_FFPROBE))
+    monkeypatch.setattr(settings, "AUDIO_PREPROCESS_ENABLED", True)
+    audio = tmp_path / "audio.ogg"
+    audio.write_bytes(os.urandom(1000))
+
+    preprocessor = AudioPreprocessor()
+    assert preprocessor.enabled
+    try:
+        result = asyncio.run(preprocessor.process(str(audio)))
+    finally:
+        preprocessor.close()
+
+    assert result is not None
+    assert (result.bytes_in, result.bytes_out) == (1000, 500)
+    assert result.duration_in == 3.5
+    assert os.path.exists(result.path)
+    assert set(result.timings) == {"probe", "transcode", "queue"}
+    stats = preprocessor.stats()
+    assert stats["processed"] == 1 and stats["failed"] == 0
+
+
+def test_sin_ffmpeg_solo_advierte_si_el_preprocesamiento_esta_habilitado(monkeypatch):
+    monkeypatch.setattr(settings, "FFMPEG_PATH", "ffmpeg-inexistente")
+    monkeypatch.setattr(settings, "AUDIO_SEGMENT_ENABLED", True)
+    logger = mock.Mock()
+    monkeypatch.setattr(audio_preprocessor, "logger", logger)
+
+    monkeypatch.setattr(settings, "AUDIO_PREPROCESS_ENABLED", False)
+    preprocessor = AudioPreprocessor()
+    assert not preprocessor.enabled and not preprocessor.can_segment
+    logger.warning.assert_not_called()
+    logger.info.assert_called_once()
+
+    monkeypatch.setattr(settings, "AUDIO_PREPROCESS_ENABLED", True)
+    AudioPreprocessor()
+    logger.warning.assert_called_once()
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from src.config.settings import settings
+from src.bot import TelegramAudioBot
+
+
+def _text_update(update_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id * 10,
+            "date": 1760000000,
+            "text": text,
+            "from": {"id": 7, "is_bot": False, "first_name": "David"},
+            "chat": {"id": -100, "type": "group"},
+        },
+    }
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DEBOUNCE_ENABLED", True)
+    monkeypatch.setattr(settings, "DEBOUNCE_WINDOW", 0.05)
+    monkeypatch.setattr(settings, "DEBOUNCE_MAX_WAIT", 1)
+    monkeypatch.setattr(settings, "PROGRESSIVE_REPLIES_ENABLED", False)
+    monkeypatch.setattr(settings, "USER_WHITELIST_ENABLED", False)
+    monkeypatch.setattr(settings, "UPDATE_STORE_ENABLED", True)
+    monkeypatch.setattr(settings, "UPDATE_STORE_DB", str(tmp_path / "updates.db"))
+    monkeypatch.setattr(settings, "USER_REPOSITORY_DB", str(tmp_path / "users.db"))
+    bot = TelegramAudioBot()
+    yield bot
+    bot.user_repository.close()
+
+
+def test_mensajes_seguidos_se_responden_juntos_y_el_checkpoint_avanza_despues(bot):
+    queries, sent = [], []
+
+    async def send_query(question, session_id, **kwargs):
+        queries.append((question, session_id))
+        return {"answer": "respuesta"}
+
+    async def send_message(text, reply_to_message_id=None, chat_id=None, **kwargs):
+        # Al responder, ningún update del grupo está marcado como procesado todavía
+        sent.append((text, reply_to_message_id, set(bot.update_store._done_set)))
+
+    bot.query_service.send_query = send_query
+    bot.telegram_service.send_message = send_message
+
+    async def scenario():
+        updates = [_text_update(i, f"mensaje {i}") for i in (1, 2, 3)]
+        await bot.update_store.accept(updates)
+        for update in updates:
+            await bot._handle_update(update)
+        during_window = set(bot.update_store._done_set)
+        await bot.debouncer.close()
+        after_flush = set(bot.update_store._done_set)
+        await bot.update_store.close()
+        return during_window, after_flush
+
+    during_window, after_flush = asyncio.run(scenario())
+
+    assert queries == [("mensaje 1\nmensaje 2\nmensaje 3", "telegram-group--100")]
+    assert sent == [("respuesta", 30, set())]
+    assert during_window == set()
+    assert after_flush == {1, 2, 3}
+    assert bot._debounced == {}
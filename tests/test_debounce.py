@@ -0,0 +1,79 @@
+import asyncio
+from src.utils.debounce import SessionDebouncer
+
+
+class Flushes:
+    def __init__(self):
+        self.batches = []
+
+    async def __call__(self, key, items):
+        self.batches.append((key, list(items)))
+
+
+def test_mensajes_dentro_de_la_ventana_se_entregan_juntos():
+    flushes = Flushes()
+
+    async def scenario():
+        debouncer = SessionDebouncer(flushes, window=0.05, max_wait=1)
+        for item in (1, 2, 3):
+            debouncer.add("a", item)
+            await asyncio.sleep(0.01)
+        debouncer.add("b", 10)
+        await asyncio.sleep(0.15)
+        debouncer.add("a", 4)  # después de la ventana: otro batch
+        await debouncer.close()
+        return debouncer.stats()
+
+    stats = asyncio.run(scenario())
+    assert sorted(flushes.batches) == [("a", [1, 2, 3]), ("a", [4]), ("b", [10])]
+    assert (stats["batches"], stats["merged"], stats["pending"]) == (3, 2, 0)
+
+
+def test_max_items_cierra_el_batch_sin_esperar_la_ventana():
+    flushes = Flushes()
+
+    async def scenario():
+        debouncer = SessionDebouncer(flushes, window=10, max_wait=10, max_items=2)
+        debouncer.add("a", 1)
+        debouncer.add("a", 2)
+        debouncer.add("a", 3)
+        await asyncio.sleep(0.01)
+        closed = list(flushes.batches)
+        await debouncer.close()
+        return closed
+
+    assert asyncio.run(scenario()) == [("a", [1, 2])]
+    assert flushes.batches == [("a", [1, 2]), ("a", [3])]
+
+
+def test_max_wait_acota_la_espera_aunque_sigan_llegando_items():
+    flushes = Flushes()
+
+    async def scenario():
+        debouncer = SessionDebouncer(flushes, window=0.05, max_wait=0.1)
+        for item in range(8):
+            debouncer.add("a", item)
+            await asyncio.sleep(0.03)  # nunca pasa la ventana sin items
+        await debouncer.close()
+
+    asyncio.run(scenario())
+    batches = [items for _, items in flushes.batches]
+    assert len(batches) >= 2
+    assert [item for items in batches for item in items] == list(range(8))
+
+
+def test_batches_de_una_clave_se_entregan_en_orden():
+    delivered = []
+
+    async def slow_flush(key, items):
+        await asyncio.sleep(0.05 if items == [1] else 0)
+        delivered.append(items)
+
+    async def scenario():
+        debouncer = SessionDebouncer(slow_flush, window=10, max_wait=10, max_items=1)
+        debouncer.add("a", 1)
+        debouncer.add("a", 2)
+        await debouncer.close()
+
+    asyncio.run(scenario())
+    assert delivered == [[1], [2]]
@@ -0,0 +1,197 @@
+import asyncio
+from src.utils.dispatcher import ChatDispatcher
+
+
+class Recorder:
+    """Handler falso: registra inicio/fin de cada item y la concurrencia observada."""
+
+    def __init__(self, seconds=0.01):
+        self.seconds = seconds
+        self.started = []
+        self.finished = []
+        self.running = set()
+        self.max_running = 0
+        self.overlaps = []  # items de un mismo chat procesados a la vez
+
+    async def __call__(self, item):
+        chat, _ = item
+        if any(other[0] == chat for other in self.running):
+            self.overlaps.append(item)
+        self.running.add(item)
+        self.max_running = max(self.max_running, len(self.running))
+        self.started.append(item)
+        await asyncio.sleep(self.seconds)
+        self.running.discard(item)
+        self.finished.append(item)
+
+
+def test_orden_por_chat_y_chats_en_paralelo():
+    recorder = Recorder()
+
+    async def scenario():
+        dispatcher = ChatDispatcher(recorder, {"text": (4, 100)}, lambda item: "text")
+        dispatcher.start()
+        for i in range(5):
+            for chat in ("a", "b", "c"):
+                await dispatcher.submit(chat, (chat, i))
+        await dispatcher.join()
+        await dispatcher.stop()
+
+    asyncio.run(scenario())
+
+    for chat in ("a", "b", "c"):
+        assert [i for c, i in recorder.finished if c == chat] == list(range(5))
+    assert recorder.overlaps == []
+    assert recorder.max_running == 3  # un worker por chat, aunque haya 4
+
+
+def test_limite_global_de_concurrencia():
+    recorder = Recorder()
+
+    async def scenario():
+        dispatcher = ChatDispatcher(recorder, {"text": (2, 100)}, lambda item: "text")
+        dispatcher.start()
+        for chat in range(6):
+            await dispatcher.submit(chat, (chat, 0))
+        await dispatcher.join()
+        await dispatcher.stop()
+
+    asyncio.run(scenario())
+
+    assert len(recorder.finished) == 6
+    assert recorder.max_running == 2
+
+
+class Gate:
+    """Handler falso que no termina hasta que se abre la compuerta."""
+
+    def __init__(self):
+        self.open = asyncio.Event()
+        self.handled = []
+
+    async def __call__(self, item):
+        await self.open.wait()
+        if item == "falla":
+            raise RuntimeError("error del handler")
+        self.handled.append(item)
+
+
+def test_submit_espera_lugar_cuando_la_cola_esta_llena():
+    async def scenario():
+        gate = Gate()
+        dispatcher = ChatDispatcher(gate, {"text": (1, 2)}, lambda item: "text")
+        dispatcher.start()
+        await dispatcher.submit("a", 1)
+        await asyncio.sleep(0)  # el worker toma el 1: la cola vuelve a estar vacía
+        await dispatcher.submit("b", 2)
+        await dispatcher.submit("c", 3)
+
+        blocked = asyncio.create_task(dispatcher.submit("d", 4))
+        await asyncio.sleep(0.02)
+        was_blocked = not blocked.done()
+        depth = dispatcher.stats()["queue_depth"]
+
+        gate.open.set()
+        await blocked
+        await dispatcher.join()
+        await dispatcher.stop()
+        return was_blocked, depth, gate.handled
+
+    was_blocked, depth, handled = asyncio.run(scenario())
+    assert was_blocked
+    assert depth == 2
+    assert handled == [1, 2, 3, 4]
+
+
+def test_stats_cuentan_profundidad_en_curso_procesados_y_fallidos():
+    async def scenario():
+        gate = Gate()
+        dispatcher = ChatDispatcher(gate, {"text": (1, 10)}, lambda item: "text")
+        dispatcher.start()
+        for chat, item in (("a", 1), ("a", "falla"), ("b", 2)):
+            await dispatcher.submit(chat, item)
+        await asyncio.sleep(0)
+        during = dispatcher.stats()
+        gate.open.set()
+        await dispatcher.join()
+        after = dispatcher.stats()
+        await dispatcher.stop()
+        return during, after
+
+    during, after = asyncio.run(scenario())
+    assert during["queue_depth"] == 2
+    assert during["active_chats"] == 2
+    assert during["lanes"]["text"]["busy"] == 1
+    lane = after["lanes"]["text"]
+    assert after["queue_depth"] == 0 and after["active_chats"] == 0
+    assert (lane["busy"], lane["processed"], lane["failed"]) == (0, 2, 1)
+    assert 0 < lane["worker_utilization"] <= 1
+
+
+def test_stop_drena_lo_aceptado_y_despues_rechaza():
+    async def scenario():
+        gate = Gate()
+        gate.open.set()
+        dispatcher = ChatDispatcher(gate, {"text": (2, 10)}, lambda item: "text")
+        dispatcher.start()
+        for item in range(5):
+            await dispatcher.submit(item % 2, item)
+        await dispatcher.stop(drain_timeout=1)
+        try:
+            await dispatcher.submit("a", 99)
+        except RuntimeError:
+            return sorted(gate.handled), True
+        return sorted(gate.handled), False
+
+    handled, rejected = asyncio.run(scenario())
+    assert handled == [0, 1, 2, 3, 4]
+    assert rejected
+
+
+def _lanes_dispatcher(recorder):
+    return ChatDispatcher(
+        recorder,
+        {"text": (1, 100), "audio": (1, 100)},
+        lambda item: item[1],
+        priority=["text", "audio"],
+    )
+
+
+def test_textos_tienen_prioridad_sobre_el_backlog_de_audio():
+    recorder = Recorder()
+
+    async def scenario():
+        dispatcher = _lanes_dispatcher(recorder)
+        dispatcher.start()
+        for chat in range(5):
+            await dispatcher.submit(f"audio-{chat}", (f"audio-{chat}", "audio"))
+        for chat in range(3):
+            await dispatcher.submit(f"text-{chat}", (f"text-{chat}", "text"))
+        await dispatcher.join()
+        await dispatcher.stop()
+
+    asyncio.run(scenario())
+
+    # Ambos pools prefieren textos: los tres se atienden antes que los audios encolados
+    assert [lane for _, lane in recorder.started[:3]] == ["text"] * 3
+    assert len(recorder.finished) == 8
+
+
+def test_workers_de_texto_no_toman_audios():
+    recorder = Recorder()
+
+    async def scenario():
+        dispatcher = _lanes_dispatcher(recorder)
+        dispatcher.start()
+        for chat in range(4):
+            await dispatcher.submit(chat, (chat, "audio"))
+        await dispatcher.join()
+        stats = dispatcher.stats()
+        await dispatcher.stop()
+        return stats
+
+    stats = asyncio.run(scenario())
+
+    assert recorder.max_running == 1  # solo el pool de audio
+    assert stats["lanes"]["audio"]["processed"] == 4
+    assert stats["lanes"]["text"]["processed"] == 0
@@ -0,0 +1,23 @@
+import io
+import logging
+from src.utils.logger import create_handler
+
+
+def _prepared(handler, msg, *args):
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, None)
+    return handler.prepare(record)
+
+
+def test_args_mutables_se_formatean_con_su_estado_al_loguear():
+    handler, listener = create_handler(io.StringIO(), use_queue=True)
+    try:
+        state = {"pending": 1}
+        record = _prepared(handler, "Estado: %s, total %d", state, 3)
+        state["pending"] = 99
+        assert record.getMessage() == "Estado: {'pending': 1}, total 3"
+
+        # Los inmutables quedan para el listener
+        record = _prepared(handler, "Update %s del chat %s", 7, "-100")
+        assert record.args == (7, "-100")
+    finally:
+        listener.stop()
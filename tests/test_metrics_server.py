@@ -0,0 +1,52 @@
+import asyncio
+import socket
+import aiohttp
+from src.config.settings import settings
+from src.services.metrics_server import MetricsServer
+from src.utils.metrics import MetricsRegistry
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _registry() -> MetricsRegistry:
+    metrics = MetricsRegistry()
+    metrics.add_collector("test", lambda: {"value": 3})
+    return metrics
+
+
+def test_expone_las_metricas_en_localhost(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_HOST", "127.0.0.1")
+    port = _free_port()
+
+    async def scenario():
+        server = MetricsServer(port, _registry())
+        assert await server.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}{settings.METRICS_PATH}") as response:
+                    return response.status, await response.text()
+        finally:
+            await server.stop()
+
+    status, body = asyncio.run(scenario())
+    assert status == 200
+    assert "_test_value 3" in body
+
+
+def test_puerto_ocupado_no_interrumpe_el_bot(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_HOST", "127.0.0.1")
+
+    async def scenario():
+        with socket.socket() as taken:
+            taken.bind(("127.0.0.1", 0))
+            taken.listen()
+            server = MetricsServer(taken.getsockname()[1], _registry())
+            started = await server.start()
+            await server.stop()
+            return started
+
+    assert asyncio.run(scenario()) is False
@@ -0,0 +1,176 @@
+import asyncio
+import aiohttp
+import pytest
+from multidict import CIMultiDictProxy, CIMultiDict
+from yarl import URL
+from src.config.settings import settings
+from src.utils.resilience import AdaptiveLimiter, CircuitBreaker, CircuitOpenError, OverloadedError, ResilientBackend
+
+
+def _http_error(status: int) -> aiohttp.ClientResponseError:
+    url = URL("http://backend/query")
+    request_info = aiohttp.RequestInfo(url, "POST", CIMultiDictProxy(CIMultiDict()), url)
+    return aiohttp.ClientResponseError(request_info, (), status=status)
+
+
+def _call(backend: ResilientBackend, statuses):
+    """Llama al backend con una función que falla con cada status de la lista y después responde."""
+    attempts = []
+
+    async def request():
+        attempts.append(1)
+        if len(attempts) <= len(statuses):
+            raise _http_error(statuses[len(attempts) - 1])
+        return "ok"
+
+    try:
+        return asyncio.run(backend.call(request)), len(attempts)
+    except aiohttp.ClientResponseError as e:
+        return e.status, len(attempts)
+
+
+@pytest.fixture(autouse=True)
+def _sin_espera(monkeypatch):
+    monkeypatch.setattr(settings, "RETRY_BASE_DELAY", 0.001)
+
+
+@pytest.mark.parametrize("status", [502, 503, 504, 429])
+def test_backend_idempotente_reintenta_errores_de_gateway(status):
+    backend = ResilientBackend("test", timeout=5, retries=2, max_concurrency=4)
+    assert _call(backend, [status]) == ("ok", 2)
+
+
+@pytest.mark.parametrize("status", [502, 504])
+def test_backend_con_estado_no_reintenta_502_504(status):
+    backend = ResilientBackend("test", timeout=5, retries=2, max_concurrency=4, idempotent=False)
+    assert _call(backend, [status]) == (status, 1)
+
+
+@pytest.mark.parametrize("status", [503, 429])
+def test_backend_con_estado_reintenta_si_no_se_proceso(status):
+    backend = ResilientBackend("test", timeout=5, retries=2, max_concurrency=4, idempotent=False)
+    assert _call(backend, [status]) == ("ok", 2)
+
+
+def test_errores_de_cliente_no_se_reintentan():
+    backend = ResilientBackend("test", timeout=5, retries=2, max_concurrency=4)
+    assert _call(backend, [400]) == (400, 1)
+
+
+def test_breaker_se_abre_tras_fallas_seguidas_y_rechaza():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=60)
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_breaker_half_open_deja_pasar_una_prueba_y_se_cierra_si_sale_bien():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    breaker.allow()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # la prueba sigue en curso
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.allow()
+
+
+def test_breaker_half_open_se_reabre_si_la_prueba_falla():
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opens == 2
+
+
+def test_prueba_half_open_rechazada_por_el_limite_no_traba_el_breaker(monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(settings, "CIRCUIT_RECOVERY_TIMEOUT", 0)
+    monkeypatch.setattr(settings, "ADAPTIVE_QUEUE_TIMEOUT", 0.01)
+    backend = ResilientBackend("test", timeout=5, retries=0, max_concurrency=1)
+    backend.breaker.record_failure()
+
+    async def request():
+        return "ok"
+
+    async def scenario():
+        await backend.limiter.acquire()  # límite lleno: la llamada de prueba no consigue lugar
+        with pytest.raises(OverloadedError):
+            await backend.call(request)
+        await backend.limiter.release()
+        return await backend.call(request)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert backend.breaker.state == "closed"
+
+
+def test_prueba_half_open_cancelada_esperando_lugar_libera_el_breaker(monkeypatch):
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(settings, "CIRCUIT_RECOVERY_TIMEOUT", 0)
+    backend = ResilientBackend("test", timeout=5, retries=0, max_concurrency=1)
+    backend.breaker.record_failure()
+
+    async def request():
+        return "ok"
+
+    async def scenario():
+        await backend.limiter.acquire()
+        waiting = asyncio.create_task(backend.call(request))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        await backend.limiter.release()
+        return await backend.call(request)
+
+    assert asyncio.run(scenario()) == "ok"
+
+
+def test_limite_aimd_baja_con_fallas_y_lentitud_y_sube_con_respuestas_rapidas():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", max_limit=10, min_limit=2)
+        steps = []
+        await limiter.acquire()
+        await limiter.release(failed=True)
+        steps.append(limiter.limit)  # -30%
+        await limiter.acquire()
+        await limiter.release(latency=0.1)
+        steps.append(limiter.limit)  # rápida: +1/límite
+        await limiter.acquire()
+        await limiter.release(latency=1.0)
+        steps.append(limiter.limit)  # lenta (> base * tolerance): -10%
+        for _ in range(20):
+            await limiter.acquire()
+            await limiter.release(failed=True)
+        steps.append(limiter.limit)
+        return steps
+
+    failed, fast, slow, floor = asyncio.run(scenario())
+    assert failed == pytest.approx(7.0)
+    assert fast == pytest.approx(7.0 + 1 / 7.0)
+    assert slow == pytest.approx(fast * 0.9)
+    assert floor == 2
+
+
+def test_limite_aimd_rechaza_cuando_no_hay_lugar_a_tiempo():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", max_limit=1, queue_timeout=0.01)
+        await limiter.acquire()
+        with pytest.raises(OverloadedError):
+            await limiter.acquire()
+        await limiter.release()
+        await limiter.acquire()
+        return limiter.stats()
+
+    assert asyncio.run(scenario()) == {"limit": 1.0, "in_flight": 1, "shed": 1}
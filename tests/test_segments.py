@@ -0,0 +1,33 @@
+import pytest
+from src.config.settings import Settings
+from src.services.audio_preprocessor import segment_starts
+
+
+def test_segment_starts_cubre_el_audio_con_solapamiento():
+    assert segment_starts(150, 60, 2) == [0.0, 58.0, 116.0]
+    assert segment_starts(60, 60, 2) == [0.0]
+
+
+def test_segment_starts_rechaza_solapamiento_mayor_o_igual_al_segmento():
+    with pytest.raises(ValueError):
+        segment_starts(600, 60, 60)
+
+
+@pytest.fixture
+def _configurado(monkeypatch):
+    for var in ("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", "TRANSCRIPTION_API_URL", "QUERY_SYSTEM_URL"):
+        monkeypatch.setattr(Settings, var, "x")
+
+
+@pytest.mark.parametrize("seconds, overlap", [(60, 60), (60, 90), (0, 0), (-10, 2), (60, -1)])
+def test_validate_rechaza_segmentos_invalidos(_configurado, monkeypatch, seconds, overlap):
+    monkeypatch.setattr(Settings, "AUDIO_SEGMENT_SECONDS", seconds)
+    monkeypatch.setattr(Settings, "AUDIO_SEGMENT_OVERLAP", overlap)
+    with pytest.raises(ValueError, match="AUDIO_SEGMENT"):
+        Settings.validate()
+
+
+def test_validate_acepta_segmentos_validos(_configurado, monkeypatch):
+    monkeypatch.setattr(Settings, "AUDIO_SEGMENT_SECONDS", 60)
+    monkeypatch.setattr(Settings, "AUDIO_SEGMENT_OVERLAP", 0)
+    assert Settings.validate()
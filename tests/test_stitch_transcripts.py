@@ -0,0 +1,30 @@
+from src.services.transcription_service import stitch_transcripts
+
+
+def test_elimina_el_solapamiento_de_varias_palabras():
+    parts = ["hoy fuimos al parque con los chicos", "con los chicos y después a comer"]
+    assert stitch_transcripts(parts) == "hoy fuimos al parque con los chicos y después a comer"
+
+
+def test_solapamiento_de_una_palabra_al_final_del_segmento():
+    assert stitch_transcripts(["el perro corre. el", "el gato salta"]) == "el perro corre. el gato salta"
+
+
+def test_tolera_palabras_cortadas_en_el_borde():
+    # El corte partió una palabra en cada borde ("mañ" y "yer")
+    parts = ["vamos a ir al mercado mañ", "yer al mercado a comprar pan"]
+    assert stitch_transcripts(parts) == "vamos a ir al mercado a comprar pan"
+
+
+def test_ignora_mayusculas_y_puntuacion_al_comparar():
+    parts = ["y entonces dijo que sí,", "Que sí, que venía"]
+    assert stitch_transcripts(parts) == "y entonces dijo que sí, que venía"
+
+
+def test_sin_solapamiento_concatena():
+    assert stitch_transcripts(["primera parte", "segunda parte distinta"]) == "primera parte segunda parte distinta"
+
+
+def test_segmentos_vacios():
+    assert stitch_transcripts(["", "hola", "", "mundo"]) == "hola mundo"
+    assert stitch_transcripts([]) == ""
@@ -0,0 +1,141 @@
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from src.config.settings import settings
+from src.services.telegram_service import TelegramService
+from src.utils.http_client import HttpClient
+
+TOKEN = "123:TEST"
+
+
+class FakeBotApi:
+    """Bot API local: getUpdates con semántica de offset y sendMessage que registra los envíos."""
+
+    def __init__(self):
+        self.updates = []
+        self.offsets = []
+        self.sent = []
+
+    def add_text(self, update_id: int, chat_id: int, text: str):
+        self.updates.append({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id * 10,
+                "date": 1760000000,
+                "text": text,
+                "from": {"id": 7, "is_bot": False, "first_name": "David"},
+                "chat": {"id": chat_id, "type": "group"},
+            },
+        })
+
+    async def get_updates(self, request: web.Request) -> web.Response:
+        offset = request.query.get("offset")
+        self.offsets.append(int(offset) if offset else None)
+        if offset:
+            # Como Telegram: los updates anteriores al offset quedan confirmados y no vuelven
+            self.updates = [u for u in self.updates if u["update_id"] >= int(offset)]
+        if not self.updates:
+            await asyncio.sleep(0.02)
+        return web.json_response({"ok": True, "result": self.updates[:100]})
+
+    async def send_message(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        self.sent.append(payload)
+        return web.json_response({"ok": True, "result": {"message_id": 1000 + len(self.sent)}})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(f"/bot{TOKEN}/getUpdates", self.get_updates)
+        app.router.add_post(f"/bot{TOKEN}/sendMessage", self.send_message)
+        return app
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.submitted = []
+
+    async def submit(self, key, update):
+        self.submitted.append((key, update["update_id"]))
+
+    def stats(self):
+        return {}
+
+
+async def _with_service(api: FakeBotApi, scenario):
+    server = TestServer(api.app())
+    await server.start_server()
+    http_client = HttpClient()
+    settings.TELEGRAM_API_BASE_URL = str(server.make_url("")).rstrip("/")
+    service = TelegramService(http_client)
+    try:
+        return await scenario(service)
+    finally:
+        await service.delivery.close(drain_timeout=1)
+        await http_client.close()
+        await server.close()
+
+
+async def _wait_for(condition, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timeout esperando la condición"
+        await asyncio.sleep(0.01)
+
+
+def _configure(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)  # temp_audio/ se crea en el directorio actual
+    monkeypatch.setattr(settings, "TELEGRAM_BOT_TOKEN", TOKEN)
+    monkeypatch.setattr(settings, "TELEGRAM_API_BASE_URL", settings.TELEGRAM_API_BASE_URL)
+    monkeypatch.setattr(settings, "POLLING_MODE", "long")
+    monkeypatch.setattr(settings, "LONG_POLLING_TIMEOUT", 1)
+
+
+def test_polling_confirma_cada_batch_con_el_offset(monkeypatch, tmp_path):
+    _configure(monkeypatch, tmp_path)
+    api = FakeBotApi()
+    api.add_text(1, -100, "hola")
+    api.add_text(2, -200, "buenas")
+    api.add_text(3, -100, "¿seguís ahí?")
+    dispatcher = FakeDispatcher()
+
+    async def scenario(service: TelegramService):
+        polling = asyncio.create_task(service.start_polling(dispatcher))
+        try:
+            await _wait_for(lambda: len(dispatcher.submitted) == 3)
+            await _wait_for(lambda: 4 in api.offsets)
+            api.add_text(4, -200, "otro")
+            await _wait_for(lambda: len(dispatcher.submitted) == 4)
+            await _wait_for(lambda: 5 in api.offsets)
+        finally:
+            polling.cancel()
+            await asyncio.gather(polling, return_exceptions=True)
+        return service.last_update_id
+
+    last_update_id = asyncio.run(_with_service(api, scenario))
+
+    # Primer poll sin offset, después siempre el último update_id aceptado + 1
+    assert api.offsets[0] is None
+    assert [o for o in api.offsets if o is not None][0] == 4
+    assert sorted(set(o for o in api.offsets if o is not None)) == [4, 5]
+    # Cada update se encola una sola vez, en orden y con el chat como clave
+    assert dispatcher.submitted == [(-100, 1), (-200, 2), (-100, 3), (-200, 4)]
+    assert last_update_id == 4
+
+
+def test_send_message_responde_al_mensaje_y_divide_textos_largos(monkeypatch, tmp_path):
+    _configure(monkeypatch, tmp_path)
+    api = FakeBotApi()
+    long_answer = "palabra " * 1000
+
+    async def scenario(service: TelegramService):
+        short = await service.send_message("respuesta", reply_to_message_id=10, chat_id=-100)
+        long = await service.send_message(long_answer, reply_to_message_id=20, chat_id=-100)
+        return short, long
+
+    assert asyncio.run(_with_service(api, scenario)) == (True, True)
+    assert api.sent[0] == {"chat_id": -100, "text": "respuesta", "reply_to_message_id": 10}
+    parts = api.sent[1:]
+    assert len(parts) == 2
+    assert parts[0]["reply_to_message_id"] == 20 and "reply_to_message_id" not in parts[1]
+    assert all(len(part["text"]) <= 4096 for part in parts)
+    assert " ".join(part["text"] for part in parts).split() == long_answer.split()
@@ -0,0 +1,63 @@
+import asyncio
+from src.repositories.update_store import UpdateStore
+
+
+def _update(update_id):
+    return {"update_id": update_id, "message": {"message_id": update_id, "text": "hola"}}
+
+
+def test_accept_concurrente_del_mismo_update_lo_entrega_una_sola_vez(tmp_path):
+    async def scenario():
+        store = UpdateStore(str(tmp_path / "updates.db"))
+        try:
+            results = await asyncio.gather(*(store.accept([_update(7)]) for _ in range(8)))
+            return [len(fresh) for fresh in results], store.duplicates, store.get_offset()
+        finally:
+            await store.close()
+
+    accepted, duplicates, offset = asyncio.run(scenario())
+
+    assert sum(accepted) == 1
+    assert duplicates == 7
+    assert offset == 7
+
+
+def test_accept_descarta_pendientes_y_procesados(tmp_path):
+    async def scenario():
+        store = UpdateStore(str(tmp_path / "updates.db"))
+        try:
+            first = await store.accept([_update(1), _update(2)])
+            store.mark_processed(1)
+            before_flush = await store.accept([_update(1), _update(2), _update(3)])
+            await store.flush()
+            after_flush = await store.accept([_update(1), _update(3), _update(4)])
+            pending = [u["update_id"] for u in store.get_pending()]
+            return first, before_flush, after_flush, pending
+        finally:
+            await store.close()
+
+    first, before_flush, after_flush, pending = asyncio.run(scenario())
+
+    assert [u["update_id"] for u in first] == [1, 2]
+    assert [u["update_id"] for u in before_flush] == [3]
+    assert [u["update_id"] for u in after_flush] == [4]
+    assert sorted(pending) == [2, 3, 4]
+
+
+def test_offset_se_conserva_entre_reinicios_y_stats_no_lee_la_base(tmp_path):
+    path = str(tmp_path / "updates.db")
+
+    async def accept(updates):
+        store = UpdateStore(path)
+        try:
+            await store.accept(updates)
+            return store.get_offset(), store.stats()["offset"]
+        finally:
+            await store.close()
+
+    assert asyncio.run(accept([_update(5), _update(9)])) == (9, 9)
+    assert asyncio.run(accept([_update(3)])) == (9, 9)  # el offset nunca retrocede
+
+    store = UpdateStore(path)
+    store._db.close()  # stats() ya no puede tocar la base
+    assert store.stats()["offset"] == 9
@@ -0,0 +1,35 @@
+import asyncio
+from src.repositories.user_repository import UserRepository
+
+
+def test_sync_allowed_deshabilita_los_ids_que_ya_no_estan_en_la_configuracion(tmp_path):
+    repo = UserRepository(str(tmp_path / "users.db"))
+    try:
+        repo.sync_allowed([1, 2], [-100])
+        repo.set_user_allowed(3)  # habilitado en tiempo de ejecución
+        assert asyncio.run(repo.is_allowed(2, -999))
+
+        revoked = repo.sync_allowed([1], [])
+
+        assert revoked == {"users": 2, "chats": 1}
+        assert asyncio.run(repo.is_allowed(1, -999))
+        assert not asyncio.run(repo.is_allowed(2, -999))
+        assert not asyncio.run(repo.is_allowed(3, -999))
+        assert not asyncio.run(repo.is_allowed(4, -100))
+    finally:
+        repo.close()
+
+
+def test_sync_allowed_persiste_entre_reinicios(tmp_path):
+    path = str(tmp_path / "users.db")
+    repo = UserRepository(path)
+    repo.sync_allowed([1, 2], [])
+    repo.close()
+
+    repo = UserRepository(path)
+    try:
+        repo.sync_allowed([2], [])
+        assert not asyncio.run(repo.is_allowed(1, -1))
+        assert asyncio.run(repo.is_allowed(2, -1))
+    finally:
+        repo.close()
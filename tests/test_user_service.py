@@ -0,0 +1,47 @@
+import asyncio
+from src.config.settings import settings
+from src.services.user_service import UserService
+
+
+def test_batches_en_curso_se_retienen_y_close_los_espera(monkeypatch):
+    monkeypatch.setattr(settings, "USER_BATCH_WINDOW", 10)  # solo se envía al cerrar
+    monkeypatch.setattr(settings, "USER_SYSTEM_BATCH_ENABLED", False)
+    service = UserService()
+    fetched = []
+
+    async def fetch_each(ids):
+        await asyncio.sleep(0.01)
+        fetched.extend(ids)
+        return {user_id: {"id": user_id} for user_id in ids}
+
+    service._fetch_each = fetch_each
+
+    async def scenario():
+        lookups = asyncio.gather(*(service.get_user_info_from_message(user_id) for user_id in (1, 2)))
+        await asyncio.sleep(0)
+        service._flush()
+        in_flight = len(service._batch_tasks)
+        await service.close()
+        return in_flight, await lookups
+
+    in_flight, results = asyncio.run(scenario())
+    assert in_flight == 1
+    assert results == [{"id": "1"}, {"id": "2"}]
+    assert fetched == ["1", "2"]
+    assert service._batch_tasks == set()
+
+
+def test_close_cancela_los_batches_que_no_terminan_a_tiempo(monkeypatch):
+    service = UserService()
+
+    async def fetch_each(ids):
+        await asyncio.sleep(10)
+
+    service._fetch_each = fetch_each
+
+    async def scenario():
+        service._enqueue("1")
+        await service.close(drain_timeout=0.01)
+        return service._batch_tasks
+
+    assert asyncio.run(scenario()) == set()
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+from aiohttp.test_utils import TestClient, TestServer
+from src.config.settings import settings
+from src.repositories.update_store import UpdateStore
+from src.services.telegram_service import TelegramService
+from src.services.webhook_server import SECRET_TOKEN_HEADER, WebhookServer
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "webhook_updates.json")
+
+
+def _recorded_updates():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.submitted = []
+
+    async def submit(self, key, update):
+        self.submitted.append((key, update["update_id"]))
+
+
+async def _replay(server: WebhookServer, updates, headers=None):
+    """POSTea los updates al webhook y espera a que lleguen al dispatcher."""
+    client = TestClient(TestServer(server.build_app()))
+    await client.start_server()
+    consumer = asyncio.create_task(server._consume())
+    try:
+        statuses = []
+        for update in updates:
+            response = await client.post(settings.WEBHOOK_PATH, json=update, headers=headers or {})
+            statuses.append(response.status)
+        while not server._queue.empty():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        return statuses
+    finally:
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        await client.close()
+
+
+def test_updates_grabados_llegan_al_dispatcher_en_orden(monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET_TOKEN", "")
+    dispatcher = FakeDispatcher()
+    server = WebhookServer(dispatcher, TelegramService.chat_key)
+    updates = _recorded_updates()
+
+    statuses = asyncio.run(_replay(server, updates))
+
+    assert statuses == [200] * len(updates)
+    assert dispatcher.submitted == [(-100, 501), (-100, 502), (22, 503), (-100, 504)]
+    assert server.received == len(updates)
+
+
+def test_secret_token_invalido_se_rechaza(monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET_TOKEN", "secreto")
+    dispatcher = FakeDispatcher()
+    updates = _recorded_updates()[:1]
+
+    # Un servidor por asyncio.run: su cola interna queda ligada al event loop
+    rejected = WebhookServer(dispatcher, TelegramService.chat_key)
+    assert asyncio.run(_replay(rejected, updates, {SECRET_TOKEN_HEADER: "otro"})) == [403]
+    accepted = WebhookServer(dispatcher, TelegramService.chat_key)
+    assert asyncio.run(_replay(accepted, updates, {SECRET_TOKEN_HEADER: "secreto"})) == [200]
+    assert dispatcher.submitted == [(-100, 501)]
+
+
+def test_reentregas_se_confirman_sin_reencolar(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET_TOKEN", "")
+    dispatcher = FakeDispatcher()
+    store = UpdateStore(str(tmp_path / "updates.db"))
+    server = WebhookServer(dispatcher, TelegramService.chat_key, update_store=store)
+    updates = _recorded_updates()
+
+    statuses = asyncio.run(_replay(server, updates + updates[:2]))
+
+    assert statuses == [200] * (len(updates) + 2)
+    assert [update_id for _, update_id in dispatcher.submitted] == [501, 502, 503, 504]
+    assert store.duplicates == 2
+    asyncio.run(store.close())
+
+
+def test_request_invalido_responde_400(monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET_TOKEN", "")
+    server = WebhookServer(FakeDispatcher(), TelegramService.chat_key)
+
+    assert asyncio.run(_replay(server, [{"message": {}}])) == [400]
+
+
+def test_secret_token_faltante_se_rechaza(monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET_TOKEN", "secreto")
+    server = WebhookServer(FakeDispatcher(), TelegramService.chat_key)
+
+    assert asyncio.run(_replay(server, _recorded_updates()[:1])) == [403]
+
+
+def test_error_con_un_update_no_abandona_el_resto_del_batch(monkeypatch):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET_TOKEN", "")
+
+    class FlakyDispatcher(FakeDispatcher):
+        async def submit(self, key, update):
+            if update["update_id"] == 502:
+                raise RuntimeError("cola cerrada")
+            await super().submit(key, update)
+
+    dispatcher = FlakyDispatcher()
+
+    async def scenario():
+        server = WebhookServer(dispatcher, TelegramService.chat_key)
+        for update in _recorded_updates():
+            server._queue.put_nowait(update)  # llegan juntos: un solo batch
+        consumer = asyncio.create_task(server._consume())
+        while not server._queue.empty():
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert [update_id for _, update_id in dispatcher.submitted] == [501, 503, 504]